@@ -5,32 +5,37 @@ import sys
 import os
 import json
 import re
+import time
+import logging
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from functools import partial
+from typing import List, Dict, Optional, Tuple, Callable
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QFileDialog, QLineEdit,
     QVBoxLayout, QHBoxLayout, QGridLayout, QComboBox, QMessageBox,
     QProgressBar, QGroupBox, QCheckBox, QSpinBox, QDialog, QScrollArea
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QObject, pyqtSignal
 
-from wb_fill import FillParams, fill_wb_template
+from wb_fill import (
+    APP_NAME, FillParams, FillCancelled, RunContext, app_data_dir, fill_wb_template, audit_outputs,
+    log_event, dump_metrics,
+)
 
 
-APP_NAME = "Sunglasses SEO PRO"
+# row caps of the run spinner: a styled xlsx run holds the whole workbook in
+# memory, streaming runs (low-memory, csv/jsonl/parquet) do not
+ROWS_CAP_STYLED = 1000
+ROWS_CAP_STREAMING = 10_000_000
+# files are written one at a time and the generation state is bounded, so
+# the file count does not change peak memory in either mode
+FILES_CAP = 10_000
 
 
 # -------------------------------
 # DATA DIR + SETTINGS
 # -------------------------------
-def app_data_dir() -> Path:
-    base = Path(os.getenv("APPDATA", str(Path.home())))
-    p = base / APP_NAME / "data"
-    p.mkdir(parents=True, exist_ok=True)
-    return p
-
-
 def settings_path() -> Path:
     base = Path(os.getenv("APPDATA", str(Path.home())))
     p = base / APP_NAME
@@ -265,24 +270,176 @@ def make_stylesheet(theme_name: str) -> str:
 # -------------------------------
 # Worker thread
 # -------------------------------
+Job = Callable[[RunContext], Tuple[List[str], int, str]]
+
+
 class Worker(QThread):
     progress = pyqtSignal(int)
     done = pyqtSignal(list, int, str)
     fail = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, params: FillParams):
+    def __init__(self, job: Job, title: str = ""):
         super().__init__()
-        self.params = params
+        self.job = job
+        self.title = title
 
     def run(self):
+        def cb(p: int):
+            self.progress.emit(int(p))
+        ctx = RunContext(progress_callback=cb, cancel_check=self.isInterruptionRequested)
+        t0 = time.monotonic()
+        log_event("job_start", run_id=ctx.run_id, job=self.title)
         try:
-            def cb(p: int):
-                self.progress.emit(int(p))
-            self.params.progress_callback = cb
-            outs, total, rep = fill_wb_template(self.params)
+            outs, total, rep = self.job(ctx)
+            log_event("job_end", run_id=ctx.run_id, job=self.title, status="done",
+                      seconds=round(time.monotonic() - t0, 3), files=len(outs), rows=total)
             self.done.emit(outs, total, rep)
+        except FillCancelled:
+            log_event("job_end", run_id=ctx.run_id, job=self.title, status="cancelled",
+                      seconds=round(time.monotonic() - t0, 3))
+            self.cancelled.emit()
         except Exception as e:
+            log_event("job_end", logging.ERROR, exc_info=True, run_id=ctx.run_id, job=self.title,
+                      status="failed", seconds=round(time.monotonic() - t0, 3), error=str(e))
             self.fail.emit(str(e))
+        finally:
+            try:
+                dump_metrics()
+            except Exception:
+                pass
+
+
+# -------------------------------
+# Job queue
+# -------------------------------
+class JobWidget(QGroupBox):
+    cancel_requested = pyqtSignal()
+
+    def __init__(self, title: str, parent=None):
+        super().__init__(parent)
+        self.started_at = 0.0
+
+        lay = QHBoxLayout(self)
+        lay.setContentsMargins(10, 8, 10, 8)
+        lay.setSpacing(10)
+
+        self.lb_title = QLabel(title)
+        lay.addWidget(self.lb_title, 2)
+
+        self.progress = QProgressBar()
+        self.progress.setValue(0)
+        lay.addWidget(self.progress, 3)
+
+        self.lb_status = QLabel("В очереди")
+        self.lb_status.setObjectName("Muted")
+        lay.addWidget(self.lb_status, 2)
+
+        self.btn_cancel = QPushButton("Отмена")
+        self.btn_cancel.clicked.connect(self.cancel_requested.emit)
+        lay.addWidget(self.btn_cancel, 0)
+
+    def _elapsed(self) -> float:
+        return time.monotonic() - self.started_at if self.started_at else 0.0
+
+    def set_running(self):
+        self.started_at = time.monotonic()
+        self.lb_status.setText("Работает…")
+
+    def set_done(self, outs: list, total: int):
+        self.progress.setValue(100)
+        secs = self._elapsed()
+        rate = total / secs if secs > 0 else 0.0
+        self.lb_status.setText(f"Готово ✅ файлов: {len(outs)}, строк: {total}, {secs:.1f} с ({rate:.0f} стр/с)")
+        self.lb_status.setToolTip("\n".join(outs))
+        self.btn_cancel.setEnabled(False)
+
+    def set_failed(self, err: str):
+        short = err if len(err) <= 80 else err[:80] + "…"
+        self.lb_status.setText(f"Ошибка ❌ ({self._elapsed():.1f} с): {short}")
+        self.lb_status.setToolTip(err)
+        self.btn_cancel.setEnabled(False)
+
+    def set_cancelled(self):
+        self.lb_status.setText(f"Отменено ({self._elapsed():.1f} с)")
+        self.btn_cancel.setEnabled(False)
+
+
+class JobQueue(QObject):
+    """Runs queued jobs on up to `max_workers` threads; jobs with the same `key` never overlap."""
+    changed = pyqtSignal()
+
+    def __init__(self, max_workers: int = 2, parent=None):
+        super().__init__(parent)
+        self.max_workers = max(1, int(max_workers))
+        self.pending: List[Tuple[Job, JobWidget, str]] = []
+        self.running: Dict[Worker, Tuple[JobWidget, str]] = {}
+
+    def submit(self, job: Job, widget: JobWidget, key: str = ""):
+        widget.cancel_requested.connect(lambda w=widget: self.cancel(w))
+        self.pending.append((job, widget, key))
+        self._pump()
+
+    def set_max_workers(self, n: int):
+        self.max_workers = max(1, int(n))
+        self._pump()
+
+    def cancel(self, widget: JobWidget):
+        for i, (_, w, _) in enumerate(self.pending):
+            if w is widget:
+                self.pending.pop(i)
+                widget.set_cancelled()
+                self.changed.emit()
+                return
+        for worker, (w, _) in self.running.items():
+            if w is widget:
+                worker.requestInterruption()
+                widget.lb_status.setText("Отмена…")
+                return
+
+    def active_count(self) -> int:
+        return len(self.pending) + len(self.running)
+
+    def shutdown(self):
+        """Drops pending jobs, cancels running ones and waits for their threads."""
+        for _, widget, _ in self.pending:
+            widget.set_cancelled()
+        self.pending.clear()
+        workers = list(self.running)
+        for worker in workers:
+            worker.requestInterruption()
+        for worker in workers:
+            worker.wait()
+
+    def _pump(self):
+        busy = {key for _, key in self.running.values() if key}
+        i = 0
+        while i < len(self.pending) and len(self.running) < self.max_workers:
+            job, widget, key = self.pending[i]
+            if key in busy:
+                # same template and output folder as a running job: keep the queue order, wait
+                widget.lb_status.setText("Ждёт задачу с тем же шаблоном и папкой")
+                i += 1
+                continue
+            self.pending.pop(i)
+            if key:
+                busy.add(key)
+            worker = Worker(job, widget.lb_title.text())
+            worker.progress.connect(widget.progress.setValue)
+            worker.progress.connect(lambda _p: self.changed.emit())
+            worker.done.connect(widget.set_done)
+            worker.fail.connect(widget.set_failed)
+            worker.cancelled.connect(widget.set_cancelled)
+            worker.finished.connect(lambda w=worker: self._finished(w))
+            self.running[worker] = (widget, key)
+            widget.set_running()
+            worker.start()
+        self.changed.emit()
+
+    def _finished(self, worker: Worker):
+        self.running.pop(worker, None)
+        worker.deleteLater()
+        self._pump()
 
 
 # -------------------------------
@@ -371,8 +528,12 @@ class App(QWidget):
 
         self.settings = load_settings()
 
+        self.queue = JobQueue(int(self.settings.get("workers", 2)), self)
+        self.session_jobs: List[JobWidget] = []
+
         self._build_ui()
         self._restore_settings()
+        self.queue.changed.connect(self._update_total_progress)
 
         # window sizing – prevent “tiny UI”
         self.setMinimumSize(980, 680)
@@ -530,13 +691,14 @@ class App(QWidget):
         # Rows to fill + batch count
         gl.addWidget(QLabel("Строк заполнять"), row, 0)
         self.spin_rows = QSpinBox()
-        self.spin_rows.setRange(1, 1000)
-        self.spin_rows.setValue(6)
+        self.spin_rows.setRange(0, ROWS_CAP_STYLED)
+        self.spin_rows.setSpecialValueText("Все товары")  # 0 => auto-detect product rows
+        self.spin_rows.setValue(0)
         gl.addWidget(self.spin_rows, row, 1)
 
         gl.addWidget(QLabel("Сколько Excel файлов"), row, 2)
         self.spin_batch = QSpinBox()
-        self.spin_batch.setRange(1, 50)
+        self.spin_batch.setRange(1, FILES_CAP)
         self.spin_batch.setValue(1)
         gl.addWidget(self.spin_batch, row, 3)
 
@@ -553,6 +715,19 @@ class App(QWidget):
         self.spin_skip.setRange(0, 50)
         self.spin_skip.setValue(4)
         gl.addWidget(self.spin_skip, row, 1)
+
+        gl.addWidget(QLabel("Seed"), row, 2)
+        self.spin_seed = QSpinBox()
+        self.spin_seed.setRange(0, 2_000_000_000)
+        self.spin_seed.setSpecialValueText("случайный")  # 0 => new texts every run
+        self.spin_seed.setValue(0)
+        gl.addWidget(self.spin_seed, row, 3)
+
+        gl.addWidget(QLabel("Архив"), row, 4)
+        self.cmb_archive = QComboBox()
+        self.cmb_archive.addItems(["нет", "zip", "tar"])
+        self.cmb_archive.setToolTip("Все файлы пачки и отчёт — сразу в один архив")
+        gl.addWidget(self.cmb_archive, row, 5)
         row += 1
 
         # WB modes
@@ -564,14 +739,68 @@ class App(QWidget):
         gl.addWidget(self.chk_strict, row, 3, 1, 3)
         row += 1
 
+        self.chk_low_mem = QCheckBox("Экономия памяти (большие шаблоны, без форматирования)")
+        self.chk_incremental = QCheckBox("Только новые/изменённые строки")
+        gl.addWidget(self.chk_low_mem, row, 0, 1, 3)
+        gl.addWidget(self.chk_incremental, row, 3, 1, 2)
+
+        self.cmb_format = QComboBox()
+        self.cmb_format.addItems(["xlsx", "csv", "jsonl", "parquet"])
+        gl.addWidget(self.cmb_format, row, 5)
+        self.chk_low_mem.toggled.connect(self._apply_caps)
+        self.cmb_format.currentTextChanged.connect(self._apply_caps)
+        row += 1
+
+        gl.addWidget(QLabel("Делить файл по, строк"), row, 0)
+        self.spin_split = QSpinBox()
+        self.spin_split.setRange(0, 1_000_000)
+        self.spin_split.setSingleStep(1000)
+        self.spin_split.setSpecialValueText("не делить")  # 0 => one output per batch file
+        self.spin_split.setValue(0)
+        gl.addWidget(self.spin_split, row, 1)
+        row += 1
+
         root.addWidget(form)
 
+        # Job queue card
+        jobs = QGroupBox("Очередь")
+        jl = QVBoxLayout(jobs)
+        jl.setContentsMargins(10, 18, 10, 10)
+        scroll = QScrollArea()
+        scroll.setWidgetResizable(True)
+        scroll.setMinimumHeight(120)
+        holder = QWidget()
+        self.jobs_layout = QVBoxLayout(holder)
+        self.jobs_layout.setContentsMargins(0, 0, 0, 0)
+        self.jobs_layout.setSpacing(6)
+        self.jobs_layout.addStretch(1)
+        scroll.setWidget(holder)
+        jl.addWidget(scroll)
+        jrow = QHBoxLayout()
+        self.btn_audit = QPushButton("🔎 Аудит уникальности")
+        self.btn_audit.setToolTip("Поиск похожих наименований и описаний в готовых файлах")
+        self.btn_audit.clicked.connect(self._run_audit)
+        jrow.addWidget(self.btn_audit, 0)
+        jrow.addStretch(1)
+        self.btn_clear_jobs = QPushButton("Убрать завершённые")
+        self.btn_clear_jobs.clicked.connect(self._clear_finished_jobs)
+        jrow.addWidget(self.btn_clear_jobs, 0)
+        jl.addLayout(jrow)
+        root.addWidget(jobs, 1)
+
         # Footer progress + generate
         foot = QGroupBox()
         fl = QHBoxLayout(foot)
         fl.setContentsMargins(14, 12, 14, 12)
         fl.setSpacing(10)
 
+        fl.addWidget(QLabel("Потоков"), 0)
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, 8)
+        self.spin_workers.setValue(2)
+        self.spin_workers.valueChanged.connect(self._set_workers)
+        fl.addWidget(self.spin_workers, 0)
+
         self.progress = QProgressBar()
         self.progress.setValue(0)
         fl.addWidget(self.progress, 1)
@@ -735,32 +964,68 @@ class App(QWidget):
             batch_count=int(self.spin_batch.value()),
 
             uniqueness=int(self.spin_uni.value()),
+            low_memory=self.chk_low_mem.isChecked(),
+            incremental=self.chk_incremental.isChecked(),
+            output_format=self.cmb_format.currentText().strip(),
+            seed=int(self.spin_seed.value()),
+            archive="" if self.cmb_archive.currentIndex() == 0 else self.cmb_archive.currentText(),
+            max_rows_per_file=int(self.spin_split.value()),
         )
 
         # persist quick
         self._persist_current()
 
-        # UI lock
-        self.btn_go.setEnabled(False)
-        self.progress.setValue(0)
-
-        self.worker = Worker(params)
-        self.worker.progress.connect(self.progress.setValue)
-        self.worker.done.connect(self._on_done)
-        self.worker.fail.connect(self._on_fail)
-        self.worker.start()
-
-    def _on_done(self, outs: list, total: int, report: str):
-        self.btn_go.setEnabled(True)
-        self.progress.setValue(100)
+        # enqueue (UI stays free for the next template)
+        # outputs, checkpoint and fill index are named after the template in the output folder
+        key = f"{Path(out_dir).resolve()}|{Path(self.xlsx_path).stem.lower()}"
+        self._enqueue(f"{Path(self.xlsx_path).name} · {brand_lat}", partial(fill_wb_template, params), key)
 
-        msg = f"Готово ✅\n\nФайлов: {len(outs)}\nСтрок заполнено: {total}\n\n"
-        msg += "Выход:\n" + "\n".join(outs[:8]) + ("\n..." if len(outs) > 8 else "")
-        QMessageBox.information(self, "Готово", msg)
+    def _run_audit(self):
+        start = self.ed_out.text().strip() or str(Path.home())
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "Файлы для аудита", start, "Результаты (*.xlsx *.csv *.jsonl)"
+        )
+        if not files:
+            return
+        self._enqueue(f"Аудит · файлов: {len(files)}", lambda ctx, f=files: audit_outputs(f, ctx=ctx))
+
+    def _enqueue(self, title: str, job: Job, key: str = ""):
+        if self.queue.active_count() == 0:
+            self.session_jobs = []
+        widget = JobWidget(title)
+        self.session_jobs.append(widget)
+        self.jobs_layout.insertWidget(self.jobs_layout.count() - 1, widget)
+        self.queue.submit(job, widget, key)
+
+    def _update_total_progress(self):
+        if not self.session_jobs:
+            self.progress.setValue(0)
+            return
+        vals = [j.progress.value() for j in self.session_jobs if j.btn_cancel.isEnabled() or j.progress.value() == 100]
+        self.progress.setValue(int(sum(vals) / len(vals)) if vals else 100)
+
+    def _clear_finished_jobs(self):
+        for i in reversed(range(self.jobs_layout.count() - 1)):
+            w = self.jobs_layout.itemAt(i).widget()
+            if isinstance(w, JobWidget) and not w.btn_cancel.isEnabled():
+                self.jobs_layout.removeWidget(w)
+                w.deleteLater()
+                if w in self.session_jobs:
+                    self.session_jobs.remove(w)
+
+    def _set_workers(self, n: int):
+        self.queue.set_max_workers(n)
+        self.settings["workers"] = int(n)
+        save_settings(self.settings)
 
-    def _on_fail(self, err: str):
-        self.btn_go.setEnabled(True)
-        QMessageBox.critical(self, "Ошибка", err)
+    def closeEvent(self, event):
+        # cancel and join the worker threads: a job killed mid-save leaves broken outputs behind
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.queue.shutdown()
+        finally:
+            QApplication.restoreOverrideCursor()
+        super().closeEvent(event)
 
     # ---------- Persist / Restore ----------
     def _persist_current(self):
@@ -774,15 +1039,26 @@ class App(QWidget):
         self.settings["seo"] = self.cmb_seo.currentText().strip()
         self.settings["style"] = self.cmb_style.currentText().strip()
         self.settings["brand_ratio"] = self.cmb_brand_ratio.currentText().strip()
+        self.settings["output_format"] = self.cmb_format.currentText().strip()
+        self.settings["archive"] = self.cmb_archive.currentText().strip()
         self.settings["rows"] = int(self.spin_rows.value())
         self.settings["batch"] = int(self.spin_batch.value())
         self.settings["skip"] = int(self.spin_skip.value())
+        self.settings["seed"] = int(self.spin_seed.value())
+        self.settings["split_rows"] = int(self.spin_split.value())
         self.settings["uni"] = int(self.spin_uni.value())
         self.settings["safe"] = bool(self.chk_safe.isChecked())
         self.settings["strict"] = bool(self.chk_strict.isChecked())
+        self.settings["low_memory"] = bool(self.chk_low_mem.isChecked())
+        self.settings["incremental"] = bool(self.chk_incremental.isChecked())
         self.settings["holidays_multi"] = self.selected_holidays
         save_settings(self.settings)
 
+    def _apply_caps(self, *_):
+        streaming = self.chk_low_mem.isChecked() or self.cmb_format.currentText().strip() != "xlsx"
+        # QSpinBox clamps the current value to the new maximum
+        self.spin_rows.setMaximum(ROWS_CAP_STREAMING if streaming else ROWS_CAP_STYLED)
+
     def _restore_settings(self):
         # theme first
         theme = self.settings.get("theme", "Graphite")
@@ -807,14 +1083,21 @@ class App(QWidget):
         set_combo(self.cmb_seo, "seo")
         set_combo(self.cmb_style, "style")
         set_combo(self.cmb_brand_ratio, "brand_ratio")
+        set_combo(self.cmb_format, "output_format")
+        set_combo(self.cmb_archive, "archive")
 
-        self.spin_rows.setValue(int(self.settings.get("rows", 6)))
+        self.chk_low_mem.setChecked(bool(self.settings.get("low_memory", False)))  # sets the caps first
+        self.spin_rows.setValue(int(self.settings.get("rows", 0)))
         self.spin_batch.setValue(int(self.settings.get("batch", 1)))
         self.spin_skip.setValue(int(self.settings.get("skip", 4)))
+        self.spin_seed.setValue(int(self.settings.get("seed", 0)))
+        self.spin_split.setValue(int(self.settings.get("split_rows", 0)))
+        self.spin_workers.setValue(int(self.settings.get("workers", 2)))
         self.spin_uni.setValue(int(self.settings.get("uni", 92)))
 
         self.chk_safe.setChecked(bool(self.settings.get("safe", True)))
         self.chk_strict.setChecked(bool(self.settings.get("strict", True)))
+        self.chk_incremental.setChecked(bool(self.settings.get("incremental", False)))
 
         saved_h = self.settings.get("holidays_multi", [])
         if isinstance(saved_h, list):
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from wb_fill import FillParams  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def appdata(tmp_path, monkeypatch):
+    # phrase bank, keywords, caches and logs go to a throwaway folder
+    p = tmp_path / "appdata"
+    monkeypatch.setenv("APPDATA", str(p))
+    return p
+
+
+@pytest.fixture
+def make_template(tmp_path):
+    def make(rows: int, name: str = "tpl.xlsx") -> Path:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(["Шаблон для загрузки товаров"])
+        ws.append(["Артикул продавца", "Бренд", "Наименование", "Описание"])
+        for i in range(rows):
+            ws.append([f"ART{i:06d}", "Dior", None, None])
+        path = tmp_path / name
+        wb.save(path)
+        return path
+    return make
+
+
+@pytest.fixture
+def make_params():
+    # one template job with fixed text inputs; tests override what they exercise
+    def make(tpl: Path, out: Path, **kw) -> FillParams:
+        base = dict(
+            xlsx_path=str(tpl), output_dir=str(out), brand_lat="Dior", brand_ru="Диор",
+            shape="Кошачий глаз", lenses="Поляризационные", collection="Весна–Лето 2026",
+            holidays="8 Марта", holiday_pos="middle", seo_level="normal", style="neutral",
+            wb_safe_mode=True, wb_strict=True, brand_in_title_ratio="50/50",
+            rows_to_fill=0, skip_first_rows=0, batch_count=1, seed=5,
+        )
+        base.update(kw)
+        return FillParams(**base)
+    return make
@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+from wb_fill import SINK_FIELDS, fill_wb_template
+
+
+def _members(path):
+    # name -> bytes, in archive order
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path) as zf:
+            return {n: zf.read(n) for n in zf.namelist()}
+    with tarfile.open(path) as tf:
+        return {m.name: tf.extractfile(m).read() for m in tf.getmembers()}
+
+
+def _rows(name, data):
+    # (article, title, description) per filled row of one member
+    if name.endswith(".xlsx"):
+        ws = load_workbook(io.BytesIO(data)).active
+        return [(r[0], r[2], r[3]) for r in ws.iter_rows(min_row=3, values_only=True)]
+    if name.endswith(".csv"):
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig")), delimiter=";"))
+        assert rows[0] == SINK_FIELDS
+        return [(r[1], r[2], r[3]) for r in rows[1:]]
+    recs = [json.loads(ln) for ln in data.decode("utf-8").splitlines()]
+    return [(r["article"], r["title"], r["description"]) for r in recs]
+
+
+@pytest.mark.parametrize("kind", ["zip", "tar"])
+@pytest.mark.parametrize("fmt", ["xlsx", "csv", "jsonl"])
+@pytest.mark.parametrize("split", [0, 4])
+def test_archive_holds_every_output_and_the_report(tmp_path, make_template, make_params, kind, fmt, split):
+    out = tmp_path / "out"
+    params = make_params(make_template(6), out, batch_count=2, archive=kind, output_format=fmt, max_rows_per_file=split)
+    outputs, total, rep = fill_wb_template(params)
+
+    assert outputs == [str(out / f"tpl_batch.{kind}")]
+    assert [p.name for p in out.iterdir()] == [f"tpl_batch.{kind}"]
+    assert total == 12
+
+    members = _members(out / f"tpl_batch.{kind}")
+    if split:
+        files = [f"tpl_{i:02d}_part{p:02d}.{fmt}" for i in (1, 2) for p in (1, 2)]
+    else:
+        files = [f"tpl_{i:02d}.{fmt}" for i in (1, 2)]
+    assert list(members) == files + ["report.json"]
+    report = json.loads(members["report.json"])
+    assert report == json.loads(rep)
+    assert report["outputs"] == files
+
+    rows = [row for name in files for row in _rows(name, members[name])]
+    articles = [f"ART{i:06d}" for i in range(6)]
+    assert [r[0] for r in rows] == articles * 2
+    assert all(r[1] and r[2] for r in rows)
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from wb_fill import FillCancelled, RunContext, fill_many_async, fill_wb_template_async
+
+
+def test_cancelled_job_returns_its_write_slots(tmp_path, make_template, make_params):
+    params = make_params(make_template(20), tmp_path / "out", batch_count=3)
+    calls = []
+    # cancels at the top of file 2, while file 1's save task has not started yet
+    ctx = RunContext(cancel_check=lambda: calls.append(1) or len(calls) >= 2)
+
+    async def run():
+        writes = asyncio.Semaphore(2)
+        with pytest.raises(FillCancelled):
+            await fill_wb_template_async(params, ctx, writes=writes)
+        for _ in range(2):
+            await asyncio.wait_for(writes.acquire(), timeout=1)
+
+    asyncio.run(run())
+
+
+def test_failed_job_cancels_its_siblings(tmp_path, make_template, make_params):
+    out = tmp_path / "out"
+    good = make_params(make_template(200), out, batch_count=20)
+    bad = make_params(tmp_path / "missing.xlsx", out)
+
+    async def run():
+        with pytest.raises(FileNotFoundError):
+            await fill_many_async([good, bad])
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(run())
+    assert len(list(out.glob("*.xlsx"))) < 20
@@ -0,0 +1,101 @@
+import json
+import random
+import time
+
+import pytest
+
+from wb_fill import AUDIT_THRESHOLD, RunContext, _SimIndex, audit_outputs, generate_batch
+
+VOCAB = [f"слово{i}" for i in range(3000)]
+
+
+def _rows(n: int, words: int, seed: int = 0):
+    # unrelated texts, plus a copy of every 50th one with its last word changed
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        if i % 50 == 1:
+            w = out[-1].split()
+            w[-1] = rnd.choice(VOCAB)
+            out.append(" ".join(w))
+        else:
+            out.append(" ".join(rnd.choice(VOCAB) for _ in range(words)))
+    return out
+
+
+@pytest.fixture
+def generated(tmp_path, make_params):
+    # sentences of real generator output; recombined below into large
+    # template-heavy batches without generating them row by row
+    _, descs = generate_batch(make_params(tmp_path / "tpl.xlsx", tmp_path), 1000, random.Random(1))
+    return [d.split(". ") for d in descs]
+
+
+def _recombined(src, n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        # each of the first 8 sentences from another row, the rest as is
+        out.append(". ".join(rnd.choice(src)[k] if k < 8 else s for k, s in enumerate(rnd.choice(src))))
+    for i in range(1, n, 50):
+        w = out[i - 1].split()
+        w[-1] = "другое"
+        out[i] = " ".join(w)
+    return out
+
+
+def _clusters(texts, titles: bool):
+    index = _SimIndex(titles=titles)
+    for i, t in enumerate(texts):
+        index.add(i, t)
+    start = time.perf_counter()
+    groups, best = index.clusters(AUDIT_THRESHOLD, RunContext(), 0, 100)
+    return groups, best, time.perf_counter() - start
+
+
+def test_audit_finds_planted_pairs_across_files(tmp_path):
+    titles, descs = _rows(2000, 12, seed=1), _rows(2000, 60, seed=2)
+    # one more near copy, of a row in the first file, at the end of the second
+    titles.append(titles[5].rsplit(" ", 1)[0] + " другое")
+    descs.append(descs[5].rsplit(" ", 1)[0] + " другое")
+    paths = []
+    for f, rows in enumerate((range(0, 1000), range(1000, 2001))):
+        path = tmp_path / f"part{f}.jsonl"
+        with open(path, "w", encoding="utf-8") as fh:
+            for i in rows:
+                fh.write(json.dumps({"row": i, "article": f"A{i}", "title": titles[i], "description": descs[i]}) + "\n")
+        paths.append(str(path))
+
+    _, scanned, rep = audit_outputs(paths, out_dir=str(tmp_path))
+    report = json.loads(rep)
+    assert scanned == 2001
+    assert report["descriptions"]["clusters"] == 41
+    assert report["descriptions"]["rows_in_clusters"] == 82
+    assert report["descriptions"]["cross_file_clusters"] == 1
+    assert report["titles"]["clusters"] >= 37
+
+
+def test_audit_recall_and_no_false_pairs():
+    for titles, words in ((True, 12), (False, 60)):
+        _, best, _ = _clusters(_rows(10000, words), titles)
+        planted = range(1, 10000, 50)
+        found = sum(1 for i in planted if i in best and i - 1 in best)
+        assert found >= (0.9 if titles else 1.0) * len(planted)
+        assert all(r % 50 in (0, 1) for r in best)
+
+
+def test_audit_scales_linearly_on_unrelated_rows():
+    for titles, words in ((True, 10), (False, 50)):
+        _, _, small = _clusters(_rows(5000, words), titles)
+        _, _, large = _clusters(_rows(40000, words), titles)
+        # 8x the rows; pairwise work would be 64x
+        assert large < 16 * small + 0.5
+
+
+def test_audit_scales_linearly_on_generated_rows(generated):
+    _, _, small = _clusters(_recombined(generated, 2500), False)
+    _, best, large = _clusters(_recombined(generated, 20000), False)
+    # rows share most of their text; without a per-bucket cap this is 64x
+    assert large < 16 * small + 0.5
+    planted = range(1, 20000, 50)
+    assert all(i in best and i - 1 in best for i in planted)
@@ -0,0 +1,44 @@
+import json
+import pickle
+
+import pytest
+
+from wb_fill import FillCancelled, RunContext, fill_wb_template
+
+
+def _cancel_after(files: int) -> RunContext:
+    # progress reaches files*100/3 once that many files are done
+    seen = []
+    ctx = RunContext(progress_callback=seen.append)
+    ctx.cancel_check = lambda: bool(seen) and seen[-1] >= files * 100 // 3
+    return ctx
+
+
+def test_resume_matches_uninterrupted_run(tmp_path, make_template, make_params):
+    tpl = make_template(30)
+    run = dict(batch_count=3, output_format="jsonl", seed=11)
+    whole, _, _ = fill_wb_template(make_params(tpl, tmp_path / "whole", **run))
+
+    params = make_params(tpl, tmp_path / "resumed", **run)
+    with pytest.raises(FillCancelled):
+        fill_wb_template(params, _cancel_after(2))
+    ckpt = tmp_path / "resumed" / "tpl.checkpoint"
+    assert json.loads(ckpt.read_text(encoding="utf-8"))["done"] == 2
+
+    outs, _, _ = fill_wb_template(params)
+    assert not ckpt.exists()
+    assert [open(p, encoding="utf-8").read() for p in outs] == [open(p, encoding="utf-8").read() for p in whole]
+
+
+class _Boom:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit('checkpoint executed')",))
+
+
+def test_pickled_checkpoint_is_not_loaded(tmp_path, make_template, make_params):
+    tpl = make_template(10)
+    out = tmp_path / "out"
+    out.mkdir()
+    (out / "tpl.checkpoint").write_bytes(pickle.dumps(_Boom()))
+    outs, total, _ = fill_wb_template(make_params(tpl, out, batch_count=3, output_format="jsonl"))
+    assert len(outs) == 3 and total == 30
@@ -0,0 +1,61 @@
+import csv
+import json
+import shutil
+
+import pytest
+from openpyxl import load_workbook
+
+from wb_fill import FillParams, fill_wb_template, gen_cache_dir
+
+
+def _texts(path: str):
+    # (title, description) per filled row, in row order
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return [(r["title"], r["description"]) for r in csv.DictReader(f, delimiter=";")]
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            return [(r["title"], r["description"]) for r in map(json.loads, f)]
+    ws = load_workbook(path, read_only=True).active
+    return [(r[2], r[3]) for r in ws.iter_rows(min_row=3, values_only=True) if r[2]]
+
+
+def _run(params: FillParams):
+    outs, _, report = fill_wb_template(params)
+    return [_texts(p) for p in outs], json.loads(report)
+
+
+def _drop_cache():
+    shutil.rmtree(gen_cache_dir(), ignore_errors=True)
+
+
+def test_cached_files_match_fresh_run(tmp_path, make_template, make_params):
+    tpl = make_template(40)
+    _run(make_params(tpl, tmp_path / "a", batch_count=2))
+    cached, report = _run(make_params(tpl, tmp_path / "b", batch_count=3))
+    assert report["rows_from_cache"] == 80
+
+    _drop_cache()
+    fresh, report = _run(make_params(tpl, tmp_path / "c", batch_count=3))
+    assert report["rows_from_cache"] == 0
+    assert cached == fresh
+
+
+def test_cached_prefix_matches_fresh_run(tmp_path, make_template, make_params):
+    tpl = make_template(40)
+    _run(make_params(tpl, tmp_path / "a", batch_count=2, rows_to_fill=10))
+    cached, report = _run(make_params(tpl, tmp_path / "b", batch_count=2, rows_to_fill=20))
+    assert report["rows_from_cache"] == 10  # file 2 starts from a different state
+
+    _drop_cache()
+    fresh, _ = _run(make_params(tpl, tmp_path / "c", batch_count=2, rows_to_fill=20))
+    assert cached == fresh
+
+
+@pytest.mark.parametrize("variant", [{"low_memory": True}, {"output_format": "csv"}, {"output_format": "jsonl"}])
+def test_output_paths_agree(tmp_path, make_template, make_params, variant):
+    tpl = make_template(600)  # more than one STREAM_CHUNK
+    xlsx, _ = _run(make_params(tpl, tmp_path / "xlsx", batch_count=2))
+    _drop_cache()
+    other, _ = _run(make_params(tpl, tmp_path / "other", batch_count=2, **variant))
+    assert other == xlsx
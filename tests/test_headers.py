@@ -0,0 +1,34 @@
+import pytest
+
+from wb_fill import _HeaderResolver, _default_header_synonyms
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return _HeaderResolver(_default_header_synonyms())
+
+
+@pytest.mark.parametrize("header, field, score", [
+    ("Наименование", "name", 3),
+    ("Описание (до 5000 символов)*", "description", 3),
+    ("Наименование изделия", "name", 2),
+    ("Описание для WB", "description", 2),
+    ("Наим.", "name", 2),
+    ("Наименованме", "name", 1),
+    ("Описанте", "description", 1),
+])
+def test_header_matches(resolver, header, field, score):
+    assert resolver.match(header) == (field, score)
+
+
+@pytest.mark.parametrize("header", [
+    "Наименование ткани", "Наименование цвета", "Наименование, цвет", "Наименование EN",
+    "Описание EN", "Описание RU", "Название бренда", "Наименование товара EN",
+])
+def test_other_columns_are_not_matched(resolver, header):
+    assert resolver.match(header) is None
+
+
+def test_missing_column_is_an_error(resolver):
+    with pytest.raises(ValueError, match="Не найдены колонки"):
+        resolver.resolve([("Артикул продавца", "Наименование цвета", "Описание EN")])
@@ -0,0 +1,25 @@
+import random
+
+from wb_fill import LENS_HINTS, SHAPE_HINTS, _HintIndex, _norm_key
+
+
+def _linear(hints, raw):
+    # the substring scan the index replaced: first key in dict order wins
+    k = _norm_key(raw)
+    for key, variants in hints.items():
+        if _norm_key(key) in k:
+            return tuple(variants)
+    return None
+
+
+def test_hint_index_matches_linear_scan():
+    rnd = random.Random(4)
+    synthetic = {"ab": ("1",), "b": ("2",), "abc": ("3",), "bca": ("4",), "c c": ("5",), "cab": ("6",)}
+    for hints in (SHAPE_HINTS, LENS_HINTS, synthetic):
+        index = _HintIndex({k: tuple(v) for k, v in hints.items()})
+        pieces = [k for k in hints] + ["", " ", "-", "очки", "x", "a", "c", "Кошачий", "&"]
+        for _ in range(2000):
+            raw = "".join(rnd.choice(pieces) for _ in range(rnd.randint(0, 4)))
+            if rnd.random() < 0.3:
+                raw = raw.upper()
+            assert index.resolve(raw) == _linear(hints, raw), raw
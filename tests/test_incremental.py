@@ -0,0 +1,71 @@
+import csv
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from wb_fill import _FillIndex, fill_wb_template
+
+
+def _texts(path):
+    ws = load_workbook(path, read_only=True).active
+    return [(r[2], r[3]) for r in ws.iter_rows(min_row=3, values_only=True)]
+
+
+def test_second_run_keeps_unchanged_rows(tmp_path, make_template, make_params):
+    tpl = make_template(10)
+    out = tmp_path / "out"
+    (first,), _, _ = fill_wb_template(make_params(tpl, out, incremental=True))
+
+    # yesterday's output is today's input; one product changed its brand
+    wb = load_workbook(first)
+    wb.active.cell(row=5, column=2, value="Prada")
+    today = tmp_path / "export_today.xlsx"
+    wb.save(today)
+
+    (second,), _, report = fill_wb_template(make_params(today, out, incremental=True))
+    assert json.loads(report)["rows_total_kept"] == 9
+    before, after = _texts(first), _texts(second)
+    assert [i for i, (a, b) in enumerate(zip(before, after)) if a != b] == [2]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_row_sink_writes_kept_rows_through(tmp_path, make_template, make_params, fmt):
+    out = tmp_path / "out"
+    (first,), _, _ = fill_wb_template(make_params(make_template(10), out, incremental=True))
+    wb = load_workbook(first)
+    wb.active.cell(row=5, column=2, value="Prada")
+    today = tmp_path / "export_today.xlsx"
+    wb.save(today)
+
+    (second,), total, report = fill_wb_template(make_params(today, out, incremental=True, output_format=fmt))
+    with open(second, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            rows = [(r["article"], r["title"], r["description"]) for r in csv.DictReader(f, delimiter=";")]
+        else:
+            rows = [(r["article"], r["title"], r["description"]) for r in map(json.loads, f)]
+
+    before = _texts(first)
+    assert total == 1
+    assert [r[0] for r in rows] == [f"ART{i:06d}" for i in range(10)]
+    assert [i for i, (a, b) in enumerate(zip(before, rows)) if a != b[1:]] == [2]
+    # kept titles count as used, so the regenerated row cannot repeat one
+    gen = json.loads(report)["generation"]
+    assert gen["rows_generated"] == 1 and gen["distinct_titles"] == 10
+
+
+def test_index_save_keeps_other_templates(tmp_path, make_params):
+    # two jobs in one folder: both load the index before either saves
+    path = tmp_path / "fill_index.json"
+    params = make_params(tmp_path / "tpl.xlsx", tmp_path)
+    a, b = _FillIndex(path, params), _FillIndex(path, params)
+    a.use_header(["Артикул продавца", "Наименование", "Описание"])
+    b.use_header(["Баркод", "Наименование", "Описание"])
+    a.needs_fill(("A1", None, None), 2, 3, [1])
+    b.needs_fill(("B1", None, None), 2, 3, [1])
+    a.save()
+    b.save()
+
+    templates = json.loads(path.read_text(encoding="utf-8"))["templates"]
+    assert sorted(k for t in templates.values() for k in t) == ["A1", "B1"]
+    assert not list(tmp_path.glob("*.tmp"))
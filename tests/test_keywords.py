@@ -0,0 +1,41 @@
+import random
+
+from wb_fill import KeywordSampler, _AliasTable
+
+
+def _alias_probs(t: _AliasTable):
+    # exact draw probability of every id implied by the table
+    p = [x / t.n for x in t.prob]
+    for j in range(t.n):
+        if t.alias[j] != j:
+            p[t.alias[j]] += (1.0 - t.prob[j]) / t.n
+    return p
+
+
+def test_alias_table_matches_weights():
+    rnd = random.Random(3)
+    for n in (1, 2, 7, 50, 300):
+        weights = [rnd.choice((0.5, 1.0, 3.0, 40.0)) * rnd.random() + 0.01 for _ in range(n)]
+        total = sum(weights)
+        got = _alias_probs(_AliasTable(weights))
+        assert all(abs(g - w / total) < 1e-9 for g, w in zip(got, weights))
+
+
+def test_alias_draws_follow_weights():
+    t = _AliasTable([1.0, 2.0, 7.0])
+    rnd = random.Random(1)
+    counts = [0, 0, 0]
+    for _ in range(100_000):
+        counts[t.draw(rnd)] += 1
+    assert [round(c / 10_000) for c in counts] == [1, 2, 7]
+
+
+def test_pick_is_distinct_and_evens_out_usage():
+    ks = KeywordSampler([f"k{i}" for i in range(20)], [100.0] + [1.0] * 19)
+    rnd = random.Random(2)
+    for _ in range(200):
+        ids = ks.pick(rnd, 6)
+        assert len(set(ids)) == 6
+        ks.note(ids)
+    # undamped, the heavy phrase would be in almost every pack
+    assert ks.uses[0] < 150 and min(ks.uses[1:]) > 40
@@ -0,0 +1,34 @@
+import tracemalloc
+
+from openpyxl import load_workbook
+
+from wb_fill import (
+    LOW_MEMORY_CEILING_MB, RunContext, _Parts, _TextFeed, _fill_streaming,
+)
+
+TEMPLATE_ROWS = 20_000
+FILLED_ROWS = 300   # generation is the slow part; the template size is what must not matter
+
+
+def test_streaming_fill_stays_under_ceiling(tmp_path, make_template, make_params):
+    tpl = make_template(TEMPLATE_ROWS)
+    params = make_params(
+        tpl, tmp_path, collection="", holidays="",
+        rows_to_fill=FILLED_ROWS, low_memory=True, seed=1,
+    )
+    parts = _Parts(tmp_path / "out.xlsx")
+    feed = _TextFeed(params, 1, RunContext())
+
+    tracemalloc.start()
+    try:
+        filled = _fill_streaming(params, tpl, parts, feed)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        parts.close()
+
+    assert filled == FILLED_ROWS
+    assert peak < LOW_MEMORY_CEILING_MB * 1024 * 1024, f"peak {peak / 2**20:.1f} MB"
+
+    ws = load_workbook(tmp_path / "out.xlsx", read_only=True).active
+    assert sum(1 for _ in ws.iter_rows(values_only=True)) == TEMPLATE_ROWS + 2
@@ -0,0 +1,39 @@
+import random
+
+from wb_fill import ADJ_SYNONYMS, CASES, GENDERS, WORD_SYNONYMS, _Morph, inflect
+
+
+def test_inflect_known_forms():
+    assert inflect("Модные", "f", "acc") == "Модную"
+    assert inflect("городские", "m", "nom") == "городской"
+    assert inflect("синие", "f", "nom") == "синяя"
+    assert inflect("хорошие", "n", "ins") == "хорошим"
+    assert inflect("очки", "m", "gen") == "очки"
+
+
+def test_synonym_table_matches_inflect():
+    morph = _Morph([tuple(g) for g in ADJ_SYNONYMS], [tuple(g) for g in WORD_SYNONYMS])
+    for group in ADJ_SYNONYMS:
+        for g in GENDERS:
+            for c in CASES:
+                forms = [inflect(w, g, c) for w in group]
+                for i, f in enumerate(forms):
+                    others = {x for j, x in enumerate(forms) if j != i and x != f}
+                    assert set(morph.alts.get(f, ())) >= others, (f, g, c)
+
+
+def test_substitute_keeps_case_and_other_words():
+    morph = _Morph([("стильные", "модные")], [])
+    text = "Стильную оправу носят с модным платьем."
+    out = morph.substitute(random.Random(0), text, 1.0)
+    assert out == "Модную оправу носят со стильным платьем."
+
+
+def test_substitute_agrees_the_preposition():
+    morph = _Morph([("стильные", "модные"), ("светлые", "вечерние")], [])
+    rnd = random.Random(0)
+    assert morph.substitute(rnd, "Со стильным платьем.", 1.0) == "С модным платьем."
+    assert morph.substitute(rnd, "Хорошо в вечернем городе.", 1.0) == "Хорошо в светлом городе."
+    assert morph.substitute(rnd, "Хорошо в светлом городе.", 1.0) == "Хорошо в вечернем городе."
+    # only a standalone preposition changes
+    assert morph.substitute(rnd, "Часто модным.", 1.0) == "Часто стильным."
@@ -0,0 +1,49 @@
+import random
+import statistics
+
+import pytest
+
+from wb_fill import (
+    DESC_MUTATION_BUDGET, RECENT_DESCS, GenState, _prepare_spec, _template_words, _text_fp,
+    generate_batch, load_phrase_bank,
+)
+
+
+def _overlap(descs):
+    # per row: highest Jaccard over non-template words against the recent window
+    words = [_text_fp(d) for d in descs]
+    out = []
+    for i in range(1, len(words)):
+        recent = words[max(0, i - RECENT_DESCS):i]
+        common = _template_words(recent)
+        cur = words[i] - common
+        out.append(max(len(cur & p) / len(cur | p) for p in (q - common for q in recent)))
+    return out
+
+
+@pytest.mark.parametrize("uniqueness", range(0, 101, 10))
+def test_rows_over_sim_limit_are_counted(tmp_path, make_params, uniqueness):
+    params = make_params(tmp_path / "tpl.xlsx", tmp_path, uniqueness=uniqueness)
+    limit = _prepare_spec(params, load_phrase_bank()).sim_limit
+    state = GenState()
+    _, descs = generate_batch(params, 80, random.Random(1), state)
+
+    over = sum(sim > limit for sim in _overlap(descs))
+    c = state.counters()
+    assert c["desc_sim_limit_missed"] == over
+    assert c["desc_rewrites"] >= over
+    assert c["desc_mutation_attempts"] <= DESC_MUTATION_BUDGET * c["desc_rewrites"]
+
+
+def test_uniqueness_lowers_the_overlap(tmp_path, make_params):
+    means, over = [], []
+    for uniqueness in (0, 80, 92, 100):
+        params = make_params(tmp_path / "tpl.xlsx", tmp_path, uniqueness=uniqueness)
+        limit = _prepare_spec(params, load_phrase_bank()).sim_limit
+        sims = _overlap(generate_batch(params, 400, random.Random(1))[1])
+        means.append(statistics.mean(sims))
+        over.append(sum(sim > limit for sim in sims) / len(sims))
+    assert means == sorted(means, reverse=True)
+    assert means[0] - means[-1] > 0.05
+    # the default (92) is met by nearly every row
+    assert over[2] < 0.1
@@ -0,0 +1,72 @@
+import time
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Font, PatternFill
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from wb_fill import _Parts, _fill_workbook, fill_wb_template
+
+
+def test_split_parts_remap_merges_and_links(tmp_path, make_params):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Шаблон для загрузки товаров"])
+    ws.append(["Артикул продавца", "Бренд", "Наименование", "Описание", "Цвет", "Размер"])
+    for i in range(12):
+        ws.append([f"ART{i:06d}", "Dior", None, None, "чёрный", "M"])
+    ws.merge_cells("E8:F9")
+    ws["B10"].hyperlink = "https://example.com/dior"
+    ws.row_dimensions[9].height = 42
+    dv = DataValidation(type="list", formula1='"Dior,Prada"')
+    dv.add("B3:B14")
+    ws.add_data_validation(dv)
+    ws.conditional_formatting.add("E3:E14", CellIsRule(operator="equal", formula=['"белый"'], fill=PatternFill("solid", "FFFF00")))
+    ws["A2"].font = Font(bold=True)
+    ws["E11"].number_format = "0.00%"
+    ws.column_dimensions["D"].width = 80
+    ws.freeze_panes = "A3"
+    ref = wb.create_sheet("Справочник")
+    ref.append(["Dior"])
+    ref.append(["Prada"])
+    tpl = tmp_path / "tpl.xlsx"
+    wb.save(tpl)
+
+    outs, total, _ = fill_wb_template(make_params(tpl, tmp_path / "out", max_rows_per_file=4))
+    assert total == 12 and len(outs) == 3
+
+    sheets = [load_workbook(p).active for p in outs]
+    assert [[m.coord for m in s.merged_cells.ranges] for s in sheets] == [[], ["E4:F5"], []]
+    assert [[c.coordinate for row in s.iter_rows() for c in row if c.hyperlink] for s in sheets] == [[], ["B6"], []]
+    assert sheets[1]["B6"].hyperlink.ref == "B6"
+    assert sheets[1].row_dimensions[5].height == 42
+    assert [[str(d.sqref) for d in s.data_validations.dataValidation] for s in sheets] == [["B3:B6"]] * 3
+    assert [[str(f.sqref) for f in s.conditional_formatting] for s in sheets] == [["E3:E6"]] * 3
+    assert [s["A3"].value for s in sheets] == ["ART000000", "ART000004", "ART000008"]
+    assert all(s.max_row == 6 for s in sheets)
+    assert all(s["A2"].font.b and s.column_dimensions["D"].width == 80 and s.freeze_panes == "A3" for s in sheets)
+    assert sheets[2]["E3"].number_format == "0.00%"
+    assert all([r[0].value for r in s.parent["Справочник"].iter_rows()] == ["Dior", "Prada"] for s in sheets)
+    assert all(s.title == "Sheet" and s.parent.sheetnames == ["Sheet", "Справочник"] for s in sheets)
+
+
+class _FixedFeed:
+    # texts are not what is measured here
+    state = None
+
+    def next(self):
+        return "Солнцезащитные очки Dior", "Описание " * 100
+
+
+def test_split_costs_about_one_save(tmp_path, make_template, make_params):
+    tpl = make_template(5000)
+    params = make_params(tpl, tmp_path)
+    took = {}
+    for limit in (0, 500):
+        parts = _Parts(tmp_path / f"out{limit}.xlsx", limit)
+        start = time.perf_counter()
+        assert _fill_workbook(params, tpl, parts, _FixedFeed()) == 5000
+        took[limit] = time.perf_counter() - start
+        assert len(parts.names) == (10 if limit else 1)
+    # a reload and a row delete per part made this 7x
+    assert took[500] < 2.5 * took[0] + 0.5
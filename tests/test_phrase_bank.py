@@ -0,0 +1,25 @@
+import json
+
+from openpyxl import load_workbook
+
+from wb_fill import fill_wb_template, phrase_bank_path
+
+
+def _titles(path):
+    return [r[2] for r in load_workbook(path).active.iter_rows(min_row=3, values_only=True)]
+
+
+def test_edited_bank_is_used_by_the_next_fill(tmp_path, make_template, make_params):
+    params = make_params(make_template(20), tmp_path / "out")
+    bank = phrase_bank_path()
+
+    bank.write_text(json.dumps({"slogans": ["Солнечные"]}), encoding="utf-8")
+    outs, _, _ = fill_wb_template(params)
+    before = _titles(outs[0])
+    assert all("Солнечные" in t for t in before)
+
+    # edited while the app keeps running: no restart, no reload button
+    bank.write_text(json.dumps({"slogans": ["Летние"]}), encoding="utf-8")
+    outs, _, _ = fill_wb_template(params)
+    after = _titles(outs[0])
+    assert all("Летние" in t and "Солнечные" not in t for t in after)
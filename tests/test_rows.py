@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import PatternFill
+
+from wb_fill import fill_wb_template, fill_wb_template_async
+
+
+@pytest.mark.parametrize("run", ["sync", "async", "low_memory"])
+def test_fixed_count_past_the_last_row_adds_no_rows(tmp_path, make_template, make_params, run):
+    # settings saved by older builds still carry rows=6..1000
+    params = make_params(make_template(3), tmp_path / "out", rows_to_fill=10, low_memory=run == "low_memory")
+    if run == "async":
+        outs, total, _ = asyncio.run(fill_wb_template_async(params))
+    else:
+        outs, total, _ = fill_wb_template(params)
+
+    assert total == 3
+    ws = load_workbook(outs[0]).active
+    assert ws.max_row == 5
+    assert all(r[0] and r[2] and r[3] for r in ws.iter_rows(min_row=3, values_only=True))
+
+
+def test_auto_mode_fills_product_rows_only(tmp_path, make_params):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Шаблон для загрузки товаров"])
+    ws.append(["Артикул продавца", "Бренд", "Наименование", "Описание"])
+    for art in ["ART1", "ART2", None, "ART3", "  ", "ART4"]:
+        ws.append([art, "Dior", None, None])
+    # styled but empty rows below the products, as WB exports them
+    for r in range(9, 20):
+        ws.cell(row=r, column=1).fill = PatternFill("solid", "FFFF00")
+    tpl = tmp_path / "tpl.xlsx"
+    wb.save(tpl)
+
+    for low_memory in (False, True):
+        outs, total, _ = fill_wb_template(make_params(tpl, tmp_path / f"out{low_memory}", low_memory=low_memory))
+        assert total == 4
+        rows = list(load_workbook(outs[0]).active.iter_rows(min_row=3, values_only=True))
+        filled = [r[0] for r in rows if r[2] or r[3]]
+        assert filled == ["ART1", "ART2", "ART3", "ART4"]
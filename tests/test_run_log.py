@@ -0,0 +1,88 @@
+import json
+import os
+import re
+
+import pytest
+
+from wb_fill import METRICS_PREFIX, dump_metrics, fill_wb_template, logs_dir
+
+_SAMPLE_RE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+
+
+@pytest.fixture
+def fresh_log(appdata):
+    # run_logger() follows the data folder, so each test gets its own file
+    return logs_dir() / "runs.jsonl"
+
+
+def _events(path):
+    return [json.loads(ln) for ln in path.read_text(encoding="utf-8").splitlines()]
+
+
+def _metrics(path):
+    # {(name, labels): value}; every sample must belong to a declared metric
+    declared, samples = set(), {}
+    for ln in path.read_text(encoding="utf-8").splitlines():
+        if ln.startswith("# TYPE "):
+            name, kind = ln.split()[2:]
+            assert kind in ("counter", "gauge")
+            declared.add(name)
+        elif not ln.startswith("#"):
+            m = _SAMPLE_RE.match(ln)
+            assert m, ln
+            assert m.group(1) in declared
+            samples[(m.group(1)[len(METRICS_PREFIX) + 1:], m.group(2) or "")] = float(m.group(3))
+    return samples
+
+
+def test_fill_logs_and_metrics(tmp_path, make_template, make_params, fresh_log):
+    before = _metrics(dump_metrics(tmp_path / "before.prom"))
+    params = make_params(make_template(5), tmp_path / "out", batch_count=2)
+    _, total, _ = fill_wb_template(params)
+    with pytest.raises(FileNotFoundError):
+        fill_wb_template(make_params(tmp_path / "missing.xlsx", tmp_path / "out"))
+
+    events = _events(fresh_log)
+    assert [e["event"] for e in events] == ["fill_start", "file_done", "file_done", "fill_end", "fill_start", "fill_failed"]
+    ok, failed = events[3], events[5]
+    assert ok["level"] == "info" and ok["files"] == 2 and ok["rows"] == total == 10
+    assert set(ok["stages"]) == {"generate", "io"} and ok["rows_per_s"] > 0
+    assert events[0]["run_id"] == ok["run_id"] != failed["run_id"]
+    assert failed["level"] == "error" and "missing.xlsx" in failed["error"]
+    assert "Traceback" in failed["traceback"]
+
+    after = _metrics(dump_metrics(tmp_path / "after.prom"))
+
+    def delta(name, labels=""):
+        return after.get((name, labels), 0.0) - before.get((name, labels), 0.0)
+
+    assert delta("fills_total", 'status="done"') == 1
+    assert delta("fills_total", 'status="failed"') == 1
+    assert delta("files_total") == 2
+    assert delta("rows_total") == 10
+    assert after[("last_rows_per_second", "")] > 0
+
+
+def test_worker_logs_job_outcome_and_dumps_metrics(fresh_log):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    pytest.importorskip("PyQt5")
+    import main
+
+    def broken(ctx):
+        raise ValueError("нет шаблона")
+
+    got = []
+    for job in (lambda ctx: (["a.xlsx"], 3, "{}"), broken):
+        w = main.Worker(job, title="job")
+        w.done.connect(lambda *a: got.append("done"))
+        w.fail.connect(got.append)
+        w.run()
+
+    assert got == ["done", "нет шаблона"]
+    events = _events(fresh_log)
+    assert [(e["event"], e.get("status")) for e in events] == [
+        ("job_start", None), ("job_end", "done"), ("job_start", None), ("job_end", "failed"),
+    ]
+    assert events[1]["files"] == 1 and events[1]["rows"] == 3
+    assert events[3]["level"] == "error" and "ValueError" in events[3]["traceback"]
+    assert _metrics(logs_dir() / "metrics.prom")
@@ -0,0 +1,66 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import wb_service
+from wb_service import GenService, params_from_json
+
+
+@pytest.mark.parametrize("d", [{"shape": 5}, {"wb_strict": "yes"}, {"batch_count": "2"}, {"seed": True}])
+def test_wrong_param_types_are_rejected(d):
+    with pytest.raises(ValueError, match=next(iter(d))):
+        params_from_json(d)
+
+
+def test_param_values_pass_through():
+    p = params_from_json({"shape": "Авиатор", "batch_count": 3.0, "low_memory": True})
+    assert (p.shape, p.batch_count, p.low_memory) == ("Авиатор", 3, True)
+
+
+def test_sessions_are_capped(monkeypatch):
+    monkeypatch.setattr(wb_service, "MAX_SESSIONS", 3)
+    svc = GenService()
+    for name in ("a", "b", "default", "c"):
+        svc.session(name)
+    assert list(svc.sessions) == ["b", "default", "c"]
+
+
+@pytest.fixture
+def server():
+    srv = wb_service.make_server("127.0.0.1", 0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _post(srv, path, body, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", srv.server_address[1], timeout=30)
+    conn.request("POST", path, body=json.dumps(body), headers=headers or {"Content-Type": "application/json"})
+    r = conn.getresponse()
+    out = r.status, json.loads(r.read())
+    conn.close()
+    return out
+
+
+def test_cross_site_requests_are_refused(server):
+    code, _ = _post(server, "/fill", {"params": {}}, {"Content-Type": "text/plain"})
+    assert code == 415
+    code, _ = _post(server, "/generate", {}, {"Content-Type": "application/json", "Host": "evil.example:8765"})
+    assert code == 403
+    code, body = _post(server, "/generate", {"params": {"brand_lat": "Dior"}})
+    assert code == 200 and body["title"]
+
+
+@pytest.mark.parametrize("path, body, field", [
+    ("/generate", {"count": "abc"}, "count"),
+    ("/generate", {"seed": "x"}, "seed"),
+    ("/audit", {"files": "out.xlsx"}, "files"),
+    ("/audit", {"files": [1]}, "files"),
+    ("/audit", {"files": ["a.csv"], "threshold": "high"}, "threshold"),
+])
+def test_bad_request_fields_are_named(server, path, body, field):
+    code, out = _post(server, path, body)
+    assert code == 400 and field in out["error"]
@@ -0,0 +1,37 @@
+import random
+from itertools import combinations
+
+from wb_fill import _pack_title
+
+
+def _brute(head, optional, limit):
+    # every subset, best = most important fragments first, then the longest
+    head = [x for x in head if x]
+    opt = [x for x in optional if x]
+    best, best_key = None, None
+    for k in range(len(opt) + 1):
+        for keep in combinations(range(len(opt)), k):
+            t = " ".join(head + [opt[i] for i in keep])
+            if len(t) > limit:
+                continue
+            key = ([i not in keep for i in range(len(opt))], -len(t))
+            if best_key is None or key < best_key:
+                best, best_key = t, key
+    return best
+
+
+def test_pack_title_matches_brute_force():
+    rnd = random.Random(5)
+    words = ["Стильные", "солнцезащитные очки", "Диор", "кошачий глаз", "поляризация", "Весна-Лето 2026", "UV400", "авиаторы"]
+    for _ in range(3000):
+        head = rnd.sample(words, 2)
+        optional = rnd.sample(words, rnd.randint(0, 5))
+        limit = rnd.randint(20, 80)
+        want = _brute(head, optional, limit)
+        if want is not None:
+            assert _pack_title(head, optional, limit) == want
+
+
+def test_pack_title_cuts_long_head_on_a_word():
+    t = _pack_title(["Нереально красивые", "солнцезащитные очки"], ["Диор"], 25)
+    assert t == "Нереально красивые"
@@ -0,0 +1,212 @@
+"""
+Headless UI timing budgets: builds App on the offscreen Qt platform,
+scripts the usual operator flow and checks the median of each step
+against BUDGETS_MS. The flow itself always runs; the wall-clock budgets
+are only checked with UI_BENCH=1 (a slow box can widen every budget with
+UI_BENCH_SCALE=2). Runs against a throwaway data folder, so the
+operator's settings and lists are never touched.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5")
+
+
+# step -> budget, ms
+# (about 10x the medians measured on a single-core Linux box)
+BUDGETS_MS: Dict[str, float] = {
+    "window_build": 400.0,    # App() incl. list files, settings, stylesheet
+    "theme_switch": 250.0,    # one theme change (full stylesheet re-apply)
+    "load_xlsx": 25.0,        # "Загрузить XLSX" with the file picked
+    "add_brand": 25.0,        # "+" next to the brand, Cyrillic prompt declined
+    "combo_reload": 25.0,     # brand combo refilled with BIG_LIST items
+    "pick_holidays": 100.0,   # holiday dialog opened, 3 ticked, OK
+    "run_dispatch": 25.0,     # "СГЕНЕРИРОВАТЬ" until the job is queued
+    "run_complete": 5000.0,   # queued job until done (generation included)
+}
+BIG_LIST = 2000
+TEMPLATE_ROWS = 200
+REPEAT = 3
+
+
+def _make_template(path: Path, rows: int = TEMPLATE_ROWS) -> Path:
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["Шаблон для загрузки товаров"])
+    ws.append(["Артикул продавца", "Бренд", "Наименование", "Описание"])
+    for i in range(rows):
+        ws.append([f"BENCH-{i:05d}", "", None, None])
+    wb.save(path)
+    return path
+
+
+@contextmanager
+def _patched(obj, name: str, value) -> Iterator[None]:
+    old = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, old)
+
+
+class UiBench:
+    """One App instance plus the scripted steps; each step returns its wall time in ms."""
+
+    def __init__(self, workdir: Path):
+        from PyQt5.QtCore import qInstallMessageHandler
+        from PyQt5.QtWidgets import QApplication
+
+        # stylesheet / offscreen plugin warnings would drown the output
+        qInstallMessageHandler(lambda *a: None)
+        self.workdir = workdir
+        self.qapp = QApplication.instance() or QApplication([])
+        self.template = _make_template(workdir / "bench.xlsx")
+        self.out_dir = workdir / "out"
+        self.app = None
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _ms(fn: Callable[[], None]) -> float:
+        t0 = time.perf_counter()
+        fn()
+        return (time.perf_counter() - t0) * 1000.0
+
+    def _pump_until(self, cond: Callable[[], bool], timeout_s: float) -> bool:
+        end = time.monotonic() + timeout_s
+        while not cond():
+            if time.monotonic() > end:
+                return False
+            self.qapp.processEvents()
+            time.sleep(0.005)
+        return True
+
+    # ---------- steps ----------
+    def window_build(self) -> float:
+        import main
+
+        def build():
+            if self.app is not None:
+                self.app.close()
+                self.app.deleteLater()
+            self.app = main.App()
+            self.app.show()
+            self.qapp.processEvents()
+        return self._ms(build)
+
+    def theme_switch(self) -> float:
+        import main
+
+        cmb = self.app.cmb_theme
+        names = list(main.THEMES)
+        nxt = names[(names.index(cmb.currentText()) + 1) % len(names)] if cmb.currentText() in names else names[0]
+        return self._ms(lambda: (cmb.setCurrentText(nxt), self.qapp.processEvents()))
+
+    def load_xlsx(self) -> float:
+        from PyQt5.QtWidgets import QFileDialog
+
+        pick = staticmethod(lambda *a, **k: (str(self.template), "Excel (*.xlsx)"))
+        with _patched(QFileDialog, "getOpenFileName", pick):
+            ms = self._ms(self.app.btn_load.click)
+        self.app.ed_out.setText(str(self.out_dir))
+        return ms
+
+    def add_brand(self) -> float:
+        from PyQt5.QtWidgets import QMessageBox
+
+        self.app.cmb_brand.setCurrentText(f"Bench{time.perf_counter_ns() % 10**9}")
+        no = staticmethod(lambda *a, **k: QMessageBox.No)
+        with _patched(QMessageBox, "question", no):
+            return self._ms(self.app.btn_add_brand.click)
+
+    def combo_reload(self) -> float:
+        items = [f"Brand {i}" for i in range(BIG_LIST)]
+        cmb = self.app.cmb_brand
+        cur = cmb.currentText()
+        ms = self._ms(lambda: self.app._reload_combo(cmb, items, items[-1]))
+        self.app._reload_combo(cmb, self.app.brands, cur)
+        return ms
+
+    def pick_holidays(self) -> float:
+        from PyQt5.QtCore import QTimer
+        import main
+
+        def answer():
+            dlg = self.qapp.activeModalWidget()
+            if not isinstance(dlg, main.HolidaysDialog):
+                QTimer.singleShot(5, answer)
+                return
+            for cb in dlg.checks[:3]:
+                cb.setChecked(True)
+            dlg.btn_ok.click()
+
+        QTimer.singleShot(0, answer)
+        ms = self._ms(self.app.btn_holidays.click)
+        assert len(self.app.selected_holidays) >= min(3, len(self.app.holidays)), "holiday selection was not applied"
+        return ms
+
+    def run(self) -> Dict[str, float]:
+        # dispatch is the click itself; completion is measured until the queue drains
+        self.app.cmb_brand.setCurrentText("Dior")
+        self.app.spin_batch.setValue(1)
+        before = len(self.app.session_jobs) if self.app.queue.active_count() else 0
+        t0 = time.perf_counter()
+        self.app.btn_go.click()
+        dispatch = (time.perf_counter() - t0) * 1000.0
+        assert len(self.app.session_jobs) == before + 1, "no job was queued"
+        job = self.app.session_jobs[-1]
+        assert self._pump_until(lambda: self.app.queue.active_count() == 0, 120.0), "job did not finish in 120 s"
+        complete = (time.perf_counter() - t0) * 1000.0
+        assert job.lb_status.text().startswith("Готово"), job.lb_status.text()
+        return {"run_dispatch": dispatch, "run_complete": complete}
+
+    def close(self) -> None:
+        if self.app is not None:
+            self.app.close()
+            self.app.deleteLater()
+            self.qapp.processEvents()
+
+
+@pytest.fixture(scope="module")
+def medians(tmp_path_factory) -> Dict[str, float]:
+    # the whole flow runs once per module; each step is then checked on its own
+    workdir = tmp_path_factory.mktemp("ui_bench")
+    mp = pytest.MonkeyPatch()
+    mp.setenv("APPDATA", str(workdir / "appdata"))
+    samples: Dict[str, List[float]] = {k: [] for k in BUDGETS_MS}
+    bench = UiBench(workdir)
+    try:
+        for _ in range(REPEAT):
+            samples["window_build"].append(bench.window_build())
+            samples["theme_switch"].append(bench.theme_switch())
+            samples["load_xlsx"].append(bench.load_xlsx())
+            samples["add_brand"].append(bench.add_brand())
+            samples["combo_reload"].append(bench.combo_reload())
+            samples["pick_holidays"].append(bench.pick_holidays())
+            for k, v in bench.run().items():
+                samples[k].append(v)
+    finally:
+        bench.close()
+        mp.undo()
+    return {k: statistics.median(v) for k, v in samples.items()}
+
+
+def test_ui_flow_completes(medians):
+    assert set(medians) == set(BUDGETS_MS)
+    assert all(ms > 0 for ms in medians.values())
+
+
+@pytest.mark.skipif(not os.environ.get("UI_BENCH"), reason="wall-clock budgets: set UI_BENCH=1")
+@pytest.mark.parametrize("step", list(BUDGETS_MS))
+def test_ui_step_within_budget(medians, step):
+    budget = BUDGETS_MS[step] * float(os.environ.get("UI_BENCH_SCALE", "1"))
+    assert medians[step] <= budget, f"{step}: median {medians[step]:.1f} ms, budget {budget:.0f} ms"
@@ -0,0 +1,30 @@
+import json
+import random
+
+import pytest
+
+from wb_fill import GenState, generate_batch, load_phrase_bank, phrase_bank_path
+
+
+# "парк" is one of the scenarios, "Диор" the brand in half of the titles
+@pytest.mark.parametrize("word", ["парк", "Диор"])
+def test_banned_words_are_regenerated(tmp_path, make_params, word):
+    phrase_bank_path().write_text(json.dumps({"banned_words": [word]}), encoding="utf-8")
+    state = GenState()
+    titles, descs = generate_batch(make_params(tmp_path / "tpl.xlsx", tmp_path), 200, random.Random(1), state)
+
+    banned = load_phrase_bank().banned
+    left = sum(1 for t, d in zip(titles, descs) if banned.search(t) or banned.search(d))
+    v = state.validation()
+    # a row is rebuilt up to VALIDATE_ROUNDS times; only the unlucky rest is reported as left
+    assert v["violations"]["banned_words"] > 40
+    assert v["rows_regenerated"] >= v["violations"]["banned_words"]
+    assert left == v["violations_left"].get("banned_words", 0)
+    assert left < v["violations"]["banned_words"] / 5
+
+
+def test_safe_mode_keeps_risk_words_out_of_titles(tmp_path, make_params):
+    phrase_bank_path().write_text(json.dumps({"slogans": ["Лучшие", "Стильные"]}), encoding="utf-8")
+    for safe in (True, False):
+        titles, _ = generate_batch(make_params(tmp_path / "tpl.xlsx", tmp_path, wb_safe_mode=safe), 40, random.Random(1))
+        assert any(t.startswith("Лучшие") for t in titles) is not safe
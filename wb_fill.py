@@ -3,20 +3,53 @@ from __future__ import annotations
 
 import os
 import re
+import sys
+import csv
 import json
+import uuid
+import logging
 import time
 import math
 import random
-from dataclasses import dataclass
+import gzip
+import base64
+import tarfile
+import zipfile
+import zlib
+import hashlib
+import asyncio
+import threading
+from array import array
+from logging.handlers import RotatingFileHandler
+from collections import Counter, deque
+from copy import copy
+from functools import lru_cache
+from itertools import chain
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Callable, Set
+from io import BytesIO, TextIOWrapper
+from difflib import SequenceMatcher
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple, Callable, Set, Deque, FrozenSet, Sequence, Iterator, IO, Union
 
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.cell_range import CellRange, MultiCellRange
+
+
+APP_NAME = "Sunglasses SEO PRO"
 
 
 # ----------------------------
 # Helpers
 # ----------------------------
+def app_data_dir() -> Path:
+    base = Path(os.getenv("APPDATA", str(Path.home())))
+    p = base / APP_NAME / "data"
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
 def _norm_key(s: str) -> str:
     s = (s or "").strip().lower()
     s = s.replace("&", " ").replace("-", " ")
@@ -49,20 +82,27 @@ def _join_ru_list(items: List[str]) -> str:
     return f"{', '.join(items[:-1])} и {items[-1]}"
 
 
-def _jaccard(a: str, b: str) -> float:
-    wa = set(re.findall(r"[a-zA-Zа-яА-Я0-9]+", (a or "").lower()))
-    wb = set(re.findall(r"[a-zA-Zа-яА-Я0-9]+", (b or "").lower()))
-    if not wa and not wb:
-        return 1.0
-    inter = len(wa & wb)
-    uni = len(wa | wb)
-    return inter / max(uni, 1)
+_WORD_RE = re.compile(r"[a-zA-Zа-яА-Я0-9]+")
+
+
+def _fp64(s: str) -> int:
+    """Stable 64-bit fingerprint (same value across processes)."""
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _text_fp(text: str) -> FrozenSet[int]:
+    # token-hash set: Jaccard over it equals Jaccard over the words
+    return frozenset(zlib.crc32(w.encode("utf-8")) for w in _WORD_RE.findall((text or "").lower()))
+
+
+class FillCancelled(Exception):
+    """Raised when RunContext.cancel_check asks the run to stop."""
 
 
 # ----------------------------
 # Parameters
 # ----------------------------
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FillParams:
     xlsx_path: str
     output_dir: str
@@ -82,14 +122,20 @@ class FillParams:
     wb_strict: bool
 
     brand_in_title_ratio: str  # "0/100", "50/50", "100/0"
-    rows_to_fill: int
+    rows_to_fill: int        # 0 => every product row (auto-detected)
     skip_first_rows: int
 
     batch_count: int
 
     # uniqueness knobs
     uniqueness: int = 92     # 0..100
-    progress_callback: Optional[Callable[[int], None]] = None
+    category: str = ""       # WB category; picks the title length limit
+    low_memory: bool = False  # streaming read/write for very large templates
+    incremental: bool = False  # regenerate only new/changed/empty rows
+    output_format: str = "xlsx"  # xlsx/csv/jsonl/parquet
+    seed: int = 0            # 0 => random per run; otherwise reproducible (and cached)
+    max_rows_per_file: int = 0  # 0 => one output per batch file; otherwise split into parts
+    archive: str = ""        # ""/zip/tar: every output file + report.json go into one archive
 
 
 # ----------------------------
@@ -130,6 +176,29 @@ SCENARIOS = [
     "вождение", "парк", "летние прогулки", "дневные выходы", "выходные",
 ]
 
+FIRST_PHRASES = [
+    "Очки — отличный аксессуар на каждый день: и образ собирают, и глаза бережёт от яркого солнца.",
+    "Эти очки легко вписываются в любой образ — от повседневного до более нарядного.",
+    "Если хочется добавить образу акцент — такие очки делают это быстро и без лишнего шума.",
+    "Очки смотрятся аккуратно и дорого: подходят и на каждый день, и на поездки, и на отпуск.",
+    "Универсальный вариант: можно носить в городе, на отдыхе и просто на прогулках.",
+    "Это тот самый аксессуар, который “делает” образ — спокойно, уверенно и со вкусом.",
+]
+
+# style shaping
+STYLE_BLOCKS = {
+    "premium": "Визуально очки выглядят собранно: линии ровные, посадка аккуратная, образ получается “дороже”.",
+    "social": "На фото смотрятся очень эффектно — прям тот аксессуар, который сразу цепляет.",
+    "mass": "Простой понятный вариант: носить удобно, выглядит хорошо, подходит под разные вещи.",
+    "neutral": "Сидят комфортно, не перегружают лицо и подходят под разные стили одежды.",
+}
+
+# title length limits per WB category (normalised name), "default" for the rest
+TITLE_LIMITS = {
+    "default": 60,
+    "солнцезащитные очки": 60,
+}
+
 GIFTS = ["подарок", "подарок девушке", "подарок парню", "подарок жене", "подарок мужу", "подарок подруге"]
 
 HOLIDAYS_DEFAULT = ["8 Марта", "14 Февраля", "Новый год", "День рождения", "Выпускной", "День матери", "23 Февраля"]
@@ -140,8 +209,40 @@ SEO_KEYS_COMMON = [
     "очки для города", "очки UV400", "инста очки", "очки из TikTok",
 ]
 
+# synonym groups for descriptions; adjectives are given like SLOGANS (nominative plural)
+# and inflected for gender/case, other words are swapped as is
+ADJ_SYNONYMS = [
+    ["стильные", "модные", "трендовые"],
+    ["красивые", "эффектные", "выразительные"],
+    ["аккуратные", "опрятные", "лаконичные"],
+    ["удобные", "комфортные"],
+    ["отличные", "хорошие", "удачные"],
+    ["повседневные", "ежедневные"],
+    ["нарядные", "праздничные", "элегантные"],
+    ["заметные", "броские"],
+    ["полезные", "практичные", "нужные"],
+    ["лёгкие", "невесомые"],
+    ["ровные", "чёткие"],
+    ["разные", "различные"],
+    ["активные", "динамичные"],
+]
+WORD_SYNONYMS = [
+    ["удобно", "комфортно"],
+    ["подчёркивает", "выделяет"],
+    ["уменьшают", "снижают"],
+    ["часто", "нередко"],
+    ["спокойно", "сдержанно"],
+    ["уверенно", "смело"],
+    ["практично", "функционально"],
+    ["гармонично", "органично"],
+    ["выглядит", "смотрится"],
+    ["выглядят", "смотрятся"],
+    ["быстро", "моментально"],
+    ["носить", "надевать"],
+]
+
 RISK_WORDS = [
-    r"\b100%\b", r"\bлучшие\b", r"\bсамые лучшие\b", r"\bгарантированно\b",
+    r"\b100\s?%", r"\bлучшие\b", r"\bсамые лучшие\b", r"\bгарантированно\b",
     r"\bвылечит\b", r"\bабсолютно\b", r"\bидеально\b",
 ]
 
@@ -149,351 +250,2382 @@ STOP_PHRASES_STRICT = [
     r"\bпо факту\b", r"\bпрям\b", r"\bреально\b", r"\bтоп\b",
 ]
 
+# words WB moderation rejects in cards whatever the mode; whole words,
+# case-insensitive ("banned_words" in the phrase bank replaces the list)
+BANNED_WORDS = [
+    "реплика", "реплики", "копия", "копии", "подделка",
+    "скидка", "скидки", "акция", "распродажа", "лечебные", "медицинские",
+]
+
+
+# ----------------------------
+# Phrase banks (files in data dir)
+# ----------------------------
+PHRASE_BANK_VERSION = 4
+
+# (path, mtime_ns, size) -> parsed value; shared by every job in this process
+_FILE_CACHE: Dict[str, Tuple[int, int, object]] = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
+
+def _load_cached(path: Path, parse: Callable[[Path], object]) -> object:
+    """Parses `path` once and re-parses only when its mtime or size changes."""
+    key = str(path)
+    try:
+        st = path.stat()
+        sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        sig = (-1, -1)
+    with _FILE_CACHE_LOCK:
+        hit = _FILE_CACHE.get(key)
+        if hit and (hit[0], hit[1]) == sig:
+            return hit[2]
+        value = parse(path)
+        _FILE_CACHE[key] = (sig[0], sig[1], value)
+        return value
+
+
+class _HintIndex:
+    """Aho–Corasick automaton over hint keys: the answer of the linear `key in k` scan in one pass."""
+    __slots__ = ("variants", "goto", "fail", "best", "memo")
+
+    _NONE = 1 << 30
+    _MEMO_MAX = 4096
+
+    def __init__(self, hints: Dict[str, Tuple[str, ...]]):
+        self.variants: List[Tuple[str, ...]] = []
+        self.goto: List[Dict[str, int]] = [{}]
+        self.best: List[int] = [self._NONE]
+        for order, (key, variants) in enumerate(hints.items()):
+            self.variants.append(tuple(variants))
+            node = 0
+            for ch in _norm_key(key):
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.best.append(self._NONE)
+                node = nxt
+            if node:
+                self.best[node] = min(self.best[node], order)
+
+        # BFS: failure links, and fold each suffix's best match into the node
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.best[nxt] = min(self.best[nxt], self.best[self.fail[nxt]])
+                queue.append(nxt)
+        self.memo: Dict[str, Optional[Tuple[str, ...]]] = {}
+
+    def resolve(self, raw: str) -> Optional[Tuple[str, ...]]:
+        try:
+            return self.memo[raw]
+        except KeyError:
+            pass
+        goto, fail, best = self.goto, self.fail, self.best
+        node, found = 0, self._NONE
+        for ch in _norm_key(raw):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best[node] < found:
+                found = best[node]
+        res = self.variants[found] if found != self._NONE else None
+        if len(self.memo) >= self._MEMO_MAX:
+            self.memo.clear()
+        self.memo[raw] = res
+        return res
+
+
+@dataclass(frozen=True)
+class PhraseBank:
+    """Interned, read-only phrase lists used by the generators."""
+    version: int
+    slogans: Tuple[str, ...]
+    scenarios: Tuple[str, ...]
+    gifts: Tuple[str, ...]
+    first_phrases: Tuple[str, ...]
+    styles: Dict[str, str]
+    shape_hints: Dict[str, Tuple[str, ...]]
+    lens_hints: Dict[str, Tuple[str, ...]]
+    shape_index: _HintIndex
+    lens_index: _HintIndex
+    title_limits: Dict[str, int]
+    morph: "_Morph"
+    banned: Optional[re.Pattern]
+
+
+# ----------------------------
+# Morphology / synonyms
+# ----------------------------
+CASES = ("nom", "gen", "dat", "acc", "ins", "prep")
+GENDERS = ("m", "f", "n", "pl")
+
+# endings by declension type, GENDERS x CASES (accusative: inanimate)
+_ADJ_ENDINGS = {
+    "hard": ("ый ого ому ый ым ом", "ая ой ой ую ой ой", "ое ого ому ое ым ом", "ые ых ым ые ыми ых"),
+    "hard_stressed": ("ой ого ому ой ым ом", "ая ой ой ую ой ой", "ое ого ому ое ым ом", "ые ых ым ые ыми ых"),
+    "velar": ("ий ого ому ий им ом", "ая ой ой ую ой ой", "ое ого ому ое им ом", "ие их им ие ими их"),
+    "velar_stressed": ("ой ого ому ой им ом", "ая ой ой ую ой ой", "ое ого ому ое им ом", "ие их им ие ими их"),
+    "sibilant": ("ий его ему ий им ем", "ая ей ей ую ей ей", "ее его ему ее им ем", "ие их им ие ими их"),
+    "sibilant_stressed": ("ой ого ому ой им ом", "ая ой ой ую ой ой", "ое ого ому ое им ом", "ие их им ие ими их"),
+    "soft": ("ий его ему ий им ем", "яя ей ей юю ей ей", "ее его ему ее им ем", "ие их им ие ими их"),
+}
+_ADJ_ENDINGS = {k: tuple(e for g in v for e in g.split()) for k, v in _ADJ_ENDINGS.items()}
+
+# masculine singular in stressed -ой (крутой, городской); not derivable from the plural
+ADJ_STRESSED = {
+    "крутые", "простые", "молодые", "городские", "мужские", "дорогие", "большие",
+    "другие", "деловые", "голубые", "цветовые", "боковые", "блатные",
+}
+
+_CYR_WORD_RE = re.compile(r"[А-Яа-яЁё]+")
+# "с"/"со", "в"/"во" right before a swapped word
+_PREP_TAIL_RE = re.compile(r"(?<![\w-])([СсВв])[Оо]?(\s+)$")
+_RU_VOWELS = frozenset("аеёиоуыэюяьъ")
+
+
+def _agree_prep(seg: str, word: str) -> str:
+    """Picks "со"/"во" over "с"/"в" when `word` (which follows `seg`) opens with a hard cluster."""
+    m = _PREP_TAIL_RE.search(seg)
+    if not m:
+        return seg
+    p, w = m.group(1), word.lower()
+    heads = "сзшж" if p in "Сс" else "вф"
+    full = w.startswith(("мн", "щ")) or (len(w) > 1 and w[0] in heads and w[1] not in _RU_VOWELS)
+    return seg[:m.start()] + p + ("о" if full else "") + m.group(2)
+
+
+def adj_forms(plural: str) -> Tuple[str, ...]:
+    """
+    All 24 forms (GENDERS x CASES) of an adjective given in the nominative plural;
+    multi-word entries inflect their last word. Empty if it is not an adjective.
+    """
+    m = list(_CYR_WORD_RE.finditer(plural))
+    if not m:
+        return ()
+    last = m[-1]
+    head, word = plural[:last.start()], last.group(0).lower()
+    if word.endswith("ые"):
+        kind = "hard"
+    elif word.endswith("ие") and len(word) > 2:
+        c = word[-3]
+        kind = "velar" if c in "кгх" else "sibilant" if c in "жшщч" else "soft"
+    else:
+        return ()
+    if word in ADJ_STRESSED and kind != "soft":
+        kind += "_stressed"
+    stem = word[:-2]
+    cap = last.group(0)[0].isupper()
+    return tuple(head + (_cap_first(stem + e) if cap else stem + e) for e in _ADJ_ENDINGS[kind])
+
+
+def inflect(plural: str, gender: str, case: str) -> str:
+    """inflect("Модные", "f", "acc") -> "Модную"; unknown words come back unchanged."""
+    forms = adj_forms(plural)
+    if not forms:
+        return plural
+    return forms[GENDERS.index(gender) * len(CASES) + CASES.index(case)]
+
+
+class _Morph:
+    """Synonym tables: every form of a group member maps to the same-form alternatives."""
+
+    def __init__(self, adj_groups: List[Tuple[str, ...]], word_groups: List[Tuple[str, ...]]):
+        alts: Dict[str, Tuple[str, ...]] = {}
+        for group in adj_groups:
+            paradigms = [f for f in (adj_forms(w.lower()) for w in group) if f]
+            for i, forms in enumerate(paradigms):
+                for tag, form in enumerate(forms):
+                    if form not in alts:
+                        alts[form] = tuple(p[tag] for j, p in enumerate(paradigms) if j != i and p[tag] != form)
+        for group in word_groups:
+            words = [w.lower() for w in group]
+            for w in words:
+                alts.setdefault(w, tuple(x for x in words if x != w))
+        self.alts = {k: v for k, v in alts.items() if v}
+        self._slots: Dict[str, Tuple[Tuple[int, int, str], ...]] = {}
+
+    _SLOTS_MAX = 8192
+
+    def slots(self, text: str) -> Tuple[Tuple[int, int, str], ...]:
+        # (start, end, lowercase word) of every swappable word; sentences repeat, so memoised
+        got = self._slots.get(text)
+        if got is None:
+            got = tuple(
+                (m.start(), m.end(), k) for m in _CYR_WORD_RE.finditer(text) if (k := m.group(0).lower()) in self.alts
+            )
+            if len(self._slots) >= self._SLOTS_MAX:
+                self._slots.clear()
+            self._slots[text] = got
+        return got
+
+    def substitute(self, rnd: random.Random, text: str, rate: float) -> str:
+        """Replaces each known word with a synonym with probability `rate`, keeping its capitalisation."""
+        if rate <= 0:
+            return text
+        out: List[str] = []
+        pos = 0
+        for a, b, k in self.slots(text):
+            if rnd.random() < rate:
+                alt = rnd.choice(self.alts[k])
+                out.append(_agree_prep(text[pos:a], alt))
+                out.append(_cap_first(alt) if text[a].isupper() else alt)
+                pos = b
+        if not out:
+            return text
+        out.append(text[pos:])
+        return "".join(out)
+
+
+def _default_phrase_bank() -> Dict:
+    return {
+        "version": PHRASE_BANK_VERSION,
+        "slogans": SLOGANS,
+        "scenarios": SCENARIOS,
+        "gifts": GIFTS,
+        "first_phrases": FIRST_PHRASES,
+        "styles": STYLE_BLOCKS,
+        "shape_hints": SHAPE_HINTS,
+        "lens_hints": LENS_HINTS,
+        "title_limits": TITLE_LIMITS,
+        "adjective_synonyms": ADJ_SYNONYMS,
+        "word_synonyms": WORD_SYNONYMS,
+        "banned_words": BANNED_WORDS,
+    }
+
+
+def phrase_bank_path() -> Path:
+    return app_data_dir() / "phrase_bank.json"
+
+
+def _parse_phrase_bank(path: Path) -> PhraseBank:
+    d = _default_phrase_bank()
+    if path.exists():
+        try:
+            user = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            user = {}
+        if isinstance(user, dict):
+            # older files simply miss newer sections: defaults fill the gaps
+            for k, v in user.items():
+                if k in d and isinstance(v, type(d[k])) and v:
+                    d[k] = v
+
+    it = sys.intern
+
+    def strs(items) -> Tuple[str, ...]:
+        return tuple(it(str(x).strip()) for x in items if str(x).strip())
+
+    def hints(m: Dict) -> Dict[str, Tuple[str, ...]]:
+        out = {}
+        for k, v in m.items():
+            vv = strs(v if isinstance(v, list) else [v])
+            if _norm_key(k) and vv:
+                out[it(_norm_key(k))] = vv
+        return out
+
+    limits = {}
+    for k, v in d["title_limits"].items():
+        try:
+            if int(v) > 0:
+                limits[_norm_key(k)] = int(v)
+        except (TypeError, ValueError):
+            continue
+
+    shape_hints = hints(d["shape_hints"])
+    lens_hints = hints(d["lens_hints"])
+    banned = sorted(strs(d["banned_words"]), key=len, reverse=True)
+    return PhraseBank(
+        version=int(d.get("version") or PHRASE_BANK_VERSION),
+        slogans=strs(d["slogans"]) or tuple(SLOGANS),
+        scenarios=strs(d["scenarios"]) or tuple(SCENARIOS),
+        gifts=strs(d["gifts"]) or tuple(GIFTS),
+        first_phrases=strs(d["first_phrases"]) or tuple(FIRST_PHRASES),
+        styles={it(_norm_key(k)): it(str(v).strip()) for k, v in d["styles"].items() if str(v).strip()},
+        shape_hints=shape_hints,
+        lens_hints=lens_hints,
+        shape_index=_HintIndex(shape_hints),
+        lens_index=_HintIndex(lens_hints),
+        title_limits=limits,
+        morph=_Morph(
+            [strs(g) for g in d["adjective_synonyms"] if isinstance(g, list)],
+            [strs(g) for g in d["word_synonyms"] if isinstance(g, list)],
+        ),
+        banned=re.compile(r"\b(?:" + "|".join(map(re.escape, banned)) + r")\b", re.IGNORECASE) if banned else None,
+    )
 
-def _pick_shape_phrase(rnd: random.Random, shape: str) -> str:
+
+def load_phrase_bank(path: Optional[Path] = None) -> PhraseBank:
+    """phrase_bank.json from the data dir (defaults written on first use), reloaded when it changes."""
+    p = path or phrase_bank_path()
+    if not p.exists():
+        p.write_text(json.dumps(_default_phrase_bank(), ensure_ascii=False, indent=2), encoding="utf-8")
+    return _load_cached(p, _parse_phrase_bank)
+
+
+def _shape_variants(shape: str, index: _HintIndex) -> List[str]:
     s = (shape or "").strip()
-    k = _norm_key(s)
-    for key, variants in SHAPE_HINTS.items():
-        if key in k:
-            return rnd.choice(variants)
-    return s.lower() if s else ""
+    variants = index.resolve(s)
+    if variants:
+        return list(variants)
+    return [s.lower()] if s else []
 
 
-def _pick_lens_phrase(rnd: random.Random, lenses: str) -> str:
+def _lens_variants(lenses: str, index: _HintIndex) -> List[str]:
     s = (lenses or "").strip()
-    k = _norm_key(s)
-    for key, variants in LENS_HINTS.items():
-        if key in k:
-            return rnd.choice(variants)
-    return s if s else ""
+    variants = index.resolve(s)
+    if variants:
+        return list(variants)
+    return [s] if s else []
 
 
-def _seo_pack(rnd: random.Random, level: str, lenses: str, shape: str) -> List[str]:
-    level = (level or "normal").lower().strip()
-    keys = SEO_KEYS_COMMON[:]
+def _style_block(style: str, styles: Dict[str, str]) -> str:
+    style = (style or "neutral").lower().strip()
+    return styles.get(style) or styles.get("neutral") or STYLE_BLOCKS["neutral"]
 
-    # add hints
-    lp = _pick_lens_phrase(rnd, lenses)
-    sp = _pick_shape_phrase(rnd, shape)
-    if lp:
-        keys.append(f"очки {lp}".lower())
-    if sp:
-        keys.append(f"очки {sp}".lower())
 
-    # unique shuffle
-    rnd.shuffle(keys)
+def _lens_block(lp: str) -> str:
+    k = _norm_key(lp)
+    if "uv400" in k:
+        return "Линзы UV400 помогают чувствовать себя комфортно при ярком солнце — хороший вариант для города, дороги и отдыха."
+    if "поляр" in k:
+        return "Поляризационные линзы уменьшают блики — удобно за рулём, у воды и в солнечные дни в городе."
+    if "фотох" in k or "хамелеон" in k:
+        return "Фотохромные линзы (хамелеон) подстраиваются под свет — комфортнее, когда освещение меняется в течение дня."
+    return f"Линзы: {lp}. Комфортно в солнечную погоду и в активных сценариях дня."
 
-    if level == "low":
-        return keys[:4]
-    if level == "high":
-        return keys[:9]
-    return keys[:6]
 
+KEYS_SENTENCE_TEMPLATES = [
+    "По запросам люди ищут так: {keys}.",
+    "Если подбирать по поиску, обычно ищут: {keys}.",
+    "В поиске часто пишут: {keys}.",
+]
 
-def _insert_holidays_block(rnd: random.Random, holidays: str) -> str:
-    raw = (holidays or "").strip()
-    if raw:
-        items = [x.strip() for x in raw.split("||") if x.strip()]
-    else:
-        # sometimes none
-        items = []
-    if not items:
-        return ""
 
-    joined = _join_ru_list(items)
+# ----------------------------
+# Normalised generation spec
+# ----------------------------
+@dataclass
+class _GenSpec:
+    """FillParams generation fields, normalised and pre-resolved once per job."""
+    brand_lat: str
+    brand_ru: str
+    slogans: Tuple[str, ...]        # without safe/strict/banned words
+    title_collection: str
+    collection: str
+    shape_variants: List[str]
+    lens_variants: List[str]
+    lens_blocks: Dict[str, str]
+    seo_keys_extra: Dict[str, str]
+    holidays_joined: str
+    holiday_pos: str
+    seo_count: int
+    style_block: str
+    include_brand: Optional[bool]   # None => 50/50 per row
+    wb_safe: bool
+    wb_strict: bool
+    sim_limit: float
+    first_ids: Dict[str, int]
+    title_limit: int
+    bank: PhraseBank
+
+
+def _prepare_spec(params: FillParams, bank: PhraseBank) -> _GenSpec:
+    shape_variants = _shape_variants(params.shape, bank.shape_index)
+    lens_variants = _lens_variants(params.lenses, bank.lens_index)
+
+    ratio = (params.brand_in_title_ratio or "50/50").strip()
+    include_brand: Optional[bool] = None
+    if ratio == "0/100":
+        include_brand = False
+    elif ratio == "100/0":
+        include_brand = True
+
+    level = (params.seo_level or "normal").lower().strip()
+    seo_count = {"low": 4, "high": 9}.get(level, 6)
+
+    raw_h = (params.holidays or "").strip()
+    h_items = [x.strip() for x in raw_h.split("||") if x.strip()] if raw_h else []
+
+    # uniqueness 0 => any overlap, 100 => DESC_SIM_FLOOR (92 => ~0.37)
+    uniqueness = max(0, min(100, int(params.uniqueness)))
+
+    # titles are not filtered word by word (the slogan leads the title):
+    # slogans that safe/strict mode or the banned list would hit are dropped
+    filters = [p for on, p in ((params.wb_safe_mode, _RISK_RE), (params.wb_strict, _STRICT_RE), (True, bank.banned)) if on and p]
+    slogans = tuple(x for x in bank.slogans if not any(p.search(x) for p in filters)) or bank.slogans
+
+    collection = params.collection or ""
+    return _GenSpec(
+        brand_lat=params.brand_lat or "",
+        brand_ru=params.brand_ru or "",
+        slogans=slogans,
+        title_collection=collection.replace("–", "-"),
+        collection=collection,
+        shape_variants=shape_variants,
+        lens_variants=lens_variants,
+        lens_blocks={lp: _lens_block(lp) for lp in lens_variants},
+        seo_keys_extra={
+            p: f"очки {p}".lower() for p in shape_variants + lens_variants
+        },
+        holidays_joined=_join_ru_list(h_items),
+        holiday_pos=(params.holiday_pos or "middle").lower(),
+        seo_count=seo_count,
+        style_block=_style_block(params.style, bank.styles),
+        include_brand=include_brand,
+        wb_safe=bool(params.wb_safe_mode),
+        wb_strict=bool(params.wb_strict),
+        sim_limit=1.0 - uniqueness / 100 * (1.0 - DESC_SIM_FLOOR),
+        first_ids={x: i for i, x in enumerate(bank.first_phrases)},
+        title_limit=title_limit_for(params.category, bank),
+        bank=bank,
+    )
+
+
+# ----------------------------
+# SEO keywords (weighted)
+# ----------------------------
+def seo_keys_path() -> Path:
+    return app_data_dir() / "seo_keys.txt"
+
+
+def load_seo_keywords(path: Optional[Path] = None) -> Tuple[List[str], List[float]]:
+    """
+    Reads "phrase<TAB>weight" or "phrase;weight" lines (WB search stats export).
+    A line without a weight counts as 1. Falls back to SEO_KEYS_COMMON.
+    """
+    p = path or seo_keys_path()
+    phrases: List[str] = []
+    weights: List[float] = []
+    seen: Dict[str, int] = {}
+    if p.exists():
+        for ln in p.read_text(encoding="utf-8").splitlines():
+            ln = ln.strip()
+            if not ln or ln.startswith("#"):
+                continue
+            phrase, w = ln, 1.0
+            m = re.match(r"^(.*?)[\t;]\s*([0-9]+(?:[.,][0-9]+)?)\s*$", ln)
+            if m:
+                phrase, w = m.group(1).strip(), float(m.group(2).replace(",", "."))
+            k = _norm_key(phrase)
+            if not k or w <= 0:
+                continue
+            if k in seen:
+                i = seen[k]
+                weights[i] = max(weights[i], w)
+                continue
+            seen[k] = len(phrases)
+            phrases.append(phrase)
+            weights.append(w)
+    if not phrases:
+        return SEO_KEYS_COMMON[:], [1.0] * len(SEO_KEYS_COMMON)
+    return phrases, weights
+
+
+class _AliasTable:
+    """Vose alias table: O(n) build, O(1) weighted draw."""
+    __slots__ = ("n", "prob", "alias")
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = float(sum(weights)) or 1.0
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, x in enumerate(scaled) if x < 1.0]
+        large = [i for i, x in enumerate(scaled) if x >= 1.0]
+        while small and large:
+            lo = small.pop()
+            hi = large.pop()
+            prob[lo] = scaled[lo]
+            alias[lo] = hi
+            scaled[hi] = scaled[hi] + scaled[lo] - 1.0
+            if scaled[hi] < 1.0:
+                small.append(hi)
+            else:
+                large.append(hi)
+        self.n = n
+        self.prob = prob
+        self.alias = alias
+
+    def draw(self, rnd: random.Random) -> int:
+        i = int(rnd.random() * self.n)
+        return i if rnd.random() < self.prob[i] else self.alias[i]
+
+
+class KeywordSampler:
+    """Weighted keyword sampling from an alias table; often used phrases are drawn less."""
+
+    def __init__(self, phrases: List[str], weights: List[float]):
+        self.phrases: Optional[List[str]] = phrases
+        self.table: Optional[_AliasTable] = _AliasTable(weights)
+        self.uses = array("I", bytes(4 * len(phrases)))
+        self.draws = 0
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None, usage: Optional["KeywordSampler"] = None) -> "KeywordSampler":
+        """Builds the sampler; `usage` (e.g. an unpickled one) carries counters over."""
+        phrases, weights = _load_cached(path or seo_keys_path(), load_seo_keywords)
+        ks = cls(phrases, weights)
+        if usage is not None and len(usage.uses) == len(ks.uses):
+            ks.uses = array("I", usage.uses)
+            ks.draws = usage.draws
+        return ks
+
+    def stale(self, path: Optional[Path] = None) -> bool:
+        """True once the keyword file changed since this sampler was built."""
+        return self.phrases is not _load_cached(path or seo_keys_path(), load_seo_keywords)[0]
+
+    def __getstate__(self):
+        # phrases and the alias table are rebuilt from the data file
+        return {"uses": self.uses.tobytes(), "draws": self.draws}
+
+    def __setstate__(self, st):
+        self.phrases = None
+        self.table = None
+        self.uses = array("I")
+        self.uses.frombytes(st["uses"])
+        self.draws = st["draws"]
+
+    def pick(self, rnd: random.Random, count: int) -> List[int]:
+        """Draws `count` distinct phrase ids; usage is only counted by note()."""
+        n = len(self.phrases)
+        count = max(0, min(count, n))
+        rounds = self.draws // max(n, 1)
+        picked: List[int] = []
+        taken: Set[int] = set()
+        budget = 8 * count + 32
+        while len(picked) < count:
+            i = self.table.draw(rnd)
+            if i in taken:
+                budget -= 1
+                if budget <= 0:
+                    # pathological weights: take the rest in order
+                    picked.extend(j for j in range(n) if j not in taken)
+                    picked = picked[:count]
+                    break
+                continue
+            over = self.uses[i] - rounds
+            if budget > 0 and over > 0 and rnd.random() * (1 + over) >= 1.0:
+                budget -= 1
+                continue
+            picked.append(i)
+            taken.add(i)
+        return picked
+
+    def note(self, ids: Sequence[int]) -> None:
+        for i in ids:
+            self.uses[i] += 1
+        self.draws += len(ids)
+
+    def coverage(self) -> Dict[str, int]:
+        return {
+            "keywords_total": len(self.phrases),
+            "keywords_used": sum(1 for u in self.uses if u),
+            "keyword_draws": self.draws,
+        }
+
+
+# how many previous descriptions the near-duplicate check looks at
+RECENT_DESCS = 12
+# words in over DESC_TEMPLATE_SHARE of the recent descriptions (once there
+# are DESC_TEMPLATE_MIN) are template text: the similarity leaves them out
+DESC_TEMPLATE_MIN = 4
+DESC_TEMPLATE_SHARE = 0.5
+DESC_SIM_FLOOR = 0.32   # sim_limit at uniqueness 100
+
+
+@dataclass(slots=True)
+class _RowDraft:
+    """A generated row before GenState.commit(), with its share of the report counters."""
+    title: str = ""
+    desc: str = ""
+    title_hash: int = 0
+    first_id: int = -1
+    keys: List[int] = field(default_factory=list)
+    words: FrozenSet[int] = frozenset()
+    title_retries: int = 0
+    title_dupe: bool = False
+    desc_rewrite: bool = False
+    mutation_attempts: int = 0
+    sim_missed: bool = False
+
+
+@dataclass(slots=True)
+class GenState:
+    """Anti-duplicate state shared by every row of one job; fingerprints only, so it pickles small."""
+    used_titles: Set[int] = field(default_factory=set)
+    used_first_phrases: Set[int] = field(default_factory=set)
+    recent_descs: Deque[FrozenSet[int]] = field(default_factory=lambda: deque(maxlen=RECENT_DESCS))
+    keywords: Optional[KeywordSampler] = None
+    bank: Optional[PhraseBank] = None
+
+    # counters for the report
+    rows: int = 0
+    title_retries: int = 0
+    title_dupes: int = 0
+    desc_rewrites: int = 0
+    mutation_attempts: int = 0
+    sim_missed: int = 0
+    violations: Dict[str, int] = field(default_factory=dict)
+    violations_left: Dict[str, int] = field(default_factory=dict)
+    rows_revalidated: int = 0
+
+    def commit(self, row: _RowDraft) -> None:
+        """Registers a kept row; candidates that fail validation are never committed."""
+        self.used_titles.add(row.title_hash)
+        if row.first_id >= 0:
+            self.used_first_phrases.add(row.first_id)
+        if self.keywords is not None:
+            self.keywords.note(row.keys)
+        self.recent_descs.append(row.words)
+        self.rows += 1
+        self.title_retries += row.title_retries
+        self.title_dupes += row.title_dupe
+        self.desc_rewrites += row.desc_rewrite
+        self.mutation_attempts += row.mutation_attempts
+        self.sim_missed += row.sim_missed
+
+    def absorb(self, title: str, desc: str, first_id: int, keys: Sequence[int]) -> None:
+        """Registers an already generated row (e.g. from the cache) exactly as commit() did."""
+        self.commit(_RowDraft(
+            title=title, desc=desc, title_hash=_fp64(_norm_key(title)),
+            first_id=first_id, keys=list(keys), words=_text_fp(desc),
+        ))
+
+    def reserve_title(self, title: str) -> None:
+        """Marks a title already in the output (a row kept by an incremental run) as used."""
+        if title and str(title).strip():
+            self.used_titles.add(_fp64(_norm_key(str(title))))
+
+    def digest(self) -> str:
+        """Fingerprint of the uniqueness state (not the report counters)."""
+        uses = self.keywords.uses if self.keywords is not None else ()
+        raw = "|".join(map(str, (
+            self.rows, len(self.used_titles), sum(self.used_titles), sorted(self.used_first_phrases),
+            [sorted(d) for d in self.recent_descs], sum(i * u for i, u in enumerate(uses)),
+        )))
+        return f"{_fp64(raw):016x}"
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "rows_generated": self.rows,
+            "distinct_titles": len(self.used_titles),
+            "title_retries": self.title_retries,
+            "title_duplicates_left": self.title_dupes,
+            "desc_rewrites": self.desc_rewrites,
+            "desc_mutation_attempts": self.mutation_attempts,
+            "desc_sim_limit_missed": self.sim_missed,
+        }
+
+    def validation(self) -> Dict:
+        return {
+            "violations": dict(self.violations),
+            "rows_regenerated": self.rows_revalidated,
+            "violations_left": dict(self.violations_left),
+        }
+
+    def __getstate__(self):
+        return {
+            "used_titles": array("Q", self.used_titles).tobytes(),
+            "used_first_phrases": array("I", self.used_first_phrases).tobytes(),
+            "recent_descs": [array("I", d).tobytes() for d in self.recent_descs],
+            "keywords": self.keywords,
+            "counters": (self.rows, self.title_retries, self.title_dupes, self.desc_rewrites,
+                         self.mutation_attempts, self.sim_missed),
+            "validation": (self.violations, self.violations_left, self.rows_revalidated),
+        }
+
+    def __setstate__(self, st):
+        def ints(code: str, raw: bytes) -> array:
+            a = array(code)
+            a.frombytes(raw)
+            return a
+
+        self.used_titles = set(ints("Q", st["used_titles"]))
+        self.used_first_phrases = set(ints("I", st["used_first_phrases"]))
+        self.recent_descs = deque((frozenset(ints("I", d)) for d in st["recent_descs"]), maxlen=RECENT_DESCS)
+        self.keywords = st["keywords"]
+        self.bank = None
+        (self.rows, self.title_retries, self.title_dupes, self.desc_rewrites,
+         self.mutation_attempts, self.sim_missed) = st["counters"]
+        self.violations, self.violations_left, self.rows_revalidated = st["validation"]
+
+    def to_json(self) -> Dict:
+        """The pickled state as plain JSON (checkpoints): byte arrays go as base64."""
+        st = self.__getstate__()
+        kw = st["keywords"].__getstate__() if st["keywords"] is not None else None
+        b64 = lambda raw: base64.b64encode(raw).decode("ascii")
+        return {
+            "used_titles": b64(st["used_titles"]),
+            "used_first_phrases": b64(st["used_first_phrases"]),
+            "recent_descs": [b64(d) for d in st["recent_descs"]],
+            "keywords": {"uses": b64(kw["uses"]), "draws": kw["draws"]} if kw else None,
+            "counters": list(st["counters"]),
+            "validation": [st["validation"][0], st["validation"][1], st["validation"][2]],
+        }
+
+    @classmethod
+    def from_json(cls, d: Dict) -> "GenState":
+        """Inverse of to_json(); raises on malformed input."""
+        raw = lambda v: base64.b64decode(v.encode("ascii"), validate=True)
+        keywords = None
+        if d["keywords"] is not None:
+            keywords = KeywordSampler.__new__(KeywordSampler)
+            keywords.__setstate__({"uses": raw(d["keywords"]["uses"]), "draws": int(d["keywords"]["draws"])})
+        violations, violations_left, revalidated = d["validation"]
+        state = cls()
+        state.__setstate__({
+            "used_titles": raw(d["used_titles"]),
+            "used_first_phrases": raw(d["used_first_phrases"]),
+            "recent_descs": [raw(x) for x in d["recent_descs"]],
+            "keywords": keywords,
+            "counters": tuple(int(x) for x in d["counters"]),
+            "validation": (
+                {str(k): int(v) for k, v in violations.items()},
+                {str(k): int(v) for k, v in violations_left.items()},
+                int(revalidated),
+            ),
+        })
+        return state
+
+
+@dataclass
+class RunContext:
+    """Mutable per-run state (callbacks, master RNG, uniqueness state); FillParams stays shareable."""
+    progress_callback: Optional[Callable[[int], None]] = None
+    cancel_check: Optional[Callable[[], bool]] = None
+    rnd: random.Random = field(default_factory=random.Random)
+    state: GenState = field(default_factory=GenState)
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])  # ties log lines of one run together
+
+    def check_cancelled(self) -> None:
+        if self.cancel_check and self.cancel_check():
+            raise FillCancelled()
+
+    def report_progress(self, pct: float) -> None:
+        if self.progress_callback:
+            self.progress_callback(int(pct))
+
+
+# ----------------------------
+# Run log / metrics
+# ----------------------------
+RUN_LOG_MAX_MB = 5
+RUN_LOG_BACKUPS = 3
+METRICS_PREFIX = "sunglasses_seo"
+
+_run_log_lock = threading.Lock()
+
+
+def logs_dir() -> Path:
+    p = app_data_dir() / "logs"
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        rec = {"ts": round(record.created, 3), "level": record.levelname.lower(), "event": record.getMessage()}
+        rec.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            rec["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(rec, ensure_ascii=False, default=str)
+
+
+def run_logger() -> logging.Logger:
+    """JSON-lines logger writing to logs/runs.jsonl (rotated by size)."""
+    log = logging.getLogger("sunglasses_seo.runs")
+    path = os.path.abspath(logs_dir() / "runs.jsonl")
+    # other handlers (a host app, pytest capture) don't count; the data dir may move
+    own = [h for h in log.handlers if isinstance(h, RotatingFileHandler)]
+    if any(h.baseFilename == path for h in own):
+        return log
+    with _run_log_lock:
+        for h in own:
+            if h.baseFilename != path:
+                log.removeHandler(h)
+                h.close()
+        if not any(isinstance(h, RotatingFileHandler) for h in log.handlers):
+            h = RotatingFileHandler(
+                path, maxBytes=RUN_LOG_MAX_MB * 1024 * 1024,
+                backupCount=RUN_LOG_BACKUPS, encoding="utf-8",
+            )
+            h.setFormatter(_JsonLineFormatter())
+            log.addHandler(h)
+            log.setLevel(logging.INFO)
+            log.propagate = False
+    return log
+
+
+def log_event(event: str, level: int = logging.INFO, exc_info=None, **fields) -> None:
+    # logging must never break a run (read-only data dir, full disk, ...)
+    try:
+        run_logger().log(level, event, exc_info=exc_info, extra={"fields": fields})
+    except Exception:
+        pass
+
+
+class _Metrics:
+    """Process-wide counters, rendered in the Prometheus text format."""
+
+    COUNTERS = {
+        "fills_total": "Fill runs by outcome",
+        "files_total": "Output files written",
+        "rows_total": "Rows filled",
+        "rows_from_cache_total": "Rows served from the generation cache",
+        "stage_seconds_total": "Wall time per stage",
+        "title_retries_total": "Title regenerations for uniqueness",
+        "desc_rewrites_total": "Descriptions rewritten for uniqueness",
+        "validation_violations_total": "Rows regenerated after WB validation",
+        "service_rows_total": "Rows generated by wb_service /generate",
+    }
+    GAUGES = {
+        "last_rows_per_second": "Throughput of the last finished fill",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def inc(self, name: str, v: float = 1.0, **labels) -> None:
+        k = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[k] = self.values.get(k, 0.0) + v
+
+    def set(self, name: str, v: float, **labels) -> None:
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = float(v)
+
+    def text(self) -> str:
+        with self.lock:
+            items = sorted(self.values.items())
+        out: List[str] = []
+        for kind, names in (("counter", self.COUNTERS), ("gauge", self.GAUGES)):
+            for name, help_ in names.items():
+                full = f"{METRICS_PREFIX}_{name}"
+                out.append(f"# HELP {full} {help_}")
+                out.append(f"# TYPE {full} {kind}")
+                for (n, labels), v in items:
+                    if n == name:
+                        lab = ",".join(f'{a}="{b}"' for a, b in labels)
+                        out.append(f"{full}{{{lab}}} {v:g}" if lab else f"{full} {v:g}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = _Metrics()
+
+
+def dump_metrics(path: Optional[Path] = None) -> Path:
+    """
+    Writes METRICS as Prometheus text (logs/metrics.prom by default), e.g.
+    for node_exporter's textfile collector.
+    """
+    p = path or logs_dir() / "metrics.prom"
+    tmp = p.with_suffix(".tmp")
+    tmp.write_text(METRICS.text(), encoding="utf-8")
+    os.replace(tmp, p)
+    return p
+
+
+def _seo_pack(rnd: random.Random, spec: _GenSpec, keywords: KeywordSampler) -> Tuple[List[str], List[int]]:
+    """(keys for the sentence, ids of the sampled keywords among them)."""
+    # product-specific hints go first-class into the pack about half the time
+    extra = []
+    lp = rnd.choice(spec.lens_variants) if spec.lens_variants else ""
+    sp = rnd.choice(spec.shape_variants) if spec.shape_variants else ""
+    if lp and rnd.random() < 0.5:
+        extra.append(spec.seo_keys_extra[lp])
+    if sp and rnd.random() < 0.5:
+        extra.append(spec.seo_keys_extra[sp])
+
+    phrases = keywords.phrases
+    ids = [i for i in keywords.pick(rnd, spec.seo_count) if phrases[i].lower() not in extra]
+    ids = ids[:max(0, spec.seo_count - len(extra))]
+    keys = (extra + [phrases[i] for i in ids])[:spec.seo_count]
+    rnd.shuffle(keys)
+    return keys, ids
+
+
+def _insert_holidays_block(rnd: random.Random, joined: str, gifts: Tuple[str, ...]) -> str:
+    if not joined:
+        return ""
 
     variants = [
-        f"Часто берут {rnd.choice(GIFTS)} к {joined}: аксессуар заметный и полезный.",
+        f"Часто берут {rnd.choice(gifts)} к {joined}: аксессуар заметный и полезный.",
         f"К {joined} — отличный вариант, если хочется подарок “и красивый, и нужный”.",
         f"На {joined} такие очки берут часто: и образ собирают, и глаза защищают.",
     ]
     return rnd.choice(variants)
 
 
+# compiled once; longer phrases first so "самые лучшие" wins over "лучшие"
+_RISK_RE = re.compile("|".join(sorted(RISK_WORDS, key=len, reverse=True)), re.IGNORECASE)
+_STRICT_RE = re.compile("|".join(sorted(STOP_PHRASES_STRICT, key=len, reverse=True)), re.IGNORECASE)
+_SPACES_RE = re.compile(r"\s{2,}")
+
+
 def _apply_safe_mode(text: str) -> str:
-    t = text
-    for pat in RISK_WORDS:
-        t = re.sub(pat, "", t, flags=re.IGNORECASE)
-    t = re.sub(r"\s{2,}", " ", t).strip()
-    return t
+    return _SPACES_RE.sub(" ", _RISK_RE.sub("", text)).strip()
 
 
 def _apply_strict(text: str) -> str:
-    t = text
-    for pat in STOP_PHRASES_STRICT:
-        t = re.sub(pat, "", t, flags=re.IGNORECASE)
-    t = re.sub(r"\s{2,}", " ", t).strip()
+    return _SPACES_RE.sub(" ", _STRICT_RE.sub("", text)).strip()
+
+
+# ----------------------------
+# WB validation
+# ----------------------------
+DESC_MAX_LEN = 5000      # WB card description limit
+VALIDATE_ROUNDS = 3      # regeneration attempts per row before a violation is reported as left
+
+# ", ,"  ",."  ".,"  ".."  (not "...")  and a space before a punctuation mark
+_DOUBLE_PUNCT_RE = re.compile(r"[,;:]\s*[,.;:!?]|[.!?]\s*[,;:]|(?<!\.)\.\s*\.(?!\.)|\s[,;:!?]|\s\.(?!\.)")
+
+
+def _row_violations(spec: _GenSpec, title: str, desc: str) -> List[str]:
+    """Violated checks of one row (title/description length, banned/risk words, punctuation)."""
+    bad: List[str] = []
+    if len(title) > spec.title_limit:
+        bad.append("title_length")
+    if len(desc) > DESC_MAX_LEN:
+        bad.append("desc_length")
+    banned = spec.bank.banned
+    if banned and (banned.search(title) or banned.search(desc)):
+        bad.append("banned_words")
+    # safe mode cuts risk words from descriptions, not from user inputs in titles
+    if spec.wb_safe and _RISK_RE.search(title):
+        bad.append("risk_words")
+    if spec.wb_strict and (_STRICT_RE.search(title) or _STRICT_RE.search(desc)):
+        bad.append("stop_phrases")
+    if _DOUBLE_PUNCT_RE.search(title) or _DOUBLE_PUNCT_RE.search(desc):
+        bad.append("punctuation")
+    return bad
+
+
+def title_limit_for(category: str, bank: Optional[PhraseBank] = None) -> int:
+    limits = bank.title_limits if bank else TITLE_LIMITS
+    return limits.get(_norm_key(category)) or limits.get("default") or TITLE_LIMITS["default"]
+
+
+def _pack_title(head: List[str], optional: List[str], limit: int) -> str:
+    """Joins `head` plus the best subset of `optional` fragments within `limit`, earlier ones first."""
+    head = [x for x in head if x]
+    opt = [x for x in optional if x]
+    base = sum(len(x) for x in head) + max(0, len(head) - 1)
+    widths = [len(x) + 1 for x in opt]  # +1 for the joining space
+
+    n = len(opt)
+    table = [0] * (1 << n)
+    best_mask, best_score = 0, (-1, -1)
+    for mask in range(1 << n):
+        if mask:
+            low = mask & -mask
+            table[mask] = table[mask ^ low] + widths[low.bit_length() - 1]
+        width = base + table[mask]
+        if width > limit:
+            continue
+        # bit i of the mask is fragment i; earlier fragments weigh more
+        prio = sum(1 << (n - 1 - i) for i in range(n) if mask >> i & 1)
+        if (prio, width) > best_score:
+            best_mask, best_score = mask, (prio, width)
+
+    t = " ".join(head + [opt[i] for i in range(n) if best_mask >> i & 1]).strip()
+    if len(t) > limit:
+        # head alone is too long: cut on a word boundary
+        cut = t[:limit + 1].rsplit(" ", 1)[0] if " " in t[:limit + 1] else t[:limit]
+        t = cut.rstrip()
     return t
 
 
 def _make_title(
     rnd: random.Random,
-    brand_lat: str,
-    brand_ru: str,
-    shape: str,
-    lenses: str,
-    collection: str,
-    ratio: str,
-    used_titles: Set[str],
-) -> str:
+    spec: _GenSpec,
+    slogan: str,
+    prod: str,
+    include_brand: bool,
+    extras: List[str],
+    state: GenState,
+    row: _RowDraft,
+) -> None:
     # First word must be slogan (per your requirement)
-    slogan = rnd.choice(SLOGANS)
-    prod = rnd.choice(PRODUCT_WORDS)
-
-    # choose include brand in title or not
-    ratio = (ratio or "50/50").strip()
-    include_brand = True
-    if ratio == "0/100":
-        include_brand = False
-    elif ratio == "100/0":
-        include_brand = True
-    else:
-        include_brand = rnd.random() < 0.5
-
-    # shape/lens snippets (optional)
-    sp = _pick_shape_phrase(rnd, shape)
-    lp = _pick_lens_phrase(rnd, lenses)
-
-    extras = []
-    # add either lens or shape or both
-    if lp and rnd.random() < 0.70:
-        extras.append(lp)
-    if sp and rnd.random() < 0.55:
-        # do not shout in CAPS, use normal
-        extras.append(sp)
-
-    # collection snippet sometimes
-    if collection and rnd.random() < 0.35:
-        extras.append(collection.replace("–", "-"))
-
-    # build candidates with small permutations
-    parts = [slogan, prod]
-    if include_brand and brand_ru:
-        parts.append(brand_ru)  # TITLE uses RU
-    parts.extend(extras)
+    optional = []
+    if include_brand and spec.brand_ru:
+        optional.append(spec.brand_ru)  # TITLE uses RU
+    optional.extend(extras)
 
-    # keep <= 60 chars, avoid cut words: just drop last parts until fits
-    def join(p: List[str]) -> str:
-        return " ".join([x for x in p if x]).strip()
-
-    t = join(parts)
-    while len(t) > 60 and len(parts) > 2:
-        parts.pop()  # drop tail
-        t = join(parts)
-
-    # if still too long, shorten by removing collection first
-    if len(t) > 60:
-        t = t[:60].rstrip()
+    # keep within the category limit without cutting words
+    t = _pack_title([slogan, prod], optional, spec.title_limit)
 
     # anti-duplicate within generation
-    base = _norm_key(t)
-    if base in used_titles:
+    used_titles = state.used_titles
+    h = _fp64(_norm_key(t))
+    if h in used_titles:
         # slight variation
         for _ in range(6):
-            slogan2 = rnd.choice([s for s in SLOGANS if s != slogan] or SLOGANS)
-            parts2 = parts[:]
-            parts2[0] = slogan2
-            t2 = join(parts2)
-            while len(t2) > 60 and len(parts2) > 2:
-                parts2.pop()
-                t2 = join(parts2)
-            if _norm_key(t2) not in used_titles:
-                t = t2
+            row.title_retries += 1
+            slogans = spec.slogans
+            slogan2 = rnd.choice([s for s in slogans if s != slogan] or slogans)
+            t2 = _pack_title([slogan2, prod], optional, spec.title_limit)
+            h2 = _fp64(_norm_key(t2))
+            if h2 not in used_titles:
+                t, h = t2, h2
                 break
+        else:
+            row.title_dupe = True
 
-    used_titles.add(_norm_key(t))
-    return t
+    row.title, row.title_hash = t, h
+
+
+def _shape_sentence(sp: str) -> str:
+    return (
+        f"Форма {sp} подчёркивает черты лица и добавляет образу выразительности. "
+        f"Смотрится гармонично и в повседневном стиле, и в более нарядном."
+    )
+
+
+def _scenarios_sentence(rnd: random.Random, scenarios: Tuple[str, ...]) -> str:
+    sc = rnd.sample(scenarios, k=min(4, len(scenarios)))
+    return (
+        f"Подходит для таких сценариев: {', '.join(sc)}. "
+        f"Можно брать себе или на подарок — практично и красиво."
+    )
 
 
 def _make_description(
     rnd: random.Random,
-    brand_lat: str,
-    shape: str,
-    lenses: str,
-    collection: str,
-    holidays: str,
-    holiday_pos: str,
-    seo_level: str,
-    style: str,
-    wb_safe: bool,
-    wb_strict: bool,
-    used_first_phrases: Set[str],
-    used_descs: List[str],
-    uniqueness: int,
-) -> str:
+    spec: _GenSpec,
+    sp: str,
+    lp: str,
+    with_collection: bool,
+    keys_template: str,
+    brand_insert: str,
+    state: GenState,
+    row: _RowDraft,
+) -> None:
     # We want “народная” подача, но логично, как в твоём примере.
     # No labels like "Коллекция:" "Сценарии:" etc.
 
-    sp = _pick_shape_phrase(rnd, shape)
-    lp = _pick_lens_phrase(rnd, lenses)
-
     # first phrase pool (anti-monotony)
-    first_pool = [
-        "Очки — отличный аксессуар на каждый день: и образ собирают, и глаза бережёт от яркого солнца.",
-        "Эти очки легко вписываются в любой образ — от повседневного до более нарядного.",
-        "Если хочется добавить образу акцент — такие очки делают это быстро и без лишнего шума.",
-        "Очки смотрятся аккуратно и дорого: подходят и на каждый день, и на поездки, и на отпуск.",
-        "Универсальный вариант: можно носить в городе, на отдыхе и просто на прогулках.",
-        "Это тот самый аксессуар, который “делает” образ — спокойно, уверенно и со вкусом.",
-    ]
+    first_pool = list(spec.bank.first_phrases)
     rnd.shuffle(first_pool)
 
+    used_first_phrases = state.used_first_phrases
     first = first_pool[0]
     # anti-duplicate starts
     for cand in first_pool:
-        k = _norm_key(cand)
-        if k not in used_first_phrases:
+        if spec.first_ids[cand] not in used_first_phrases:
             first = cand
-            used_first_phrases.add(k)
             break
+    row.first_id = spec.first_ids[first]
 
-    # middle blocks
-    blocks = []
-
-    # style shaping
-    style = (style or "neutral").lower().strip()
-    if style == "premium":
-        blocks.append("Визуально очки выглядят собранно: линии ровные, посадка аккуратная, образ получается “дороже”.")
-    elif style == "social":
-        blocks.append("На фото смотрятся очень эффектно — прям тот аксессуар, который сразу цепляет.")
-    elif style == "mass":
-        blocks.append("Простой понятный вариант: носить удобно, выглядит хорошо, подходит под разные вещи.")
-    else:
-        blocks.append("Сидят комфортно, не перегружают лицо и подходят под разные стили одежды.")
+    # middle blocks, tagged by kind so the mutation step knows what it may swap
+    blocks = [("style", spec.style_block)]
 
     # shape paragraph
     if sp:
-        blocks.append(
-            f"Форма {sp} подчёркивает черты лица и добавляет образу выразительности. "
-            f"Смотрится гармонично и в повседневном стиле, и в более нарядном."
-        )
+        blocks.append(("shape", _shape_sentence(sp)))
 
     # lens paragraph
     if lp:
-        if "uv400" in _norm_key(lp):
-            blocks.append("Линзы UV400 помогают чувствовать себя комфортно при ярком солнце — хороший вариант для города, дороги и отдыха.")
-        elif "поляр" in _norm_key(lp):
-            blocks.append("Поляризационные линзы уменьшают блики — удобно за рулём, у воды и в солнечные дни в городе.")
-        elif "фотох" in _norm_key(lp) or "хамелеон" in _norm_key(lp):
-            blocks.append("Фотохромные линзы (хамелеон) подстраиваются под свет — комфортнее, когда освещение меняется в течение дня.")
-        else:
-            blocks.append(f"Линзы: {lp}. Комфортно в солнечную погоду и в активных сценариях дня.")
+        blocks.append(("lens", spec.lens_blocks[lp]))
 
     # scenarios
-    sc = rnd.sample(SCENARIOS, k=4)
-    blocks.append(
-        f"Подходит для таких сценариев: {', '.join(sc)}. "
-        f"Можно брать себе или на подарок — практично и красиво."
-    )
+    blocks.append(("scenarios", _scenarios_sentence(rnd, spec.bank.scenarios)))
 
     # collection mention (no label)
-    if collection and rnd.random() < 0.75:
-        blocks.append(f"Сезон {collection}: модель выглядит актуально и легко сочетается с летним гардеробом.")
+    if spec.collection and with_collection:
+        blocks.append(("collection", f"Сезон {spec.collection}: модель выглядит актуально и легко сочетается с летним гардеробом."))
 
     # holiday block
-    hb = _insert_holidays_block(rnd, holidays)
+    hb = _insert_holidays_block(rnd, spec.holidays_joined, spec.bank.gifts)
     if hb:
-        if (holiday_pos or "middle").lower() == "start":
-            blocks.insert(0, hb)
-        elif (holiday_pos or "middle").lower() == "end":
-            blocks.append(hb)
+        if spec.holiday_pos == "start":
+            blocks.insert(0, ("holiday", hb))
+        elif spec.holiday_pos == "end":
+            blocks.append(("holiday", hb))
         else:
             # middle
-            blocks.insert(min(2, len(blocks)), hb)
+            blocks.insert(min(2, len(blocks)), ("holiday", hb))
 
     # SEO keys block (народно, но без “Ключевые слова:”)
-    keys = _seo_pack(rnd, seo_level, lenses, shape)
+    keys, row.keys = _seo_pack(rnd, spec, state.keywords)
     # make it look not like machine: weave in a sentence
-    keys_sentence_templates = [
-        "По запросам люди ищут так: {keys}.",
-        "Если подбирать по поиску, обычно ищут: {keys}.",
-        "В поиске часто пишут: {keys}.",
-    ]
-    keys_sentence = rnd.choice(keys_sentence_templates).format(keys=", ".join(keys))
-
-    # final assemble
-    desc_parts = [first] + blocks + [keys_sentence]
-    text = " ".join([_cap_first(p).strip().rstrip(".") + "." for p in desc_parts if p and p.strip()])
-
-    # remove double dots/spaces
-    text = re.sub(r"\.\s*\.", ".", text)
-    text = re.sub(r"\s{2,}", " ", text).strip()
-
-    # brand in description should be LATIN (per your requirement)
-    if brand_lat:
-        # insert brand naturally (not "Brand:")
-        inserts = [
-            f"Модель {brand_lat} хорошо вписывается в базовый гардероб и в более яркие образы.",
-            f"Очки {brand_lat} — удачный вариант, если нравится аккуратный брендовый стиль.",
-            f"{brand_lat} смотрится уверенно: можно носить каждый день.",
-        ]
-        ins = rnd.choice(inserts)
-        # put near the beginning, but not as "Brand:"
-        text = re.sub(r"^([^\.]+\.)", r"\1 " + ins, text, count=1).strip()
+    keys_sentence = keys_template.format(keys=", ".join(keys))
+
+    # final assemble; brand in description should be LATIN, right after the first sentence
+    parts = [("first", first), ("brand", brand_insert)] + blocks
+    # synonyms everywhere except the search keys, which must stay verbatim
+    morph = spec.bank.morph
+    parts = [(kind, morph.substitute(rnd, p, SYNONYM_RATE)) for kind, p in parts if p and p.strip()]
+    draft = _DescDraft(spec, parts + [("keys", keys_sentence)], state.recent_descs)
+
+    # uniqueness check (anti near-duplicates)
+    if draft.worst()[0] > spec.sim_limit:
+        _mutate_description(rnd, spec, draft, first_pool, state, row)
+
+    row.desc, row.words = draft.text(), draft.words()
 
+
+# ----------------------------
+# Description mutation
+# ----------------------------
+DESC_MUTATION_BUDGET = 16     # fragment swaps tried per description before giving up
+DESC_MUTATION_PATIENCE = 4    # swaps in a row without progress before giving up
+SYNONYM_RATE = 0.35           # share of known words swapped for a synonym in a new fragment
+
+
+@lru_cache(maxsize=8192)
+def _fragment(p: str, wb_safe: bool, wb_strict: bool) -> Tuple[str, FrozenSet[int]]:
+    # one normalised, filtered sentence and its word hashes; fixed blocks repeat on every row
+    t = _cap_first(p).strip().rstrip(".") + "."
     # strict/safe
     if wb_safe:
-        text = _apply_safe_mode(text)
+        t = _apply_safe_mode(t)
     if wb_strict:
-        text = _apply_strict(text)
+        t = _apply_strict(t)
+    return t, _text_fp(t)
+
+
+class _DescDraft:
+    """A description as (kind, sentence) fragments; Jaccard against recent descriptions is updated per swap."""
+
+    def __init__(self, spec: _GenSpec, parts: List[Tuple[str, str]], recent: Sequence[FrozenSet[int]]):
+        self.spec = spec
+        self.kinds = [k for k, _ in parts]
+        self.frags: List[str] = []
+        self.fps: List[FrozenSet[int]] = []
+        self.count: Dict[int, int] = {}
+        for _, p in parts:
+            frag, fp = _fragment(p, spec.wb_safe, spec.wb_strict)
+            self.frags.append(frag)
+            self.fps.append(fp)
+            for w in fp:
+                self.count[w] = self.count.get(w, 0) + 1
+        self.common = _template_words(recent)
+        self.recent = [prev - self.common for prev in recent]
+        self.size = len(self.count.keys() - self.common)
+        self.inter = [len(prev & self.count.keys()) for prev in self.recent]
+
+    def words(self) -> FrozenSet[int]:
+        return frozenset(self.count)
+
+    def worst(self) -> Tuple[float, int]:
+        """(highest Jaccard against a recent description, its index)."""
+        n = self.size
+        best, at = 0.0, -1
+        for j, (prev, i) in enumerate(zip(self.recent, self.inter)):
+            uni = n + len(prev) - i
+            sim = i / uni if uni else 1.0
+            if sim > best:
+                best, at = sim, j
+        return best, at
+
+    def replace(self, idx: int, raw: str) -> str:
+        """Swaps fragment `idx` for `raw`; returns the old fragment (for undo)."""
+        old, old_fp = self.frags[idx], self.fps[idx]
+        new, new_fp = _fragment(raw, self.spec.wb_safe, self.spec.wb_strict)
+        removed, added = set(), set()
+        for w in old_fp - new_fp:
+            c = self.count[w] - 1
+            if c:
+                self.count[w] = c
+            else:
+                del self.count[w]
+                removed.add(w)
+        for w in new_fp - old_fp:
+            c = self.count.get(w, 0)
+            self.count[w] = c + 1
+            if not c:
+                added.add(w)
+        if removed or added:
+            for j, prev in enumerate(self.recent):
+                self.inter[j] += len(prev & added) - len(prev & removed)
+            self.size += len(added - self.common) - len(removed - self.common)
+        self.frags[idx], self.fps[idx] = new, new_fp
+        return old
+
+    def text(self) -> str:
+        text = " ".join(f for f in self.frags if f.strip(" ."))
+        # remove double dots/spaces
+        text = re.sub(r"\.\s*\.", ".", text)
+        return _SPACES_RE.sub(" ", text).strip()
+
+
+def _fragment_variant(
+    rnd: random.Random,
+    spec: _GenSpec,
+    kind: str,
+    current: str,
+    first_pool: List[str],
+    state: GenState,
+) -> Tuple[Optional[str], object]:
+    """A different sentence of the same kind (None if there is none) and the ids the row records."""
+    if kind == "keys":
+        keys, ids = _seo_pack(rnd, spec, state.keywords)
+        return rnd.choice(KEYS_SENTENCE_TEMPLATES).format(keys=", ".join(keys)), ids
+    if kind == "first":
+        fresh = [x for x in first_pool if spec.first_ids[x] not in state.used_first_phrases] or first_pool
+        first = rnd.choice(fresh)
+        return spec.bank.morph.substitute(rnd, first, SYNONYM_RATE), spec.first_ids[first]
+    raw = _fragment_redraw(rnd, spec, kind)
+    if raw is None:
+        # fixed block (style, collection, single shape/lens): every known word gets a synonym
+        raw = spec.bank.morph.substitute(rnd, current, 1.0)
+        return (raw if raw != current else None), None
+    return spec.bank.morph.substitute(rnd, raw, SYNONYM_RATE), None
+
+
+def _fragment_redraw(rnd: random.Random, spec: _GenSpec, kind: str) -> Optional[str]:
+    if kind == "brand":
+        return rnd.choice(_brand_inserts(spec.brand_lat)) if spec.brand_lat else None
+    if kind == "shape":
+        return _shape_sentence(rnd.choice(spec.shape_variants)) if len(spec.shape_variants) > 1 else None
+    if kind == "lens":
+        return spec.lens_blocks[rnd.choice(spec.lens_variants)] if len(spec.lens_variants) > 1 else None
+    if kind == "scenarios":
+        return _scenarios_sentence(rnd, spec.bank.scenarios)
+    if kind == "holiday":
+        return _insert_holidays_block(rnd, spec.holidays_joined, spec.bank.gifts) or None
+    return None
 
-    # uniqueness check (anti near-duplicates)
-    target = max(0.18, (100 - max(0, min(100, uniqueness))) / 100.0)  # uniqueness 92 => ~0.08..0.12
-    for prev in used_descs[-12:]:
-        if _jaccard(text, prev) > (0.55 - target):
-            # mutate by shuffling blocks and changing first sentence
-            rnd.shuffle(blocks)
-            first2 = rnd.choice([x for x in first_pool if _norm_key(x) not in used_first_phrases] or first_pool)
-            used_first_phrases.add(_norm_key(first2))
-            desc_parts2 = [first2] + blocks + [keys_sentence]
-            text2 = " ".join([_cap_first(p).strip().rstrip(".") + "." for p in desc_parts2 if p and p.strip()])
-            text2 = re.sub(r"\s{2,}", " ", text2).strip()
-            if wb_safe:
-                text2 = _apply_safe_mode(text2)
-            if wb_strict:
-                text2 = _apply_strict(text2)
-            text = text2
+
+def _mutate_description(
+    rnd: random.Random,
+    spec: _GenSpec,
+    draft: _DescDraft,
+    first_pool: List[str],
+    state: GenState,
+    row: _RowDraft,
+) -> None:
+    """
+    Greedy fragment swaps until spec.sim_limit is met or the budget runs out;
+    a row left above the limit is counted as a miss.
+    """
+    worst, at = draft.worst()
+    limit = spec.sim_limit
+    if at < 0 or worst <= limit:
+        # nothing to compare against yet, or already distinct enough
+        return
+    row.desc_rewrite = True
+    tried = stalled = 0
+    misses: Dict[int, int] = {}
+    while tried < DESC_MUTATION_BUDGET and stalled < DESC_MUTATION_PATIENCE:
+        prev = draft.recent[at]
+        order = sorted(
+            (i for i in range(len(draft.kinds)) if misses.get(i, 0) < 2),
+            key=lambda i: -len(draft.fps[i] & prev),
+        )
+        if not order:
             break
+        idx = order[0]
+        kind = draft.kinds[idx]
+        raw, ref = _fragment_variant(rnd, spec, kind, draft.frags[idx], first_pool, state)
+        if raw is None:
+            misses[idx] = 2
+            continue
+        tried += 1
+        row.mutation_attempts += 1
+        old = draft.replace(idx, raw)
+        sim, j = draft.worst()
+        if sim < worst:
+            worst, at = sim, j
+            stalled = 0
+            misses.pop(idx, None)
+            if kind == "first":
+                row.first_id = ref
+            elif kind == "keys":
+                row.keys = ref
+            if worst <= limit:
+                return
+        else:
+            draft.replace(idx, old)
+            stalled += 1
+            misses[idx] = misses.get(idx, 0) + 1
+    row.sim_missed = True
+
+
+def _template_words(recent: Sequence[FrozenSet[int]]) -> FrozenSet[int]:
+    if len(recent) < DESC_TEMPLATE_MIN:
+        return frozenset()
+    seen = Counter(chain.from_iterable(recent))
+    floor = DESC_TEMPLATE_SHARE * len(recent)
+    return frozenset(w for w, k in seen.items() if k > floor)
+
+
+def _brand_inserts(brand_lat: str) -> List[str]:
+    # insert brand naturally (not "Brand:")
+    return [
+        f"Модель {brand_lat} хорошо вписывается в базовый гардероб и в более яркие образы.",
+        f"Очки {brand_lat} — удачный вариант, если нравится аккуратный брендовый стиль.",
+        f"{brand_lat} смотрится уверенно: можно носить каждый день.",
+    ]
 
-    used_descs.append(text)
-    return text
+
+def generate_batch(
+    params: FillParams,
+    k: int,
+    rnd: Optional[random.Random] = None,
+    state: Optional[GenState] = None,
+) -> Tuple[List[str], List[str]]:
+    """
+    Generates K titles and K descriptions, rebuilding rows that break the WB rules.
+    Pass the same `state` to consecutive calls to keep uniqueness across files.
+    """
+    k = max(0, int(k))
+    if rnd is None:
+        rnd = random.Random()
+    if state is None:
+        state = GenState()
+    spec = _prepare_spec(params, _load_tables(state))
+    rows = [_next_row(spec, rnd, state) for _ in range(k)]
+    return [r.title for r in rows], [r.desc for r in rows]
+
+
+def _load_tables(state: GenState) -> PhraseBank:
+    # keyword table and phrase bank are not pickled with the state
+    if state.keywords is None or state.keywords.table is None:
+        state.keywords = KeywordSampler.load(usage=state.keywords)
+    if state.bank is None:
+        state.bank = load_phrase_bank()
+    return state.bank
+
+
+def _next_row(spec: _GenSpec, rnd: random.Random, state: GenState) -> _RowDraft:
+    """Builds a row, rebuilds it up to VALIDATE_ROUNDS times on WB violations, commits the kept one."""
+    row = _build_row(spec, rnd, state)
+    bad = _row_violations(spec, row.title, row.desc)
+    if bad:
+        for c in bad:
+            state.violations[c] = state.violations.get(c, 0) + 1
+        for _ in range(VALIDATE_ROUNDS):
+            state.rows_revalidated += 1
+            row = _build_row(spec, rnd, state)
+            bad = _row_violations(spec, row.title, row.desc)
+            if not bad:
+                break
+        for c in bad:
+            state.violations_left[c] = state.violations_left.get(c, 0) + 1
+    state.commit(row)
+    return row
+
+
+def _build_row(spec: _GenSpec, rnd: random.Random, state: GenState) -> _RowDraft:
+    """One title + description draft; reads `state` but does not change it."""
+    row = _RowDraft()
+
+    # title draws
+    extras = []
+    t_shape = rnd.choice(spec.shape_variants) if spec.shape_variants else ""
+    t_lens = rnd.choice(spec.lens_variants) if spec.lens_variants else ""
+    # add either lens or shape or both
+    if rnd.random() < 0.70 and t_lens:
+        extras.append(t_lens)
+    if rnd.random() < 0.55 and t_shape:
+        # do not shout in CAPS, use normal
+        extras.append(t_shape)
+    # collection snippet sometimes
+    if rnd.random() < 0.35 and spec.title_collection:
+        extras.append(spec.title_collection)
+    include_brand = rnd.random() < 0.5 if spec.include_brand is None else spec.include_brand
+    _make_title(
+        rnd=rnd,
+        spec=spec,
+        slogan=rnd.choice(spec.slogans),
+        prod=rnd.choice(PRODUCT_WORDS),
+        include_brand=include_brand,
+        extras=extras,
+        state=state,
+        row=row,
+    )
+
+    # description draws
+    _make_description(
+        rnd=rnd,
+        spec=spec,
+        sp=rnd.choice(spec.shape_variants) if spec.shape_variants else "",
+        lp=rnd.choice(spec.lens_variants) if spec.lens_variants else "",
+        with_collection=rnd.random() < 0.75,
+        keys_template=rnd.choice(KEYS_SENTENCE_TEMPLATES),
+        brand_insert=rnd.choice(_brand_inserts(spec.brand_lat)) if spec.brand_lat else "",
+        state=state,
+        row=row,
+    )
+    return row
 
 
 # ----------------------------
 # Excel fill
 # ----------------------------
-def _find_col_by_header(ws, header_row: int, names: List[str]) -> Optional[int]:
-    wanted = {_norm_key(n) for n in names}
-    for col in range(1, ws.max_column + 1):
-        v = ws.cell(row=header_row, column=col).value
-        if v is None:
-            continue
-        k = _norm_key(str(v))
-        if k in wanted:
-            return col
-    return None
+NAME_HEADERS = ["Наименование", "Название", "Заголовок", "Наим-е", "Наименование товара", "Название товара", "Title"]
+DESC_HEADERS = ["Описание", "Description", "Опис-е", "Описание товара"]
+# a product row has a value in one of these; others are blank/service rows
+ID_HEADERS = ["Артикул продавца", "Артикул", "Артикул WB", "Баркод", "Баркоды", "Штрихкод", "Barcode", "SKU"]
 
+# streaming granularity: rows between cancel/progress checks, per sink flush
+# and per NDJSON chunk of the service
+STREAM_CHUNK = 512
 
-def _detect_header_row(ws, max_scan: int = 30) -> int:
-    # find row that contains both "Наименование" and "Описание"
-    for r in range(1, min(max_scan, ws.max_row) + 1):
-        row_vals = [ws.cell(row=r, column=c).value for c in range(1, min(ws.max_column, 50) + 1)]
-        joined = " | ".join([str(x) for x in row_vals if x is not None])
-        if not joined:
-            continue
-        j = _norm_key(joined)
-        if "наимен" in j and "описан" in j:
-            return r
-    return 1
+# documented Python-heap ceiling of a low_memory run (see _fill_streaming)
+LOW_MEMORY_CEILING_MB = 64
+
+
+def _head_rows(ws, max_scan: int = 30) -> List[Tuple]:
+    # works for normal and read-only sheets (no random cell access); capped at
+    # max_row because iter_rows past it creates empty rows on a normal sheet
+    last = min(max_scan, ws.max_row or max_scan)
+    return [tuple(r) for r in ws.iter_rows(min_row=1, max_row=last, values_only=True)]
+
+
+# ----------------------------
+# Header resolver
+# ----------------------------
+HEADER_FIELDS = ("name", "description", "id")
+HEADER_SCAN_ROWS = 30
+HEADER_FUZZY_RATIO = 0.8   # difflib ratio for misspelt headers
+# trailing words that don't change what a column is: "Наименование товара"
+# is the name column, "Название бренда" is not
+HEADER_QUALIFIERS = [
+    "товара", "товаров", "изделия", "продукта", "модели", "карточки",
+    "wb", "для wb", "на wb", "для сайта", "на сайте", "для маркетплейса",
+]
+
+_HEADER_NOISE_RE = re.compile(r"\([^)]*\)|\[[^\]]*\]|\*")
+_HEADER_PUNCT_RE = re.compile(r"[^0-9a-zа-я]+")
+
+
+def _header_key(v) -> str:
+    # "Описание (до 5000 символов)*" -> "описание"
+    s = str(v).lower().replace("ё", "е")
+    s = _HEADER_NOISE_RE.sub(" ", s)
+    return _HEADER_PUNCT_RE.sub(" ", s).strip()
+
+
+def header_synonyms_path() -> Path:
+    return app_data_dir() / "header_synonyms.json"
+
+
+def _default_header_synonyms() -> Dict[str, List[str]]:
+    return {"name": NAME_HEADERS, "description": DESC_HEADERS, "id": ID_HEADERS, "qualifiers": HEADER_QUALIFIERS}
+
+
+class _HeaderResolver:
+    """Maps template header cells to fields (name / description / id), cached per template."""
+
+    def __init__(self, synonyms: Dict[str, List[str]]):
+        self.exact: Dict[str, str] = {}
+        self.by_head: Dict[str, List[Tuple[str, str]]] = {}
+        quals = {_header_key(q) for q in synonyms.get("qualifiers", ())}
+        self.qualifiers = sorted((" " + q for q in quals if q), key=len, reverse=True)
+        for fld in HEADER_FIELDS:
+            for syn in synonyms.get(fld, ()):
+                k = _header_key(syn)
+                if k and k not in self.exact:
+                    self.exact[k] = fld
+                    self.by_head.setdefault(k[:2], []).append((k, fld))
+        self.cache: Dict[int, Tuple[int, int, int, List[int]]] = {}
+        self.lock = threading.Lock()
+
+    def match(self, value) -> Optional[Tuple[str, int]]:
+        """(field, score): 3 exact, 2 prefix, 1 fuzzy; None if nothing fits."""
+        if value is None or isinstance(value, (int, float)):
+            return None
+        k = _header_key(value)
+        if not k or len(k) > 80:
+            return None
+        fld = self.exact.get(k)
+        if fld:
+            return fld, 3
+        base = next((k[:-len(q)] for q in self.qualifiers if k.endswith(q)), k)
+        fld = self.exact.get(base)
+        if fld:
+            return fld, 2
+        if " " in base:
+            # unknown trailing words: another column ("Наименование цвета", "Описание EN")
+            return None
+        cands = self.by_head.get(base[:2], ())
+        if len(base) >= 4:
+            # abbreviation; the shortest synonym it abbreviates wins
+            abbr = [(len(syn), f) for syn, f in cands if syn.startswith(base)]
+            if abbr:
+                return min(abbr)[1], 2
+        ratio, fld = max(
+            ((SequenceMatcher(None, base, syn).ratio(), f) for syn, f in cands),
+            default=(0.0, ""),
+        )
+        return (fld, 1) if ratio >= HEADER_FUZZY_RATIO else None
+
+    def resolve(self, rows: List[Tuple]) -> Tuple[int, int, int, List[int]]:
+        """
+        One pass over the first rows: the header row is the first one that
+        has both a name and a description column.
+        """
+        sig = _fp64(repr(rows))
+        with self.lock:
+            hit = self.cache.get(sig)
+        if hit is not None:
+            return hit
+
+        found: Optional[Tuple[int, int, int, List[int]]] = None
+        for r, row in enumerate(rows[:HEADER_SCAN_ROWS], start=1):
+            best: Dict[str, Tuple[int, int]] = {}   # field -> (score, col)
+            ids: List[int] = []
+            for col, v in enumerate(row, start=1):
+                m = self.match(v)
+                if not m:
+                    continue
+                fld, score = m
+                if fld == "id":
+                    ids.append(col)
+                elif score > best.get(fld, (0, 0))[0]:
+                    best[fld] = (score, col)
+            if "name" in best and "description" in best:
+                found = (r, best["name"][1], best["description"][1], ids)
+                break
+        if found is None:
+            raise ValueError(
+                "Не найдены колонки Наименование и/или Описание (проверь заголовки в файле "
+                f"или добавь свои варианты в {header_synonyms_path().name})."
+            )
+        with self.lock:
+            self.cache[sig] = found
+        return found
+
+
+def _parse_header_synonyms(path: Path) -> _HeaderResolver:
+    d = _default_header_synonyms()
+    try:
+        user = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        user = {}
+    if isinstance(user, dict):
+        for k, v in user.items():
+            if k in d and isinstance(v, list):
+                # user variants first, built-ins stay as a fallback
+                d[k] = [str(x) for x in v if str(x).strip()] + d[k]
+    return _HeaderResolver(d)
+
+
+def load_header_resolver(path: Optional[Path] = None) -> _HeaderResolver:
+    """header_synonyms.json from the data dir (created on first use), cached until it changes."""
+    p = path or header_synonyms_path()
+    if not p.exists():
+        p.write_text(json.dumps({k: [] for k in (*HEADER_FIELDS, "qualifiers")}, ensure_ascii=False, indent=2), encoding="utf-8")
+    return _load_cached(p, _parse_header_synonyms)
+
+
+def _locate_columns(ws) -> Tuple[int, int, int, List[int]]:
+    return load_header_resolver().resolve(_head_rows(ws, HEADER_SCAN_ROWS))
+
+
+def _is_product_row(row: Sequence, id_cols: List[int]) -> bool:
+    def filled(v) -> bool:
+        return v is not None and str(v).strip() != ""
+
+    if id_cols:
+        return any(c <= len(row) and filled(row[c - 1]) for c in id_cols)
+    # no article/barcode column: any non-empty cell counts
+    return any(filled(v) for v in row)
+
+
+def _row_quota(params: FillParams) -> Optional[int]:
+    # None => auto mode: every product row
+    n = int(params.rows_to_fill)
+    return n if n > 0 else None
+
+
+# FillParams fields that shape the generated text
+GEN_FIELDS = [
+    "brand_lat", "brand_ru", "shape", "lenses", "collection", "holidays", "holiday_pos",
+    "seo_level", "style", "wb_safe_mode", "wb_strict", "brand_in_title_ratio", "uniqueness", "category",
+]
+
+
+def _gen_signature(params: FillParams) -> str:
+    sig = {}
+    for f in GEN_FIELDS:
+        v = getattr(params, f)
+        sig[f] = _norm_key(v) if isinstance(v, str) else v
+    return json.dumps(sig, ensure_ascii=False, sort_keys=True)
+
+
+FILL_INDEX_NAME = "fill_index.json"
+# jobs for different templates may share an output folder and run at once
+_FILL_INDEX_LOCK = threading.Lock()
+
+
+class _FillIndex:
+    """Incremental-run index per output folder: header signature -> row identity -> input hash."""
+    VERSION = 2
+
+    def __init__(self, path: Path, params: FillParams):
+        self.path = path
+        self.sig = _gen_signature(params)
+        self.templates = self._read()
+        self.header = ""
+        self.old: Dict[str, str] = {}
+        self.new: Dict[str, str] = {}
+        self.kept = 0
+
+    def _read(self) -> Dict[str, Dict[str, str]]:
+        if not self.path.exists():
+            return {}
+        try:
+            d = json.loads(self.path.read_text(encoding="utf-8"))
+            if d.get("version") == self.VERSION:
+                return dict(d.get("templates") or {})
+        except Exception:
+            pass
+        return {}
+
+    def use_header(self, row: Sequence) -> None:
+        """Selects the rows indexed for this template's header (trailing blanks ignored)."""
+        cells = [str(v).strip() if v is not None else "" for v in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        self.header = f"{_fp64(json.dumps(cells, ensure_ascii=False)):016x}"
+        self.old = dict(self.templates.get(self.header) or {})
+
+    def needs_fill(self, row: Sequence, name_col: int, desc_col: int, id_cols: List[int]) -> bool:
+        def cell(c: int):
+            return row[c - 1] if c <= len(row) else None
+
+        ident = "|".join(str(cell(c) or "").strip() for c in id_cols)
+        attrs = [v for c, v in enumerate(row, start=1) if c not in (name_col, desc_col)]
+        h = f"{_fp64(self.sig + json.dumps(attrs, ensure_ascii=False, default=str)):016x}"
+        if ident.strip("|"):
+            self.new[ident] = h
+
+        empty = not str(cell(name_col) or "").strip() or not str(cell(desc_col) or "").strip()
+        if empty or not ident.strip("|") or self.old.get(ident) != h:
+            return True
+        self.kept += 1
+        return False
+
+    def save(self) -> None:
+        """Replaces this header's entries only (re-read under the lock, written atomically)."""
+        with _FILL_INDEX_LOCK:
+            templates = self._read()
+            templates[self.header] = self.new
+            d = {"version": self.VERSION, "templates": templates}
+            tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(d, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self.templates = templates
+
+
+def _row_plan(
+    params: FillParams,
+    ws,
+    header_row: int,
+    name_col: int,
+    desc_col: int,
+    id_cols: List[int],
+    index: Optional[_FillIndex] = None,
+    tail: bool = True,
+    state: Optional[GenState] = None,
+) -> Iterator[Tuple[int, Tuple, Optional[bool]]]:
+    """
+    Yields (row_number, values, fill_it) from the top: None for other rows, False for rows the
+    incremental index keeps (titles reserved in `state`); tail=False stops after the last fillable row.
+    """
+    # rows start after header row; don't touch first N rows (absolute rows in sheet)
+    first_row = max(header_row + 1, int(params.skip_first_rows) + 1)
+    quota = _row_quota(params)
+    seen = 0
+    for r, row in enumerate(ws.iter_rows(values_only=True), start=1):
+        fill_it = None
+        if r == header_row and index is not None:
+            index.use_header(row)
+        if r >= first_row:
+            if quota is None:
+                # auto: only rows that carry an article/barcode
+                eligible = _is_product_row(row, id_cols)
+            else:
+                # fixed: only first N rows after header/skip
+                eligible = seen < quota
+                if not eligible and not tail:
+                    return
+            if eligible:
+                seen += 1
+                fill_it = index is None or index.needs_fill(row, name_col, desc_col, id_cols)
+                if not fill_it and state is not None:
+                    state.reserve_title(row[name_col - 1] if name_col <= len(row) else None)
+        yield r, row, fill_it
+
+
+# a generated row as cached: title, description, first phrase id, keyword ids
+_CachedRow = Tuple[str, str, int, List[int]]
+
+
+def _row_seed(seed: int, n: int) -> int:
+    # RNG seed of row n (0-based) of the file seeded with `seed`
+    return (seed << 32) + n
+
+
+class _TextFeed:
+    """
+    (title, description) pairs for one file: cached rows first, then generated ones.
+    Row n is seeded by _row_seed(seed, n), so every output format gets the same rows.
+    """
 
+    def __init__(
+        self,
+        params: FillParams,
+        seed: int,
+        ctx: RunContext,
+        cached: Optional[List[_CachedRow]] = None,
+        record: bool = False,
+        span: Tuple[float, float] = (0.0, 100.0),
+        expected: Optional[int] = None,
+    ):
+        self.params = params
+        self.seed = seed
+        self.ctx = ctx
+        self.state = ctx.state
+        self.cached = cached or []
+        self.served = 0
+        self.from_cache = 0
+        self.generated = 0
+        self.gen_seconds = 0.0
+        self.record: Optional[List[_CachedRow]] = [] if record else None
+        self.spec: Optional[_GenSpec] = None
+        self.rnd = random.Random()
+        # progress inside one large file: `span` of the run's 0..100 over `expected` rows
+        self.span = span
+        self.expected = expected
+
+    def next(self) -> Tuple[str, str]:
+        if self.served < len(self.cached):
+            row = self.cached[self.served]
+            _load_tables(self.state)
+            self.state.absorb(*row)
+            self.from_cache += 1
+        else:
+            if self.generated % STREAM_CHUNK == 0:
+                self.ctx.check_cancelled()
+                if self.expected:
+                    lo, hi = self.span
+                    self.ctx.report_progress(lo + (hi - lo) * min(1.0, self.served / self.expected))
+            t0 = time.perf_counter()
+            if self.spec is None:
+                self.spec = _prepare_spec(self.params, _load_tables(self.state))
+            self.rnd.seed(_row_seed(self.seed, self.served))
+            draft = _next_row(self.spec, self.rnd, self.state)
+            self.gen_seconds += time.perf_counter() - t0
+            row = (draft.title, draft.desc, draft.first_id, draft.keys)
+            self.generated += 1
+        self.served += 1
+        if self.record is not None:
+            self.record.append(row)
+        return row[0], row[1]
+
+    def take(self, k: int) -> Tuple[List[str], List[str]]:
+        titles: List[str] = []
+        descs: List[str] = []
+        for _ in range(k):
+            t, d = self.next()
+            titles.append(t)
+            descs.append(d)
+        return titles, descs
+
+
+# ----------------------------
+# Output files / parts
+# ----------------------------
+# an output file on disk or an archive member being written
+_Target = Union[Path, IO[bytes]]
+
+
+def _open_text(target: _Target, encoding: str = "utf-8"):
+    if isinstance(target, Path):
+        return open(target, "w", encoding=encoding, newline="")
+    return TextIOWrapper(target, encoding=encoding, newline="")
+
+
+class _Parts:
+    """Where one batch file goes: one target, or numbered parts of at most `limit` filled rows."""
+
+    def __init__(self, path: Path, limit: int = 0, arc: Optional["_BatchArchive"] = None):
+        self.path = path
+        self.limit = max(0, int(limit))
+        self.arc = arc
+        self.names: List[str] = []   # outputs as listed in the report
+        self.current: Optional[_Target] = None
+
+    def open(self) -> _Target:
+        self.close()
+        p = self.path
+        if self.limit:
+            p = p.with_name(f"{p.stem}_part{len(self.names) + 1:02d}{p.suffix}")
+        if self.arc:
+            self.current = self.arc.open(p.name)
+            self.names.append(p.name)
+        else:
+            self.current = p
+            self.names.append(str(p))
+        return self.current
+
+    def close(self) -> None:
+        if self.current is not None and not isinstance(self.current, Path):
+            self.current.close()
+        self.current = None
+
+
+def _fill_workbook(
+    params: FillParams,
+    in_path: Path,
+    parts: _Parts,
+    feed: _TextFeed,
+    index: Optional[_FillIndex] = None,
+) -> int:
+    wb = load_workbook(in_path)
+    ws = wb.active
+
+    header_row, name_col, desc_col, id_cols = _locate_columns(ws)
+    plan = _row_plan(params, ws, header_row, name_col, desc_col, id_cols, index, tail=False, state=feed.state)
+
+    # texts go straight into the cells, one row at a time, in sheet order
+    # so kept titles are reserved exactly as in the streaming fills
+    eligible_rows: List[int] = []
+    for r, _, fill_it in plan:
+        if fill_it:
+            title, desc = feed.next()
+            # overwrite always
+            ws.cell(row=r, column=name_col).value = title
+            ws.cell(row=r, column=desc_col).value = desc
+            eligible_rows.append(r)
+
+    limit = parts.limit or len(eligible_rows) or 1
+    first_row = max(header_row + 1, int(params.skip_first_rows) + 1)
+
+    if len(eligible_rows) > limit:
+        _save_parts(ws, parts, first_row, eligible_rows[limit::limit])
+    else:
+        wb.save(parts.open())
+        parts.close()
+    return len(eligible_rows)
+
+
+# sheet-level settings a split part takes over from the template sheet
+_SHEET_SETTINGS = (
+    "sheet_properties", "sheet_format", "views", "protection", "print_options",
+    "page_margins", "page_setup", "HeaderFooter", "sheet_state",
+)
+# workbook style tables, shared with the parts so cell style ids stay valid
+_STYLE_TABLES = (
+    "_fonts", "_fills", "_borders", "_number_formats", "_alignments", "_protections",
+    "_cell_styles", "_named_styles", "_differential_styles", "_table_styles", "_colors",
+)
+
+
+def _save_parts(ws, parts: _Parts, first_row: int, starts: List[int]) -> None:
+    """Writes the filled sheet as write-only parts in one pass, cut before every row in `starts`."""
+    wb = ws.parent
+    bounds = [first_row] + starts + [ws.max_row + 1]
+    head = list(ws.iter_rows(max_row=first_row - 1)) if first_row > 1 else []
+    body = ws.iter_rows(min_row=first_row)
+    for lo, hi in zip(bounds, bounds[1:]):
+        part = Workbook(write_only=True)
+        for name in _STYLE_TABLES:
+            setattr(part, name, getattr(wb, name))
+        part.defined_names = copy(wb.defined_names)
+        for sheet in wb.worksheets:
+            out = part.create_sheet(sheet.title)
+            if sheet is not ws:
+                _copy_sheet(sheet, out, sheet.iter_rows(), 1, 1, sheet.max_row + 1)
+                continue
+            rows = chain(head, (next(body) for _ in range(lo, hi)))
+            _copy_sheet(sheet, out, rows, first_row, lo, hi)
+        part.active = wb.index(wb.active)
+        part.save(parts.open())
+        parts.close()
+
+
+def _copy_sheet(ws, out, rows: Iterator[Tuple], first_row: int, lo: int, hi: int) -> None:
+    """Streams the head rows and rows lo..hi-1 into `out`; row-bound ranges and heights move along."""
+    shift = lo - first_row
+
+    def moved(a: int, b: int) -> Optional[Tuple[int, int]]:
+        kept = [(max(a, x), min(b, y)) for x, y in ((1, first_row - 1), (lo, hi - 1)) if max(a, x) <= min(b, y)]
+        if not kept:
+            return None
+        top, bottom = kept[0][0], kept[-1][1]
+        return (top if top < first_row else top - shift), (bottom if bottom < first_row else bottom - shift)
+
+    def remap(sqref) -> str:
+        out_refs = []
+        for cr in MultiCellRange(str(sqref)).ranges:
+            r = moved(cr.min_row, cr.max_row)
+            if r:
+                out_refs.append(CellRange(min_col=cr.min_col, min_row=r[0], max_col=cr.max_col, max_row=r[1]).coord)
+        return " ".join(out_refs)
+
+    for name in _SHEET_SETTINGS:
+        setattr(out, name, copy(getattr(ws, name)))
+    for key, dim in ws.column_dimensions.items():
+        out.column_dimensions[key] = copy(dim)
+    for r, dim in ws.row_dimensions.items():
+        r2 = moved(r, r)
+        if r2:
+            dim = copy(dim)
+            dim.index = r2[0]
+            out.row_dimensions[r2[0]] = dim
+    for m in ws.merged_cells.ranges:
+        ref = remap(m.coord)
+        if ":" in ref:
+            out.merged_cells.add(ref)
+    for dv in ws.data_validations.dataValidation:
+        ref = remap(dv.sqref)
+        if ref:
+            dv = copy(dv)
+            dv.sqref = MultiCellRange(ref)
+            out.data_validations.append(dv)
+    for fmt in ws.conditional_formatting:
+        ref = remap(fmt.sqref)
+        for rule in fmt.rules if ref else ():
+            out.conditional_formatting.add(ref, rule)
+    if ws.auto_filter.ref:
+        out.auto_filter.ref = remap(ws.auto_filter.ref) or None
+    if ws.freeze_panes:
+        out.freeze_panes = ws.freeze_panes
+
+    for row in rows:
+        out.append([_write_only_cell(out, c) for c in row])
+
+
+def _write_only_cell(out, cell):
+    # plain values go as is; styled cells, links and comments keep them
+    if not (cell.has_style or cell.hyperlink or cell.comment):
+        return cell.value
+    wc = WriteOnlyCell(out, cell.value)
+    wc._style = copy(cell._style)
+    if cell.hyperlink:
+        wc.hyperlink = copy(cell.hyperlink)
+    if cell.comment:
+        wc.comment = copy(cell.comment)
+    return wc
+
+
+def _fill_streaming(
+    params: FillParams,
+    in_path: Path,
+    parts: _Parts,
+    feed: _TextFeed,
+    index: Optional[_FillIndex] = None,
+) -> int:
+    """Memory-bounded fill: read-only input, write-only output; values are copied, styles are not."""
+    src = load_workbook(in_path, read_only=True)
+    try:
+        active = src.active
+        header_row, name_col, desc_col, id_cols = _locate_columns(active)
+        width = max(name_col, desc_col)
+        first_row = max(header_row + 1, int(params.skip_first_rows) + 1)
+        head: List[Tuple] = []
+
+        def new_part():
+            dst = Workbook(write_only=True)
+            out = None
+            for ws in src.worksheets:
+                sheet = dst.create_sheet(ws.title)
+                if ws is active:
+                    out = sheet
+                    for row in head:
+                        sheet.append(row)
+                else:
+                    for row in ws.iter_rows(values_only=True):
+                        sheet.append(row)
+            return dst, out
+
+        dst, out = new_part()
+        rows_filled = 0
+        in_part = 0
+        for r, row, fill_it in _row_plan(params, active, header_row, name_col, desc_col, id_cols, index, state=feed.state):
+            if r < first_row and parts.limit:
+                head.append(row)
+            if fill_it:
+                if parts.limit and in_part == parts.limit:
+                    dst.save(parts.open())
+                    parts.close()
+                    dst, out = new_part()
+                    in_part = 0
+                row = list(row) + [None] * max(0, width - len(row))
+                # overwrite always
+                row[name_col - 1], row[desc_col - 1] = feed.next()
+                rows_filled += 1
+                in_part += 1
+            out.append(row)
+        dst.save(parts.open())
+        parts.close()
+    finally:
+        src.close()
+    return rows_filled
+
+
+# ----------------------------
+# Row sinks (no workbook)
+# ----------------------------
+SINK_FIELDS = ["row", "article", "title", "description", "seed"]
+
+OUTPUT_FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "jsonl": ".jsonl", "parquet": ".parquet"}
+
+
+class _CsvSink:
+    def __init__(self, path: _Target):
+        # utf-8-sig so Excel opens Cyrillic correctly
+        self.f = _open_text(path, "utf-8-sig")
+        self.w = csv.writer(self.f, delimiter=";")
+        self.w.writerow(SINK_FIELDS)
+
+    def write(self, rec: List) -> None:
+        self.w.writerow(rec)
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class _JsonlSink:
+    def __init__(self, path: _Target):
+        self.f = _open_text(path)
+
+    def write(self, rec: List) -> None:
+        self.f.write(json.dumps(dict(zip(SINK_FIELDS, rec)), ensure_ascii=False, default=str) + "\n")
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class _ParquetSink:
+    # pyarrow is optional: only needed for this format
+    def __init__(self, path: _Target):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Для вывода в Parquet нужен пакет pyarrow (pip install pyarrow).")
+        self.pa = pa
+        self.schema = pa.schema([
+            ("row", pa.int64()), ("article", pa.string()), ("title", pa.string()),
+            ("description", pa.string()), ("seed", pa.int64()),
+        ])
+        self.writer = pq.ParquetWriter(str(path) if isinstance(path, Path) else path, self.schema)
+        self.buf: List[List] = []
+
+    def write(self, rec: List) -> None:
+        self.buf.append(rec)
+        if len(self.buf) >= STREAM_CHUNK:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self.buf:
+            cols = list(zip(*self.buf))
+            self.writer.write_table(self.pa.Table.from_arrays([list(c) for c in cols], schema=self.schema))
+            self.buf = []
+
+    def close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+
+def _open_sink(fmt: str, path: _Target):
+    if fmt == "csv":
+        return _CsvSink(path)
+    if fmt == "jsonl":
+        return _JsonlSink(path)
+    if fmt == "parquet":
+        return _ParquetSink(path)
+    raise ValueError(f"Неизвестный формат вывода: {fmt}")
+
+
+def _fill_sink(
+    params: FillParams,
+    in_path: Path,
+    parts: _Parts,
+    feed: _TextFeed,
+    index: Optional[_FillIndex] = None,
+    seed: int = 0,
+) -> int:
+    """
+    Streams rows (row, article, title, description, seed) to CSV/JSONL/Parquet;
+    rows an incremental run keeps are written with their current texts.
+    """
+    fmt = (params.output_format or "xlsx").lower().strip()
+    src = load_workbook(in_path, read_only=True)
+    sink = None
+    try:
+        ws = src.active
+        header_row, name_col, desc_col, id_cols = _locate_columns(ws)
+        sink = _open_sink(fmt, parts.open())
+
+        rows_filled = written = 0
+        plan = _row_plan(params, ws, header_row, name_col, desc_col, id_cols, index, tail=False, state=feed.state)
+        for r, row, fill_it in plan:
+            if fill_it is None:
+                continue
+            if parts.limit and written and written % parts.limit == 0:
+                sink.close()
+                sink = _open_sink(fmt, parts.open())
+            if fill_it:
+                title, desc = feed.next()
+                rows_filled += 1
+            else:
+                title, desc = (row[c - 1] if c <= len(row) else None for c in (name_col, desc_col))
+            article = next((str(row[c - 1]).strip() for c in id_cols if c <= len(row) and row[c - 1] is not None), "")
+            sink.write([r, article, title, desc, seed])
+            written += 1
+    finally:
+        if sink is not None:
+            sink.close()
+        parts.close()
+        src.close()
+    return rows_filled
 
-def fill_wb_template(params: FillParams) -> Tuple[List[str], int, str]:
+
+# ----------------------------
+# Batch archive
+# ----------------------------
+ARCHIVE_FORMATS = {"zip": ".zip", "tar": ".tar"}
+# already compressed: deflating them again only costs time
+_STORED_EXTS = {".xlsx", ".parquet"}
+
+
+class _TarMember(BytesIO):
+    # tar headers carry the size, so a member is buffered in memory and
+    # added when closed
+    def __init__(self, tar: tarfile.TarFile, name: str):
+        super().__init__()
+        self.tar = tar
+        self.name = name
+
+    def close(self) -> None:
+        if not self.closed:
+            info = tarfile.TarInfo(self.name)
+            info.size = self.tell()
+            info.mtime = int(time.time())
+            self.seek(0)
+            self.tar.addfile(info, self)
+        super().close()
+
+
+class _BatchArchive:
+    """One zip/tar for a whole batch; outputs are written straight into its members."""
+
+    def __init__(self, path: Path, kind: str):
+        self.path = path
+        self.kind = kind
+        if kind == "zip":
+            self.zf = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        else:
+            self.tf = tarfile.open(path, "w")
+        self.names: List[str] = []
+
+    def open(self, name: str) -> IO[bytes]:
+        self.names.append(name)
+        if self.kind == "tar":
+            return _TarMember(self.tf, name)
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if Path(name).suffix in _STORED_EXTS else zipfile.ZIP_DEFLATED
+        return self.zf.open(info, "w", force_zip64=True)
+
+    def write_text(self, name: str, text: str) -> None:
+        with self.open(name) as f:
+            f.write(text.encode("utf-8"))
+
+    def close(self) -> None:
+        (self.zf if self.kind == "zip" else self.tf).close()
+
+    def abort(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def _open_archive(params: FillParams) -> Optional[_BatchArchive]:
+    kind = (params.archive or "").lower().strip()
+    if not kind:
+        return None
+    if kind not in ARCHIVE_FORMATS:
+        raise ValueError(f"Неизвестный формат архива: {params.archive}")
+    base = _safe_filename(Path(params.xlsx_path).stem)
+    return _BatchArchive(Path(params.output_dir) / f"{base}_batch{ARCHIVE_FORMATS[kind]}", kind)
+
+
+# ----------------------------
+# Generation cache
+# ----------------------------
+GEN_CACHE_MAX_MB = 256
+GENERATOR_VERSION = 9    # bump when the same seed starts producing different rows
+
+
+def gen_cache_dir() -> Path:
+    p = app_data_dir() / "gen_cache"
+    p.mkdir(parents=True, exist_ok=True)
+    return p
+
+
+class _GenCache:
+    """Gzip JSON store of generated rows per file, keyed on the start state; LRU-evicted by size."""
+
+    def __init__(self, root: Path, max_mb: int = GEN_CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+
+    @staticmethod
+    def key(params: FillParams, seed: int, file_no: int, state: GenState) -> str:
+        # phrase files change the output, so their stamps are part of the key
+        stamps = []
+        for p in (phrase_bank_path(), seo_keys_path()):
+            try:
+                st = p.stat()
+                stamps.append(f"{st.st_mtime_ns}:{st.st_size}")
+            except OSError:
+                stamps.append("-")
+        raw = f"{GENERATOR_VERSION}|{_gen_signature(params)}|{seed}|{file_no}|{state.digest()}|{'|'.join(stamps)}"
+        return f"{_fp64(raw):016x}"
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json.gz"
+
+    def get(self, key: str) -> Optional[List[_CachedRow]]:
+        p = self._path(key)
+        if not p.exists():
+            return None
+        try:
+            with gzip.open(p, "rt", encoding="utf-8") as f:
+                rows = json.load(f)
+            os.utime(p)  # LRU: touch on read
+            return [(t, d, int(first), [int(x) for x in keys]) for t, d, first, keys in rows]
+        except Exception:
+            return None
+
+    def put(self, key: str, rows: List[_CachedRow]) -> None:
+        p = self._path(key)
+        tmp = p.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False)
+        os.replace(tmp, p)
+        self._evict()
+
+    def _evict(self) -> None:
+        files = []
+        for f in self.root.glob("*.json.gz"):
+            try:
+                st = f.stat()
+                files.append((st.st_mtime, st.st_size, f))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in files)
+        for _, size, f in sorted(files, key=lambda x: x[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                continue
+
+
+# ----------------------------
+# Checkpoints
+# ----------------------------
+class _Checkpoint:
+    """Resume point of a multi-file run, rewritten after every file; plain JSON, removed when done."""
+    VERSION = 2
+
+    def __init__(self, path: Path, params: FillParams):
+        self.path = path
+        try:
+            st = Path(params.xlsx_path).stat()
+            stamp = f"{st.st_mtime_ns}:{st.st_size}"
+        except OSError:
+            stamp = "-"
+        raw = "|".join(str(x) for x in (
+            GENERATOR_VERSION, _gen_signature(params), params.seed, params.batch_count, params.rows_to_fill,
+            params.skip_first_rows, params.output_format, params.low_memory, params.incremental,
+            params.max_rows_per_file, Path(params.xlsx_path).resolve(), stamp,
+        ))
+        self.key = f"{_fp64(raw):016x}"
+
+    def load(self) -> Optional[Dict]:
+        if not self.path.exists():
+            return None
+        try:
+            d = json.loads(self.path.read_text(encoding="utf-8"))
+            if not isinstance(d, dict) or d.get("version") != self.VERSION or d.get("key") != self.key:
+                return None
+            version, mt, gauss = d["rnd"]
+            index = d["index"]
+            restored = {
+                "done": int(d["done"]),
+                "rnd": (int(version), tuple(int(x) for x in mt), None if gauss is None else float(gauss)),
+                "state": GenState.from_json(d["state"]),
+                "outputs": [str(p) for p in d["outputs"]],
+                "total_filled": int(d["total_filled"]),
+                "rows_from_cache": int(d["rows_from_cache"]),
+                "index": None if index is None else (
+                    {str(k): str(v) for k, v in index["new"].items()}, int(index["kept"]),
+                ),
+            }
+            random.Random().setstate(restored["rnd"])  # rejects a malformed state here, not mid-run
+        except Exception:
+            return None
+        # outputs deleted or moved since: start over
+        if not all(Path(p).exists() for p in restored["outputs"]):
+            return None
+        return restored
+
+    def save(
+        self,
+        done: int,
+        ctx: RunContext,
+        outputs: List[str],
+        total_filled: int,
+        rows_from_cache: int,
+        index: Optional[_FillIndex],
+    ) -> None:
+        version, mt, gauss = ctx.rnd.getstate()
+        d = {
+            "version": self.VERSION,
+            "key": self.key,
+            "done": done,
+            "rnd": [version, list(mt), gauss],
+            "state": ctx.state.to_json(),
+            "outputs": list(outputs),
+            "total_filled": total_filled,
+            "rows_from_cache": rows_from_cache,
+            "index": {"new": index.new, "kept": index.kept} if index is not None else None,
+        }
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(d, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def fill_wb_template(params: FillParams, ctx: Optional[RunContext] = None) -> Tuple[List[str], int, str]:
     """
     Returns:
       (output_paths, rows_filled_total, report_json_str)
     """
-    rnd_master = random.Random()
-    rnd_master.seed(time.time_ns() ^ (hash(params.xlsx_path) & 0xFFFFFFFF))
+    if ctx is None:
+        ctx = RunContext()
 
     in_path = Path(params.xlsx_path)
     out_dir = Path(params.output_dir)
@@ -502,97 +2634,184 @@ def fill_wb_template(params: FillParams) -> Tuple[List[str], int, str]:
     total_filled = 0
     outputs: List[str] = []
 
-    # track anti-duplicates across the whole batch
-    used_first_phrases: Set[str] = set()
-    used_titles: Set[str] = set()
-    used_descs: List[str] = []
-
     # for progress
     total_steps = max(1, params.batch_count)
     done_steps = 0
 
-    for i in range(1, params.batch_count + 1):
-        wb = load_workbook(in_path)
-        ws = wb.active
-
-        header_row = _detect_header_row(ws)
-        name_col = _find_col_by_header(ws, header_row, ["Наименование", "Название", "Заголовок", "Наим-е"])
-        desc_col = _find_col_by_header(ws, header_row, ["Описание", "Description", "Опис-е"])
-
-        if not name_col or not desc_col:
-            raise ValueError("Не найдены колонки Наименование и/или Описание (проверь заголовки в файле).")
-
-        # rows start after header row
-        start_row = header_row + 1
-
-        # don't touch first N rows (absolute rows in sheet)
-        skip_until = max(0, int(params.skip_first_rows))
-        # eligible rows: >= start_row and > skip_until
-        eligible_rows = [r for r in range(start_row, ws.max_row + 1) if r > skip_until]
+    # an archive is only valid once closed, so archived runs restart instead
+    ckpt = None
+    resumed = None
+    if params.batch_count > 1 and not params.archive:
+        ckpt = _Checkpoint(out_dir / f"{_safe_filename(in_path.stem)}.checkpoint", params)
+        resumed = ckpt.load()
+    if resumed:
+        done_steps = resumed["done"]
+        ctx.rnd.setstate(resumed["rnd"])
+        ctx.state = resumed["state"]
+        outputs = resumed["outputs"]
+        total_filled = resumed["total_filled"]
 
-        # fill only first N eligible rows
-        rows_to_fill = max(0, int(params.rows_to_fill))
-        eligible_rows = eligible_rows[:rows_to_fill]
-
-        # If sheet is shorter, still fine
-        rows_filled = 0
+    # track anti-duplicates across the whole batch
+    state = ctx.state
+
+    fmt = (params.output_format or "xlsx").lower().strip()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Неизвестный формат вывода: {params.output_format}")
+    ext = OUTPUT_FORMATS[fmt]
+    fill = _fill_streaming if params.low_memory else _fill_workbook
+
+    # reproducible runs reuse previously generated rows (not in low_memory:
+    # the cache holds one file's rows in memory; not in incremental runs:
+    # the key does not cover which rows are kept and reserve their titles)
+    cache = _GenCache(gen_cache_dir()) if params.seed and not params.low_memory and not params.incremental else None
+    if cache:
+        state.bank = load_phrase_bank()  # creates the bank file before keys are stamped
+    rows_from_cache = resumed["rows_from_cache"] if resumed else 0
+
+    index = None
+    if params.incremental:
+        index = _FillIndex(out_dir / FILL_INDEX_NAME, params)
+        if resumed and resumed["index"]:
+            index.new, index.kept = resumed["index"]
+
+    started = time.perf_counter()
+    gen_before = state.counters()
+    regen_before = state.rows_revalidated
+    stage = {"generate": 0.0, "io": 0.0}
+    log_event(
+        "fill_start", run_id=ctx.run_id, input=str(in_path), batch_count=int(params.batch_count),
+        output_format=fmt, archive=params.archive, low_memory=params.low_memory,
+        incremental=params.incremental, seed=int(params.seed), resumed_after=done_steps,
+    )
 
-        # per-file random seed
-        rnd = random.Random()
-        rnd.seed((time.time_ns() & 0xFFFFFFFFFFFF) ^ (i * 99991) ^ (hash(params.brand_lat) & 0xFFFFFFFF))
-
-        for r in eligible_rows:
-            title = _make_title(
-                rnd=rnd,
-                brand_lat=params.brand_lat,
-                brand_ru=params.brand_ru,
-                shape=params.shape,
-                lenses=params.lenses,
-                collection=params.collection,
-                ratio=params.brand_in_title_ratio,
-                used_titles=used_titles,
+    arc = _open_archive(params)
+    try:
+        for i in range(done_steps + 1, params.batch_count + 1):
+            ctx.check_cancelled()
+
+            seed = _file_seed(params, ctx, i)
+            cache_key = _GenCache.key(params, params.seed, i, state) if cache else ""
+            feed = _TextFeed(
+                params, seed, ctx, cached=cache.get(cache_key) if cache else None, record=bool(cache),
+                span=(done_steps * 100 / total_steps, (done_steps + 1) * 100 / total_steps),
+                expected=_row_quota(params),
             )
 
-            desc = _make_description(
-                rnd=rnd,
-                brand_lat=params.brand_lat,   # description uses LATIN brand
-                shape=params.shape,
-                lenses=params.lenses,
-                collection=params.collection,
-                holidays=params.holidays,
-                holiday_pos=params.holiday_pos,
-                seo_level=params.seo_level,
-                style=params.style,
-                wb_safe=params.wb_safe_mode,
-                wb_strict=params.wb_strict,
-                used_first_phrases=used_first_phrases,
-                used_descs=used_descs,
-                uniqueness=params.uniqueness,
+            out_path = _out_path(params, i, ext)
+            parts = _Parts(out_path, params.max_rows_per_file, arc)
+            t_file = time.perf_counter()
+
+            try:
+                if fmt == "xlsx":
+                    rows_filled = fill(params, in_path, parts, feed, index=index)
+                else:
+                    rows_filled = _fill_sink(params, in_path, parts, feed, index=index, seed=seed)
+            finally:
+                parts.close()
+
+            rows_from_cache += feed.from_cache
+            if cache and feed.generated:
+                cache.put(cache_key, feed.record)
+            total_filled += rows_filled
+            outputs.extend(parts.names)
+
+            secs = time.perf_counter() - t_file
+            stage["generate"] += feed.gen_seconds
+            stage["io"] += secs - feed.gen_seconds   # template read, fill, save
+            log_event(
+                "file_done", run_id=ctx.run_id, file=out_path.name, rows=rows_filled,
+                rows_from_cache=feed.from_cache, seconds=round(secs, 3),
+                generate_s=round(feed.gen_seconds, 3), io_s=round(secs - feed.gen_seconds, 3),
             )
 
-            # overwrite always
-            ws.cell(row=r, column=name_col).value = title
-            ws.cell(row=r, column=desc_col).value = desc
+            done_steps += 1
+            if ckpt and done_steps < params.batch_count:
+                try:
+                    ckpt.save(done_steps, ctx, outputs, total_filled, rows_from_cache, index)
+                except Exception as e:
+                    # a run without a resume point is still a good run
+                    log_event("checkpoint_failed", logging.WARNING, run_id=ctx.run_id, error=str(e))
+            ctx.report_progress(done_steps * 100 / total_steps)
+
+        if index is not None:
+            index.save()
+        if ckpt:
+            ckpt.clear()
+
+        report = _fill_report(params, ctx, outputs, total_filled, rows_from_cache, index)
+        if arc:
+            arc.write_text("report.json", report)
+            arc.close()
+    except BaseException as e:
+        if arc:
+            arc.abort()
+        secs = time.perf_counter() - started
+        if isinstance(e, FillCancelled):
+            METRICS.inc("fills_total", status="cancelled")
+            log_event("fill_cancelled", run_id=ctx.run_id, seconds=round(secs, 3), rows=total_filled)
+        else:
+            METRICS.inc("fills_total", status="failed")
+            log_event("fill_failed", logging.ERROR, exc_info=True, run_id=ctx.run_id,
+                      seconds=round(secs, 3), rows=total_filled, error=str(e))
+        raise
+
+    secs = time.perf_counter() - started
+    gen = state.counters()
+    retries = gen["title_retries"] - gen_before["title_retries"]
+    rewrites = gen["desc_rewrites"] - gen_before["desc_rewrites"]
+    missed = gen["desc_sim_limit_missed"] - gen_before["desc_sim_limit_missed"]
+    regenerated = state.rows_revalidated - regen_before
+    rate = total_filled / secs if secs > 0 else 0.0
+    METRICS.inc("fills_total", status="done")
+    METRICS.inc("files_total", len(outputs))
+    METRICS.inc("rows_total", total_filled)
+    METRICS.inc("rows_from_cache_total", rows_from_cache)
+    for k, v in stage.items():
+        METRICS.inc("stage_seconds_total", v, stage=k)
+    METRICS.inc("title_retries_total", retries)
+    METRICS.inc("desc_rewrites_total", rewrites)
+    METRICS.inc("validation_violations_total", regenerated)
+    METRICS.set("last_rows_per_second", rate)
+    log_event(
+        "fill_end", run_id=ctx.run_id, files=len(outputs), rows=total_filled, seconds=round(secs, 3),
+        rows_per_s=round(rate, 1), stages={k: round(v, 3) for k, v in stage.items()},
+        cache_hit_rate=round(rows_from_cache / total_filled, 4) if total_filled else 0.0,
+        title_retries=retries, desc_rewrites=rewrites, desc_sim_limit_missed=missed,
+        rows_revalidated=regenerated,
+    )
 
-            rows_filled += 1
+    if arc:
+        return [str(arc.path)], total_filled, report
+    return outputs, total_filled, report
 
-        total_filled += rows_filled
 
-        base = _safe_filename(in_path.stem)
-        out_name = f"{base}_{i:02d}.xlsx" if params.batch_count > 1 else f"{base}_out.xlsx"
-        out_path = out_dir / out_name
-        wb.save(out_path)
-        outputs.append(str(out_path))
+def _file_seed(params: FillParams, ctx: RunContext, i: int) -> int:
+    # per-file random seed
+    if params.seed:
+        return _fp64(f"{params.seed}:{i}") & 0xFFFFFFFFFFFF
+    return ctx.rnd.getrandbits(48)
 
-        done_steps += 1
-        if params.progress_callback:
-            params.progress_callback(int(done_steps * 100 / total_steps))
 
+def _out_path(params: FillParams, i: int, ext: str) -> Path:
+    base = _safe_filename(Path(params.xlsx_path).stem)
+    out_name = f"{base}_{i:02d}{ext}" if params.batch_count > 1 else f"{base}_out{ext}"
+    return Path(params.output_dir) / out_name
+
+
+def _fill_report(
+    params: FillParams,
+    ctx: RunContext,
+    outputs: List[str],
+    total_filled: int,
+    rows_from_cache: int = 0,
+    index: Optional[_FillIndex] = None,
+) -> str:
+    state = ctx.state
     report = {
-        "input": str(in_path),
+        "input": str(Path(params.xlsx_path)),
         "outputs": outputs,
         "rows_total_filled": total_filled,
-        "rows_per_file": int(params.rows_to_fill),
+        "rows_per_file": int(params.rows_to_fill) if _row_quota(params) else "auto",
         "batch_count": int(params.batch_count),
         "brand_title_ru": params.brand_ru,
         "brand_desc_lat": params.brand_lat,
@@ -604,5 +2823,492 @@ def fill_wb_template(params: FillParams) -> Tuple[List[str], int, str]:
         "seo_level": params.seo_level,
         "wb_safe_mode": params.wb_safe_mode,
         "wb_strict": params.wb_strict,
+        "category": params.category,
+        "low_memory": params.low_memory,
+        "incremental": params.incremental,
+        "output_format": (params.output_format or "xlsx").lower().strip(),
+        "archive": (params.archive or "").lower().strip(),
+        "max_rows_per_file": int(params.max_rows_per_file),
+        "seed": int(params.seed),
+        "rows_from_cache": rows_from_cache,
+        "rows_total_kept": index.kept if index is not None else 0,
+        "title_limit": title_limit_for(params.category, state.bank),
+        "seo_keywords": state.keywords.coverage() if state.keywords and state.keywords.phrases else {},
+        "generation": state.counters(),
+        "validation": state.validation(),
+    }
+    return json.dumps(report, ensure_ascii=False, indent=2)
+
+
+# ----------------------------
+# Async pipeline
+# ----------------------------
+ASYNC_MAX_READS = 4      # template files read at once
+ASYNC_MAX_WRITES = 2     # output workbooks being saved at once (each holds a full workbook)
+
+
+def _take_rows(params: FillParams, seed: int, k: int, state: GenState) -> Tuple[List[str], List[str], GenState]:
+    """Generation stage of one output file; module-level so it also runs in a ProcessPoolExecutor."""
+    titles, descs = _TextFeed(params, seed, RunContext(state=state)).take(k)
+    return titles, descs, state
+
+
+def _parse_template(params: FillParams, data: bytes) -> Tuple[Workbook, List[int], int, int]:
+    # -> (workbook, eligible rows, name column, description column)
+    wb = load_workbook(BytesIO(data))
+    ws = wb.active
+    header_row, name_col, desc_col, id_cols = _locate_columns(ws)
+    rows = [r for r, _, fill_it in _row_plan(params, ws, header_row, name_col, desc_col, id_cols, tail=False) if fill_it]
+    return wb, rows, name_col, desc_col
+
+
+def _save_filled(parsed: Tuple[Workbook, List[int], int, int], titles: List[str], descs: List[str], out_path: Path) -> None:
+    wb, rows, name_col, desc_col = parsed
+    ws = wb.active
+    for r, title, desc in zip(rows, titles, descs):
+        # overwrite always
+        ws.cell(row=r, column=name_col).value = title
+        ws.cell(row=r, column=desc_col).value = desc
+    wb.save(out_path)
+
+
+async def fill_wb_template_async(
+    params: FillParams,
+    ctx: Optional[RunContext] = None,
+    executor: Optional[Executor] = None,
+    reads: Optional[asyncio.Semaphore] = None,
+    writes: Optional[asyncio.Semaphore] = None,
+) -> Tuple[List[str], int, str]:
+    """
+    Async fill_wb_template for xlsx: file i+1 is parsed while file i is generated and saved;
+    other runs go to fill_wb_template in a thread.
+    """
+    if ctx is None:
+        ctx = RunContext()
+    loop = asyncio.get_running_loop()
+    fmt = (params.output_format or "xlsx").lower().strip()
+    if params.low_memory or params.incremental or params.archive or params.max_rows_per_file or fmt != "xlsx":
+        return await loop.run_in_executor(None, fill_wb_template, params, ctx)
+
+    reads = reads or asyncio.Semaphore(ASYNC_MAX_READS)
+    writes = writes or asyncio.Semaphore(ASYNC_MAX_WRITES)
+    Path(params.output_dir).mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    log_event("fill_start", run_id=ctx.run_id, input=params.xlsx_path, batch_count=int(params.batch_count),
+              output_format=fmt, pipeline="async", seed=int(params.seed))
+
+    async with reads:
+        data = await loop.run_in_executor(None, Path(params.xlsx_path).read_bytes)
+
+    pending: List[asyncio.Task] = []
+    outputs: List[str] = []
+    total_filled = 0
+    done = 0
+
+    def parse() -> asyncio.Future:
+        return loop.run_in_executor(None, _parse_template, params, data)
+
+    async def save(parsed, titles: List[str], descs: List[str], out_path: Path) -> None:
+        nonlocal done
+        await loop.run_in_executor(None, _save_filled, parsed, titles, descs, out_path)
+        done += 1
+        ctx.report_progress(done * 100 / max(1, params.batch_count))
+
+    next_parse = parse()
+    try:
+        for i in range(1, params.batch_count + 1):
+            ctx.check_cancelled()
+            seed = _file_seed(params, ctx, i)
+            parsed = await next_parse
+            next_parse = parse() if i < params.batch_count else None
+            titles, descs, ctx.state = await loop.run_in_executor(
+                executor, _take_rows, params, seed, len(parsed[1]), ctx.state
+            )
+
+            await writes.acquire()   # bounds the number of filled workbooks held in memory
+            out_path = _out_path(params, i, ".xlsx")
+            task = asyncio.create_task(save(parsed, titles, descs, out_path))
+            # released however the task ends, also when cancelled before it starts
+            task.add_done_callback(lambda _: writes.release())
+            pending.append(task)
+            outputs.append(str(out_path))
+            total_filled += len(titles)
+        await asyncio.gather(*pending)
+    except BaseException as e:
+        for t in pending:
+            t.cancel()
+        if next_parse is not None:
+            next_parse.cancel()
+        # lets the cancelled saves finish so their write slots are back before we return
+        await asyncio.gather(*pending, return_exceptions=True)
+        status = "cancelled" if isinstance(e, (FillCancelled, asyncio.CancelledError)) else "failed"
+        METRICS.inc("fills_total", status=status)
+        log_event(f"fill_{status}", logging.ERROR if status == "failed" else logging.INFO,
+                  exc_info=status == "failed", run_id=ctx.run_id, rows=total_filled)
+        raise
+
+    secs = time.perf_counter() - started
+    METRICS.inc("fills_total", status="done")
+    METRICS.inc("files_total", len(outputs))
+    METRICS.inc("rows_total", total_filled)
+    METRICS.set("last_rows_per_second", total_filled / secs if secs > 0 else 0.0)
+    log_event("fill_end", run_id=ctx.run_id, files=len(outputs), rows=total_filled, seconds=round(secs, 3),
+              rows_per_s=round(total_filled / secs, 1) if secs > 0 else 0.0, pipeline="async")
+    return outputs, total_filled, _fill_report(params, ctx, outputs, total_filled)
+
+
+async def fill_many_async(
+    jobs: Sequence[FillParams],
+    executor: Optional[Executor] = None,
+    max_reads: int = ASYNC_MAX_READS,
+    max_writes: int = ASYNC_MAX_WRITES,
+    ctx_factory: Callable[[], RunContext] = RunContext,
+) -> List[Tuple[List[str], int, str]]:
+    """
+    Runs several templates concurrently; read/write limits are shared by all
+    of them. If one job fails or is cancelled, the others are cancelled too.
+    """
+    reads = asyncio.Semaphore(max(1, max_reads))
+    writes = asyncio.Semaphore(max(1, max_writes))
+    tasks = [asyncio.create_task(fill_wb_template_async(p, ctx_factory(), executor, reads, writes)) for p in jobs]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def fill_many(jobs: Sequence[FillParams], **kw) -> List[Tuple[List[str], int, str]]:
+    """Synchronous wrapper around fill_many_async."""
+    return asyncio.run(fill_many_async(jobs, **kw))
+
+
+# ----------------------------
+# Similarity audit
+# ----------------------------
+AUDIT_THRESHOLD = 0.7    # estimated Jaccard over shingles
+AUDIT_BINS = 64          # MinHash signature width (one-permutation hashing)
+AUDIT_BANDS = 10         # LSH bands of AUDIT_BINS // AUDIT_BANDS bins each
+AUDIT_TITLE_SLACK = 0.15 # titles: looser bin check, then exact Jaccard
+AUDIT_TOP = 50           # clusters listed in the JSON report (the CSV has all rows)
+AUDIT_BUCKET_REPS = 16   # entries per LSH bucket that others are scored against
+# description shingles found in more than AUDIT_COMMON of the first
+# AUDIT_SAMPLE rows (and in over AUDIT_COMMON_MIN rows) are template text
+AUDIT_SAMPLE = 2000
+AUDIT_COMMON = 0.2
+AUDIT_COMMON_MIN = 20
+# ASCII punctuation splits words; UTF-8 bytes of Cyrillic letters pass through
+_AUDIT_PUNCT = bytes(c if chr(c).isalnum() else 32 for c in range(128)) + bytes(range(128, 256))
+_AUDIT_SHIFT = AUDIT_BINS.bit_length() - 1    # low bits pick the bin, the next 8 are kept
+_MASK64 = (1 << 64) - 1
+# empty bin -> bins to borrow from, in a fixed random order per bin, and its salt
+_AUDIT_PROBES = tuple(tuple(random.Random(b).sample(range(AUDIT_BINS), AUDIT_BINS)) for b in range(AUDIT_BINS))
+_AUDIT_SALTS = tuple(random.Random(-1 - b).getrandbits(64) for b in range(AUDIT_BINS))
+
+
+class _WordIds(dict):
+    # word -> 64-bit id: str hashes are salted per process, int tuples are
+    # not, so shingles (and the report) are the same on every run. crc32
+    # fills only 32 bits; the odd multiplier spreads it over all 64.
+    def __missing__(self, w: bytes) -> int:
+        v = self[w] = (zlib.crc32(w) * 0x9E3779B97F4A7C15) & _MASK64
+        return v
+
+
+_AUDIT_WORDS = _WordIds()
+
+
+def _shingles(text: str, titles: bool) -> List[int]:
+    # titles are short: words + word pairs; descriptions: word triples
+    w = list(map(_AUDIT_WORDS.__getitem__, (text or "").lower().encode().translate(_AUDIT_PUNCT).split()))
+    if titles:
+        return w + list(map(hash, zip(w, w[1:])))
+    return list(map(hash, zip(w, w[1:], w[2:])))
+
+
+def _minhash(sh: List[int]) -> Optional[bytes]:
+    """One-permutation MinHash over AUDIT_BINS bins; empty bins borrow along _AUDIT_PROBES."""
+    if not sh:
+        return None
+    s = sorted(sh, reverse=True)
+    low = dict(zip(map((AUDIT_BINS - 1).__and__, s), s))
+    sig = list(map(low.get, range(AUDIT_BINS)))
+    if len(low) < AUDIT_BINS:
+        for b, v in enumerate(sig):
+            if v is None:
+                for j in _AUDIT_PROBES[b]:
+                    if j in low:
+                        sig[b] = low[j] ^ _AUDIT_SALTS[b]
+                        break
+    return bytes((v >> _AUDIT_SHIFT) & 0xFF for v in sig)
+
+
+def _iter_output_rows(path: Path) -> Iterator[Tuple[int, str, str, str]]:
+    """Streams (row, article, title, description) from a generated file."""
+    ext = path.suffix.lower()
+    if ext == ".xlsx":
+        wb = load_workbook(path, read_only=True)
+        try:
+            ws = wb.active
+            header_row, name_col, desc_col, id_cols = _locate_columns(ws)
+            r = header_row
+            for row in ws.iter_rows(min_row=header_row + 1, values_only=True):
+                r += 1
+                title = row[name_col - 1] if name_col <= len(row) else None
+                desc = row[desc_col - 1] if desc_col <= len(row) else None
+                if not title and not desc:
+                    continue
+                article = next((str(row[c - 1]).strip() for c in id_cols if c <= len(row) and row[c - 1] is not None), "")
+                yield r, article, str(title or ""), str(desc or "")
+        finally:
+            wb.close()
+    elif ext == ".csv":
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for rec in csv.DictReader(f, delimiter=";"):
+                yield int(rec.get("row") or 0), rec.get("article") or "", rec.get("title") or "", rec.get("description") or ""
+    elif ext == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    yield int(rec.get("row") or 0), str(rec.get("article") or ""), rec.get("title") or "", rec.get("description") or ""
+    else:
+        raise ValueError(f"Аудит не поддерживает формат файла: {path.name}")
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = array("I", range(n))
+
+    def find(self, x: int) -> int:
+        p = self.parent
+        while p[x] != x:
+            p[x] = p[p[x]]
+            x = p[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class _SimIndex:
+    """MinHash signatures of one text kind; titles also keep their shingle sets."""
+
+    def __init__(self, titles: bool):
+        self.titles = titles
+        self.sigs: List[bytes] = []
+        self.rows: List[List[int]] = []    # global row ids per entry
+        self.sets: List[FrozenSet[int]] = []
+        self._entries: Dict[Union[str, bytes], int] = {}
+        # descriptions: rows held back until the template shingles are known
+        self.sample: Optional[List[Tuple[int, List[int]]]] = None if titles else []
+        self.common: FrozenSet[int] = frozenset()
+
+    def add(self, rid: int, text: str) -> None:
+        if self.sample is None:
+            self._add(rid, text, None)
+            return
+        self.sample.append((rid, _shingles(text, False)))
+        if len(self.sample) >= AUDIT_SAMPLE:
+            self._flush()
+
+    def _flush(self) -> None:
+        sample, self.sample = self.sample or [], None
+        df = Counter(x for _, sh in sample for x in set(sh))
+        floor = max(AUDIT_COMMON * len(sample), AUDIT_COMMON_MIN)
+        self.common = frozenset(x for x, k in df.items() if k > floor)
+        for rid, sh in sample:
+            self._add(rid, "", sh)
+
+    def _add(self, rid: int, text: str, sh: Optional[List[int]]) -> None:
+        e = self._entries.get(text) if self.titles else None
+        if e is None:
+            if sh is None:
+                sh = _shingles(text, self.titles)
+            if self.common:
+                # a row made of template text only is compared on all of it
+                sh = [x for x in sh if x not in self.common] or sh
+            sig = _minhash(sh)
+            if sig is None:
+                return
+            e = self._entries.setdefault(text if self.titles else sig, len(self.sigs))
+            if e == len(self.sigs):
+                self.sigs.append(sig)
+                self.rows.append([])
+                if self.titles:
+                    self.sets.append(frozenset(sh))
+        self.rows[e].append(rid)
+
+    def clusters(
+        self,
+        threshold: float,
+        ctx: RunContext,
+        pct0: float,
+        pct1: float,
+    ) -> Tuple[Dict[int, List[int]], Dict[int, float]]:
+        """
+        LSH banding, at most AUDIT_BUCKET_REPS comparisons per entry.
+        Returns root -> row ids (clusters of 2+) and row id -> best similarity.
+        """
+        if self.sample is not None:
+            self._flush()
+        n = len(self.sigs)
+        uf = _UnionFind(n)
+        best: Dict[int, float] = {}
+        # byte values match by chance 1 time in 256: J = 1 - diff * 256 / (255 * bins)
+        scale = 256 / (255 * AUDIT_BINS)
+        loose = threshold - AUDIT_TITLE_SLACK if self.titles else threshold
+        limit = int((1.0 - loose) / scale + 1e-9)
+        sigs = self.sigs
+        width = AUDIT_BINS // AUDIT_BANDS
+
+        def score(a: int, b: int) -> Optional[float]:
+            diff = AUDIT_BINS - sum(map(int.__eq__, sigs[a], sigs[b]))
+            if diff > limit:
+                return None
+            if not self.titles:
+                return max(0.0, 1.0 - diff * scale)
+            # titles: few shingles, densified bins overstate similarity
+            sa, sb = self.sets[a], self.sets[b]
+            inter = len(sa & sb)
+            sim = inter / (len(sa) + len(sb) - inter)
+            return sim if sim >= threshold else None
+
+        for band in range(AUDIT_BANDS):
+            ctx.check_cancelled()
+            lo, hi = band * width, (band + 1) * width
+            # first entry per band key in one C-level pass; only the entries
+            # that repeat a key get a bucket list
+            seen: Dict[bytes, int] = {}
+            heads = list(map(seen.setdefault, [sig[lo:hi] for sig in sigs], range(n)))
+            del seen
+            buckets: Dict[int, List[int]] = {}
+            for e, h in enumerate(heads):
+                if h != e:
+                    buckets.setdefault(h, [h]).append(e)
+
+            for members in buckets.values():
+                reps: List[int] = []
+                for b in members:
+                    matched = False
+                    for a in reps:
+                        sim = score(a, b)
+                        if sim is None:
+                            continue
+                        matched = True
+                        uf.union(a, b)
+                        for x in (a, b):
+                            if sim > best.get(x, 0.0):
+                                best[x] = sim
+                    if not matched and len(reps) < AUDIT_BUCKET_REPS:
+                        reps.append(b)
+            del heads, buckets
+            ctx.report_progress(pct0 + (pct1 - pct0) * (band + 1) / AUDIT_BANDS)
+
+        groups: Dict[int, List[int]] = {}
+        sims: Dict[int, float] = {}
+        for e, rows in enumerate(self.rows):
+            sim = 1.0 if len(rows) > 1 else best.get(e)
+            if sim is None:
+                continue
+            groups.setdefault(uf.find(e), []).extend(rows)
+            for r in rows:
+                sims[r] = sim
+        return {r: sorted(m) for r, m in groups.items() if len(m) > 1}, sims
+
+
+def audit_outputs(
+    paths: Sequence[str],
+    threshold: float = AUDIT_THRESHOLD,
+    out_dir: Optional[str] = None,
+    ctx: Optional[RunContext] = None,
+) -> Tuple[List[str], int, str]:
+    """
+    Finds near-duplicate titles and descriptions across files; writes similarity_audit.json/.csv.
+    Returns (report_paths, rows_scanned, report_json_str).
+    """
+    if ctx is None:
+        ctx = RunContext()
+    files = [Path(p) for p in paths]
+    if not files:
+        raise ValueError("Не выбраны файлы для аудита.")
+
+    where: List[Tuple[int, int, str]] = []   # row id -> (file index, row, article)
+    titles: List[str] = []
+    t_index, d_index = _SimIndex(titles=True), _SimIndex(titles=False)
+
+    for fi, path in enumerate(files):
+        for r, article, title, desc in _iter_output_rows(path):
+            rid = len(where)
+            if rid % STREAM_CHUNK == 0:
+                ctx.check_cancelled()
+            where.append((fi, r, article))
+            titles.append(title)
+            t_index.add(rid, title)
+            d_index.add(rid, desc)
+        ctx.report_progress((fi + 1) * 60 / len(files))
+
+    t_groups, t_best = t_index.clusters(threshold, ctx, 60, 80)
+    d_groups, d_best = d_index.clusters(threshold, ctx, 80, 100)
+
+    def row_ref(rid: int, best: Dict[int, float]) -> Dict:
+        fi, r, article = where[rid]
+        return {"file": files[fi].name, "row": r, "article": article, "title": titles[rid],
+                "similarity": round(best.get(rid, 0.0), 2)}
+
+    def summary(groups: Dict[int, List[int]], best: Dict[int, float]) -> Dict:
+        top = sorted(groups.values(), key=len, reverse=True)[:AUDIT_TOP]
+        return {
+            "clusters": len(groups),
+            "rows_in_clusters": sum(len(m) for m in groups.values()),
+            "cross_file_clusters": sum(1 for m in groups.values() if len({where[x][0] for x in m}) > 1),
+            "largest": [{"size": len(m), "rows": [row_ref(x, best) for x in m[:20]]} for m in top],
+        }
+
+    dest = Path(out_dir) if out_dir else files[0].parent
+    dest.mkdir(parents=True, exist_ok=True)
+    json_path = dest / "similarity_audit.json"
+    csv_path = dest / "similarity_audit.csv"
+
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["kind", "cluster", "file", "row", "article", "similarity", "title"])
+        for kind, groups, best in (("title", t_groups, t_best), ("description", d_groups, d_best)):
+            for n, members in enumerate(sorted(groups.values(), key=len, reverse=True), start=1):
+                for x in members:
+                    ref = row_ref(x, best)
+                    w.writerow([kind, n, ref["file"], ref["row"], ref["article"], ref["similarity"], ref["title"]])
+
+    report = {
+        "files": [str(p) for p in files],
+        "rows_scanned": len(where),
+        "threshold": threshold,
+        "signature_bins": AUDIT_BINS,
+        "lsh_bands": AUDIT_BANDS,
+        "titles": summary(t_groups, t_best),
+        "descriptions": summary(d_groups, d_best),
+        "rows_csv": str(csv_path),
     }
-    return outputs, total_filled, json.dumps(report, ensure_ascii=False, indent=2)
+    rep = json.dumps(report, ensure_ascii=False, indent=2)
+    json_path.write_text(rep, encoding="utf-8")
+    return [str(json_path), str(csv_path)], len(where), rep
+
+
+if __name__ == "__main__":
+    # python wb_fill.py audit out/*.xlsx [--threshold 0.7]
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="wb_fill.py")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("audit", help="near-duplicate report for generated files")
+    a.add_argument("files", nargs="+")
+    a.add_argument("--threshold", type=float, default=AUDIT_THRESHOLD)
+    a.add_argument("--out-dir", default=None)
+    args = ap.parse_args()
+    outs, rows, _ = audit_outputs(args.files, args.threshold, args.out_dir)
+    print(f"rows: {rows}")
+    print("\n".join(outs))
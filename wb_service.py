@@ -0,0 +1,418 @@
+# wb_service.py
+from __future__ import annotations
+
+import sys
+import json
+import time
+import random
+import threading
+import argparse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from wb_fill import (
+    AUDIT_THRESHOLD, FillParams, GenState, KeywordSampler, METRICS, RunContext, STREAM_CHUNK,
+    audit_outputs, fill_wb_template, generate_batch, load_phrase_bank,
+)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_ROWS = 100_000       # per /generate request
+STREAM_MIN_ROWS = 1000   # larger batches are streamed as NDJSON unless "stream": false
+MAX_SESSIONS = 64        # least recently used sessions beyond this are dropped
+# Host header values answered besides the bound address: a web page can
+# reach a localhost port by DNS rebinding, but its requests then carry the
+# page's own host name
+LOCAL_HOSTS = frozenset({"localhost", "127.0.0.1", "[::1]"})
+
+
+# ----------------------------
+# Warm state
+# ----------------------------
+# generation defaults: everything a GUI run would fill in except the file paths
+BASE_PARAMS = FillParams(
+    xlsx_path="",
+    output_dir="",
+    brand_lat="",
+    brand_ru="",
+    shape="",
+    lenses="",
+    collection="",
+    holidays="",
+    holiday_pos="middle",
+    seo_level="normal",
+    style="neutral",
+    wb_safe_mode=True,
+    wb_strict=True,
+    brand_in_title_ratio="50/50",
+    rows_to_fill=0,
+    skip_first_rows=0,
+    batch_count=1,
+)
+# FillParams annotations are strings (postponed evaluation)
+_PARAM_TYPES = {f.name: f.type for f in fields(FillParams)}
+_TYPE_NAMES = {"str": "строка", "int": "целое число", "bool": "true/false"}
+
+
+def _param_value(name: str, v):
+    kind = _PARAM_TYPES[name]
+    if kind == "bool":
+        ok = isinstance(v, bool)
+    elif kind == "int":
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        ok = isinstance(v, int) and not isinstance(v, bool)
+    else:
+        ok = isinstance(v, str)
+    if not ok:
+        raise ValueError(f"Параметр {name}: ожидается {_TYPE_NAMES.get(kind, kind)}, получено {json.dumps(v, ensure_ascii=False)}")
+    return v
+
+
+def _int_arg(d: Dict, name: str, default: Optional[int] = None) -> Optional[int]:
+    v = d.get(name, default)
+    if v is None:
+        return None
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    if not isinstance(v, int) or isinstance(v, bool):
+        raise ValueError(f"Поле {name}: ожидается целое число, получено {json.dumps(v, ensure_ascii=False)}")
+    return v
+
+
+def params_from_json(d: Dict, base: FillParams = BASE_PARAMS) -> FillParams:
+    if not isinstance(d, dict):
+        raise ValueError("params: ожидается JSON-объект.")
+    unknown = sorted(set(d) - set(_PARAM_TYPES))
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {', '.join(unknown)}")
+    return replace(base, **{k: _param_value(k, v) for k, v in d.items()})
+
+
+@dataclass
+class _Session:
+    """Uniqueness state of one client; generate_batch mutates it, so calls are serialised."""
+    state: GenState
+    rnd: random.Random = field(default_factory=random.Random)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    requests: int = 0
+
+
+class GenService:
+    """Phrase bank, keyword sampler and per-session uniqueness state kept between requests."""
+
+    def __init__(self):
+        self.bank = load_phrase_bank()
+        self.sessions: Dict[str, _Session] = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.rows = 0
+        self.session("default")
+
+    def session(self, name: str) -> _Session:
+        with self.lock:
+            # dict order doubles as recency: a used session moves to the end
+            s = self.sessions.pop(name, None)
+            if s is None:
+                s = _Session(GenState(keywords=KeywordSampler.load(), bank=self.bank))
+                while len(self.sessions) >= MAX_SESSIONS:
+                    self.sessions.pop(next(iter(self.sessions)))
+            self.sessions[name] = s
+            return s
+
+    def reset(self, name: str) -> None:
+        with self.lock:
+            self.sessions.pop(name, None)
+
+    def _refresh(self, state: GenState) -> None:
+        bank = load_phrase_bank()
+        if bank is not self.bank:
+            self.bank = bank
+        state.bank = bank
+        if state.keywords is not None and state.keywords.stale():
+            # usage counters survive when the keyword list keeps its length
+            state.keywords = KeywordSampler.load(usage=state.keywords)
+
+    def generate(self, params: FillParams, count: int, session: str = "default", seed: Optional[int] = None) -> Tuple[List[str], List[str]]:
+        s = self.session(session)
+        with s.lock:
+            self._refresh(s.state)
+            rnd = random.Random(seed) if seed is not None else s.rnd
+            titles, descs = generate_batch(params, count, rnd=rnd, state=s.state)
+            s.requests += 1
+        with self.lock:
+            self.rows += len(titles)
+        METRICS.inc("service_rows_total", len(titles))
+        return titles, descs
+
+    def stats(self) -> Dict:
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "rows_generated": self.rows,
+            "sessions": {
+                k: {"requests": s.requests, **s.state.counters(), "validation": s.state.validation()}
+                for k, s in list(self.sessions.items())
+            },
+        }
+
+
+# ----------------------------
+# HTTP
+# ----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive + chunked streaming
+    service: GenService = None      # set by make_server
+    quiet = True
+
+    def log_message(self, fmt, *args):
+        if not self.quiet:
+            super().log_message(fmt, *args)
+
+    # ---------- responses ----------
+    def _send_json(self, code: int, obj) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _local_host(self) -> bool:
+        """DNS-rebinding guard: the Host header must name this machine."""
+        host = (self.headers.get("Host") or "").strip().lower()
+        host = host[: host.index("]") + 1] if host.startswith("[") and "]" in host else host.split(":")[0]
+        return host in LOCAL_HOSTS or host == self.server.server_address[0]
+
+    def _read_json(self) -> Dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        if not n:
+            return {}
+        d = json.loads(self.rfile.read(n).decode("utf-8"))
+        if not isinstance(d, dict):
+            raise ValueError("Ожидается JSON-объект.")
+        return d
+
+    # ---------- routes ----------
+    def do_GET(self):
+        if not self._local_host():
+            self._send_json(403, {"error": "Сервис принимает запросы только с этого компьютера."})
+        elif self.path == "/health":
+            self._send_json(200, {"ok": True})
+        elif self.path == "/stats":
+            self._send_json(200, self.service.stats())
+        elif self.path == "/metrics":
+            # Prometheus scrape endpoint
+            body = METRICS.text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"Нет такого адреса: {self.path}"})
+
+    def do_POST(self):
+        # a cross-origin page can only send "simple" requests (text/plain,
+        # form data) without a preflight; JSON bodies need one, so they are required
+        if not self._local_host():
+            self._send_json(403, {"error": "Сервис принимает запросы только с этого компьютера."})
+            self.close_connection = True
+            return
+        ctype = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if ctype != "application/json":
+            self._send_json(415, {"error": "Ожидается Content-Type: application/json."})
+            self.close_connection = True
+            return
+        try:
+            d = self._read_json()
+            if self.path == "/generate":
+                self._generate(d)
+            elif self.path == "/fill":
+                outs, total, rep = fill_wb_template(params_from_json(d.get("params") or {}), RunContext())
+                self._send_json(200, {"outputs": outs, "rows": total, "report": json.loads(rep)})
+            elif self.path == "/audit":
+                outs, total, rep = self._audit(d)
+                self._send_json(200, {"outputs": outs, "rows": total, "report": json.loads(rep)})
+            elif self.path == "/reset":
+                self.service.reset(str(d.get("session") or "default"))
+                self._send_json(200, {"ok": True})
+            else:
+                self._send_json(404, {"error": f"Нет такого адреса: {self.path}"})
+        except (ValueError, TypeError, KeyError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def _audit(self, d: Dict) -> Tuple[List[str], int, str]:
+        """{"files": ["...xlsx|csv|jsonl", ...], "threshold": AUDIT_THRESHOLD}"""
+        files = d.get("files")
+        if not isinstance(files, list) or not files or not all(isinstance(f, str) for f in files):
+            raise ValueError("Поле files: ожидается непустой список путей к файлам.")
+        threshold = d.get("threshold", AUDIT_THRESHOLD)
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+            raise ValueError(f"Поле threshold: ожидается число от 0 до 1, получено {json.dumps(threshold, ensure_ascii=False)}")
+        return audit_outputs(files, float(threshold))
+
+    def _generate(self, d: Dict) -> None:
+        """
+        {"params", "count", "session", "seed", "stream"} -> {"title", "description"}, {"titles",
+        "descriptions"} or NDJSON lines; a stream that fails midway ends with an {"error"} line.
+        """
+        params = params_from_json(d.get("params") or {})
+        count = _int_arg(d, "count", 1)
+        if not 1 <= count <= MAX_ROWS:
+            raise ValueError(f"count должен быть от 1 до {MAX_ROWS}")
+        session = str(d.get("session") or "default")
+        seed = _int_arg(d, "seed")
+        stream = d.get("stream")
+        if stream is None:
+            stream = count >= STREAM_MIN_ROWS
+
+        if not stream:
+            titles, descs = self.service.generate(params, count, session, seed)
+            if count == 1:
+                self._send_json(200, {"title": titles[0], "description": descs[0]})
+            else:
+                self._send_json(200, {"titles": titles, "descriptions": descs})
+            return
+
+        # rows go out chunk by chunk; a seeded stream derives each chunk's seed from it
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        seeds = random.Random(seed) if seed is not None else None
+        left = count
+        try:
+            while left > 0:
+                k = min(STREAM_CHUNK, left)
+                titles, descs = self.service.generate(params, k, session, seeds.getrandbits(48) if seeds else None)
+                lines = "".join(
+                    json.dumps({"title": t, "description": x}, ensure_ascii=False) + "\n" for t, x in zip(titles, descs)
+                )
+                self._chunk(lines.encode("utf-8"))
+                left -= k
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        except Exception as e:
+            # status line is gone: report in-band as the last NDJSON line and drop the connection
+            self._chunk((json.dumps({"error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.close_connection = True
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, service: Optional[GenService] = None) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"service": service or GenService()})
+    srv = ThreadingHTTPServer((host, port), handler)
+    srv.daemon_threads = True
+    return srv
+
+
+# ----------------------------
+# Benchmark
+# ----------------------------
+def _post(url: str, payload: Dict, timeout: float = 60.0) -> bytes:
+    req = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        return r.read()
+
+
+def _percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[i]
+
+
+def run_benchmark(
+    url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+    requests: int = 500,
+    concurrency: int = 8,
+    count: int = 1,
+    params: Optional[Dict] = None,
+) -> Dict:
+    """Fires `requests` POST /generate calls from `concurrency` threads; latencies in ms."""
+    payload = {"params": params or {"brand_lat": "Dior", "brand_ru": "Диор", "shape": "Кошачий глаз"},
+               "count": count, "session": "bench", "stream": False}
+    endpoint = url.rstrip("/") + "/generate"
+    _post(endpoint, payload)  # warm-up
+
+    def one(_):
+        t0 = time.perf_counter()
+        _post(endpoint, payload)
+        return (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        lat = sorted(ex.map(one, range(requests)))
+    secs = time.perf_counter() - t0
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rows_per_request": count,
+        "seconds": round(secs, 3),
+        "requests_per_s": round(requests / secs, 1) if secs else 0.0,
+        "rows_per_s": round(requests * count / secs, 1) if secs else 0.0,
+        "p50_ms": round(_percentile(lat, 50), 2),
+        "p99_ms": round(_percentile(lat, 99), 2),
+        "max_ms": round(lat[-1], 2) if lat else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # python wb_service.py serve [--port 8765]
+    # python wb_service.py bench [--url ...] [--requests 500] [--concurrency 8] [--count 1] [--local]
+    ap = argparse.ArgumentParser(prog="wb_service.py")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="run the local generation service")
+    s.add_argument("--host", default=DEFAULT_HOST)
+    s.add_argument("--port", type=int, default=DEFAULT_PORT)
+    s.add_argument("--verbose", action="store_true")
+    b = sub.add_parser("bench", help="throughput / latency against a running service")
+    b.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}")
+    b.add_argument("--requests", type=int, default=500)
+    b.add_argument("--concurrency", type=int, default=8)
+    b.add_argument("--count", type=int, default=1)
+    b.add_argument("--local", action="store_true", help="start a service on a free port for the run")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        srv = make_server(args.host, args.port)
+        srv.RequestHandlerClass.quiet = not args.verbose
+        print(f"wb_service: http://{args.host}:{srv.server_address[1]}")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server_close()
+        return 0
+
+    srv = None
+    url = args.url
+    if args.local:
+        srv = make_server(DEFAULT_HOST, 0)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        url = f"http://{DEFAULT_HOST}:{srv.server_address[1]}"
+    try:
+        res = run_benchmark(url, args.requests, args.concurrency, args.count)
+    finally:
+        if srv is not None:
+            srv.shutdown()
+            srv.server_close()
+    print(json.dumps(res, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())